@@ -1,18 +1,1143 @@
+import heapq
+import hmac
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
 import sqlite3
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+import struct
+import threading
+import time
+import traceback
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from queue import LifoQueue, Empty
+from urllib.parse import quote
+from flask import Flask, request, jsonify, render_template, redirect, url_for, g
 from flask_login import UserMixin, LoginManager, login_user, logout_user, login_required, current_user 
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt 
+from sqlalchemy import event
+import passwords
+import storage
+from storage import campus_now, campus_timestamp
 
 app = Flask(__name__)
-conn = sqlite3.connect('instance/data.sqlite', check_same_thread=False)
+app.config['DATABASE'] = os.environ.get('PARKING_DB', 'instance/data.sqlite')
+app.config['DATABASE_URL'] = os.environ.get('PARKING_DATABASE_URL')
+app.config['DB_POOL_SIZE'] = 8
+app.config['DB_BUSY_TIMEOUT_MS'] = 5000
+app.config['DB_MMAP_SIZE'] = 64 * 1024 * 1024
+app.config['SCHEDULER_ENABLED'] = os.environ.get('PARKING_SCHEDULER', '1') == '1'
+app.config['PURGE_CHUNK_SIZE'] = 5000
+app.config['PURGE_PAUSE_SECONDS'] = 0.05
+app.config['PURGE_ARCHIVE'] = True
+app.config['ARCHIVE_DIR'] = os.environ.get('PARKING_ARCHIVE_DIR', 'instance/archive')
+app.config['USER_CACHE_SIZE'] = 10000
+app.config['USER_CACHE_TTL'] = 300
+app.config['USER_CACHE_SHARED'] = os.environ.get('PARKING_SHARED_USER_CACHE', '0') == '1'
+app.config['USER_CACHE_SYNC_SECONDS'] = 5
+app.config['OCCUPANCY_SYNC_SECONDS'] = 1.0
+app.config['OCCUPANCY_SYNC_OVERLAP_SECONDS'] = 5.0
+app.config['OCCUPANCY_RESYNC_SECONDS'] = 300
+app.config['SPOT_CHANGE_RETENTION_SECONDS'] = 600
+app.config['PARKING_CONTEXT_SIZE'] = 10000
+app.config['PARKING_CONTEXT_TTL'] = 60
+app.config['PARKING_CONTEXT_SYNC_SECONDS'] = 1.0
+app.config['USER_INVALIDATION_RETENTION_SECONDS'] = 3600
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('PARKING_BCRYPT_ROUNDS', '12'))
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('PARKING_PASSWORD_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+app.config['PASSWORD_QUEUE_LIMIT'] = 64
+app.config['SENSOR_TOKEN'] = os.environ.get('PARKING_SENSOR_TOKEN')
+app.config['SENSOR_FLUSH_SECONDS'] = 0.5
+app.config['SENSOR_FLUSH_SIZE'] = 5000
+app.config['SENSOR_BATCH_LIMIT'] = 20000
+app.config['SENSOR_MAX_BYTES'] = 2 * 1024 * 1024
+app.config['SENSOR_MAX_LAG_SECONDS'] = 5.0
+app.config['SENSOR_CLAIM_GRACE_SECONDS'] = 600
+app.config['ASGI_WSGI_THREADS'] = int(os.environ.get('PARKING_ASGI_WSGI_THREADS', '32'))
+app.config['ASGI_DB_THREADS'] = int(os.environ.get('PARKING_ASGI_DB_THREADS', '8'))
+app.config['ASGI_STREAM_THREADS'] = int(os.environ.get('PARKING_ASGI_STREAM_THREADS', '64'))
+app.config['READ_SNAPSHOT_ENABLED'] = (os.environ.get('PARKING_READ_SNAPSHOT', '1') == '1'
+                                       and not app.config['DATABASE_URL'])
+app.config['READ_SNAPSHOT_MAX_STALENESS'] = float(os.environ.get('PARKING_READ_SNAPSHOT_STALENESS', '1.0'))
+app.config['METRICS_ENABLED'] = os.environ.get('PARKING_METRICS', '1') == '1'
+app.config['SQL_PROFILE_EVERY'] = max(1, int(os.environ.get('PARKING_SQL_PROFILE_EVERY', '10')))
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('PARKING_SLOW_QUERY_MS', '0'))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('PARKING_SLOW_QUERY_LOG', 'instance/slow-queries.log')
+app.config['MONITORING_TOKEN'] = os.environ.get('PARKING_MONITORING_TOKEN')
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///data.sqlite'
 app.config['SECRET_KEY'] = 'super secret key' 
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- METRICS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Per-route latency histograms and per-statement SQL counters, rendered in Prometheus text format. --
+# Statements are keyed by (route, sql), so a route issuing the same query several times per request shows as
+# several calls per request next to the route's request count. Work outside a request is recorded as "background".
+# Statement counters live in per-thread dicts and a cursor keeps a reference to its statement's counter, so the
+# hot path takes no lock and does one dict lookup per execute; /metrics merges the threads when it is scraped.
+# The counters of threads that have exited are folded into one shared total whenever a new thread registers or
+# /metrics is scraped, so servers that start a thread per request do not keep one dict per request.
+# Every request is timed, but only one in SQL_PROFILE_EVERY has its statements profiled; the others get plain
+# sqlite3 cursors. Background work and the ASGI fast path's database calls are always profiled, and so is every
+# request while the slow-query log is on.
+class Metrics:
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    # "IN (?, ?, ?)" of any length, which would otherwise be one statement label per list length
+    IN_LIST = re.compile(r'\bIN \(\?(?:\s*,\s*\?)*\)', re.IGNORECASE)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_routes = []
+        self._retired = {}
+        self._labels = {}
+        self._started = itertools.count(1)
+        self.requests = {}
+        self.statuses = {}
+        self.request_queries = {}
+        self.slow_queries = 0
+
+    # -- {route: {sql: [calls, seconds, rows]}} for the calling thread, registered for /metrics on first use --
+    def _routes(self):
+        local = self._local
+        routes = getattr(local, 'routes', None)
+        if routes is None:
+            routes = local.routes = {}
+            local.queries = 0
+            with self._lock:
+                self._retire_exited_threads()
+                self._thread_routes.append((threading.current_thread(), routes))
+        return routes
+
+    # -- Whitespace-normalised SQL with IN lists collapsed to "IN (...)", as shown in the statement label --
+    def _label(self, sql):
+        label = self._labels.get(sql)
+        if label is None:
+            label = self._labels[sql] = self.IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+        return label
+
+    # -- Adds route statement counters into `totals`, keyed by (route, statement label) --
+    def _add_totals(self, totals, routes):
+        for route, statements in list(routes.items()):
+            for sql, (calls, seconds, rows) in list(statements.items()):
+                total = totals.setdefault((route, self._label(sql)), [0, 0.0, 0])
+                total[0] += calls
+                total[1] += seconds
+                total[2] += rows
+
+    # -- Folds the counters of exited threads into the shared totals; called with the lock held --
+    def _retire_exited_threads(self):
+        alive = []
+        for thread, routes in self._thread_routes:
+            if thread.is_alive():
+                alive.append((thread, routes))
+            else:
+                self._add_totals(self._retired, routes)
+        self._thread_routes = alive
+
+    # -- `profiled` overrides the one-in-SQL_PROFILE_EVERY sampling --
+    def start_request(self, route, method=None, profiled=None):
+        local = self._local
+        if profiled is None:
+            profiled = bool(app.config['SLOW_QUERY_MS']) or next(self._started) % app.config['SQL_PROFILE_EVERY'] == 0
+        if profiled:
+            routes = self._routes()
+            local.statements = routes.get(route) or routes.setdefault(route, {})
+        local.route = route
+        local.method = method
+        local.queries = 0
+        local.profiled = profiled
+        local.started = time.perf_counter()
+
+    # -- Whether the current thread's statements are being profiled --
+    def profiling(self):
+        return getattr(self._local, 'profiled', True)
+
+    # -- Ends the current thread's request without recording it; returns (route, seconds, queries) or None. --
+    # queries is None when the request was not profiled.
+    def detach_request(self):
+        local = self._local
+        route = getattr(local, 'route', None)
+        if route is None:
+            return None
+        elapsed = time.perf_counter() - local.started
+        local.route = None
+        if not local.profiled:
+            local.profiled = True
+            return route, elapsed, None
+        local.statements = self._routes().setdefault('background', {})
+        return route, elapsed, local.queries
+
+    # -- Idempotent: the after_request hook records the real status, teardown records a 500 if that never ran --
+    def finish_request(self, status):
+        finished = self.detach_request()
+        if finished is not None:
+            route, elapsed, queries = finished
+            self.record_request(route, self._local.method, status, elapsed, queries)
+
+    # -- Also used by the ASGI fast path (asgi.py), whose requests never pass through the Flask hooks --
+    def record_request(self, route, method, status, elapsed, queries):
+        bucket = bisect_left(self.BUCKETS, elapsed)
+        with self._lock:
+            histogram = self.requests.get((route, method))
+            if histogram is None:
+                # One count per bucket plus the +Inf overflow, then the running sum of seconds
+                histogram = self.requests[(route, method)] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += elapsed
+            self.statuses[(route, method, status)] = self.statuses.get((route, method, status), 0) + 1
+            if queries is not None:
+                counts = self.request_queries.setdefault(route, [0, 0])
+                counts[0] += 1
+                counts[1] += queries
+
+    # -- Counts one execution of `sql` for the current route and returns its [calls, seconds, rows] counter --
+    def statement(self, sql):
+        local = self._local
+        try:
+            statements = local.statements
+        except AttributeError:
+            statements = local.statements = self._routes().setdefault('background', {})
+        stat = statements.get(sql)
+        if stat is None:
+            stat = statements[sql] = [0, 0.0, 0]
+        stat[0] += 1
+        local.queries += 1
+        return stat
+
+    # -- Appends the statement and its query plan to the slow-query log --
+    def log_slow_query(self, conn, sql, parameters, seconds):
+        plan = []
+        if parameters is not None:
+            try:
+                plan = store.explain(conn, sql, parameters)
+            except store.Error:
+                pass
+        route = getattr(self._local, 'route', None) or 'background'
+
+        lines = [f"{datetime.now().isoformat(timespec='seconds')} {route} {seconds * 1000:.1f} ms",
+                 f"  {' '.join(sql.split())}"] + [f"  plan: {step}" for step in plan]
+        with self._lock:
+            self.slow_queries += 1
+            with open(app.config['SLOW_QUERY_LOG'], 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+
+    # -- Statement counters summed across threads, keyed by (route, statement label) --
+    def statement_totals(self):
+        with self._lock:
+            self._retire_exited_threads()
+            thread_routes = [routes for _, routes in self._thread_routes]
+            totals = {key: list(total) for key, total in self._retired.items()}
+        for routes in thread_routes:
+            self._add_totals(totals, routes)
+        return totals
+
+    def render(self, gauges=()):
+        with self._lock:
+            requests_ = {key: list(histogram) for key, histogram in self.requests.items()}
+            statuses = dict(self.statuses)
+            request_queries = {route: list(counts) for route, counts in self.request_queries.items()}
+            slow_queries = self.slow_queries
+
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+        lines = ['# HELP parking_request_duration_seconds Request latency by route.',
+                 '# TYPE parking_request_duration_seconds histogram']
+        for (route, method), histogram in sorted(requests_.items()):
+            labels = f'route="{label(route)}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, histogram):
+                cumulative += count
+                lines.append(f'parking_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += histogram[len(self.BUCKETS)]
+            lines.append(f'parking_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'parking_request_duration_seconds_sum{{{labels}}} {histogram[-1]:.6f}')
+            lines.append(f'parking_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        lines += ['# HELP parking_requests_total Requests by route, method and status.',
+                  '# TYPE parking_requests_total counter']
+        for (route, method, status), count in sorted(statuses.items()):
+            lines.append(f'parking_requests_total{{route="{label(route)}",method="{method}",status="{status}"}} {count}')
+
+        lines += ['# HELP parking_request_sql_queries SQL statements executed per profiled request.',
+                  '# TYPE parking_request_sql_queries summary']
+        for route, (count, queries) in sorted(request_queries.items()):
+            lines.append(f'parking_request_sql_queries_sum{{route="{label(route)}"}} {queries}')
+            lines.append(f'parking_request_sql_queries_count{{route="{label(route)}"}} {count}')
+
+        totals = sorted(self.statement_totals().items())
+        for name, index, help_text in (('calls_total', 0, 'Executions'),
+                                       ('seconds_total', 1, 'Time spent executing and fetching'),
+                                       ('rows_total', 2, 'Rows fetched or changed')):
+            lines += [f'# HELP parking_sql_statement_{name} {help_text} per route and statement, in profiled '
+                      f'requests (one in {app.config["SQL_PROFILE_EVERY"]}) and background work.',
+                      f'# TYPE parking_sql_statement_{name} counter']
+            for (route, sql), values in totals:
+                value = f'{values[index]:.6f}' if index == 1 else values[index]
+                lines.append(f'parking_sql_statement_{name}{{route="{label(route)}",statement="{label(sql)}"}} {value}')
+
+        lines += ['# HELP parking_sql_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                  '# TYPE parking_sql_slow_queries_total counter',
+                  f'parking_sql_slow_queries_total {slow_queries}']
+        for name, metric_type, help_text, value in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# -- Cursor that reports each statement to `metrics`. Time and rows of the fetches are added to the statement --
+# that produced them, since SQLite does most of a SELECT's work while stepping through its rows.
+class ProfiledCursor(sqlite3.Cursor):
+    _stat = None
+
+    # The bookkeeping is inlined rather than factored into helpers: each Python call here is paid per statement
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        stat = self._stat = metrics.statement(sql)
+        stat[1] += elapsed
+        if self.rowcount > 0:
+            stat[2] += self.rowcount
+        if app.config['SLOW_QUERY_MS']:
+            self._sql, self._parameters, self._elapsed = sql, parameters, 0.0
+            self._check_slow(elapsed)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        elapsed = time.perf_counter() - started
+        stat = self._stat = metrics.statement(sql)
+        stat[1] += elapsed
+        if self.rowcount > 0:
+            stat[2] += self.rowcount
+        if app.config['SLOW_QUERY_MS']:
+            self._sql, self._parameters, self._elapsed = sql, None, 0.0
+            self._check_slow(elapsed)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        elapsed = time.perf_counter() - started
+        stat = self._stat
+        if stat is not None:
+            stat[1] += elapsed
+            if row is not None:
+                stat[2] += 1
+            if app.config['SLOW_QUERY_MS']:
+                self._check_slow(elapsed)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        elapsed = time.perf_counter() - started
+        stat = self._stat
+        if stat is not None:
+            stat[1] += elapsed
+            stat[2] += len(rows)
+            if app.config['SLOW_QUERY_MS']:
+                self._check_slow(elapsed)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        elapsed = time.perf_counter() - started
+        stat = self._stat
+        if stat is not None:
+            stat[1] += elapsed
+            stat[2] += len(rows)
+            if app.config['SLOW_QUERY_MS']:
+                self._check_slow(elapsed)
+        return rows
+
+    # -- Logged once per execution, when its running total first crosses SLOW_QUERY_MS --
+    def _check_slow(self, seconds):
+        sql = getattr(self, '_sql', None)
+        if sql is None:
+            return
+        before = self._elapsed
+        self._elapsed += seconds
+        if before * 1000 < app.config['SLOW_QUERY_MS'] <= self._elapsed * 1000:
+            metrics.log_slow_query(self.connection, sql, self._parameters, self._elapsed)
+
+
+# -- Hands out ProfiledCursors while the current request is profiled and plain cursors otherwise. Connections --
+# opened outside the pool (SQLAlchemy's, the sensor writer) keep this class and check on every statement.
+class ProfiledConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = ProfiledCursor if metrics.profiling() else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if metrics.profiling():
+            return ProfiledCursor(self).execute(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if metrics.profiling():
+            return ProfiledCursor(self).executemany(sql, seq_of_parameters)
+        return super().executemany(sql, seq_of_parameters)
+
+
+# -- What ConnectionPool.acquire turns a connection into for a request that is not profiled: nothing overridden, --
+# so its statements skip ProfiledConnection's Python call altogether. Same layout, so __class__ can switch back.
+class UnprofiledConnection(sqlite3.Connection):
+    pass
+
+
+# -- The same accounting for PostgreSQL, called by postgres.Cursor after each statement has fetched its rows --
+def record_statement(conn, sql, parameters, seconds, rows):
+    if not metrics.profiling():
+        return
+    stat = metrics.statement(sql)
+    stat[1] += seconds
+    if rows > 0:
+        stat[2] += rows
+    if app.config['SLOW_QUERY_MS'] and seconds * 1000 >= app.config['SLOW_QUERY_MS']:
+        metrics.log_slow_query(conn, sql, parameters, seconds)
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        # One context lookup for both attributes rather than one per attribute through the proxy
+        request_ = request._get_current_object()
+        metrics.start_request(request_.endpoint or 'unmatched', request_.method)
+
+
+@app.after_request
+def record_request_metrics(response):
+    if app.config['METRICS_ENABLED']:
+        metrics.finish_request(response.status_code)
+    return response
+
+
+# Without an exception Flask has already run the after_request hooks, so there is nothing left to record
+@app.teardown_request
+def record_failed_request_metrics(exception):
+    if exception is not None and app.config['METRICS_ENABLED']:
+        metrics.finish_request(500)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- DATABASE CONNECTION POOL  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- A fixed-size pool of pre-configured sqlite connections shared by every route and background job. --
+class ConnectionPool:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._releases = 0
+        self._hold_time = 0.0
+        self._checked_out = {}
+
+    # -- Every connection gets the same pragmas, including the ones SQLAlchemy opens. --
+    def new_connection(self):
+        conn = sqlite3.connect(self.path, timeout=app.config['DB_BUSY_TIMEOUT_MS'] / 1000,
+                               check_same_thread=False,
+                               factory=ProfiledConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA mmap_size = {int(app.config['DB_MMAP_SIZE'])}")
+        conn.execute(f"PRAGMA busy_timeout = {int(app.config['DB_BUSY_TIMEOUT_MS'])}")
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    conn = self.new_connection()
+
+            if conn is None:
+                # Pool exhausted: block until another request hands its connection back
+                started = time.perf_counter()
+                conn = self._idle.get()
+                with self._lock:
+                    self._waits += 1
+                    self._wait_time += time.perf_counter() - started
+
+        if app.config['METRICS_ENABLED']:
+            conn.__class__ = ProfiledConnection if metrics.profiling() else UnprofiledConnection
+        with self._lock:
+            self._checkouts += 1
+            self._checked_out[id(conn)] = time.perf_counter()
+        return conn
+
+    def release(self, conn):
+        # Never hand a connection with a half-finished transaction to the next caller
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._lock:
+            started = self._checked_out.pop(id(conn), None)
+            if started is not None:
+                self._releases += 1
+                self._hold_time += time.perf_counter() - started
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    # -- Closes every idle connection; used by offline tools that need the database to themselves --
+    def close_idle(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                return
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'idle': self._idle.qsize(),
+                'in_use': len(self._checked_out),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'avg_wait_ms': (self._wait_time / self._waits * 1000) if self._waits else 0.0,
+                'avg_hold_ms': (self._hold_time / self._releases * 1000) if self._releases else 0.0
+            }
+
+
+# -- SQLite at DATABASE by default; PostgreSQL when DATABASE_URL is set, which needs psycopg and psycopg_pool --
+if app.config['DATABASE_URL']:
+    import postgres
+    store = postgres.PostgresStorage()
+    pool = postgres.PostgresPool(app.config['DATABASE_URL'], app.config['DB_POOL_SIZE'],
+                                 statement_hook=record_statement if app.config['METRICS_ENABLED'] else None)
+    app.config['SQLALCHEMY_DATABASE_URI'] = postgres.sqlalchemy_url(app.config['DATABASE_URL'])
+else:
+    store = storage.Storage()
+    pool = ConnectionPool(app.config['DATABASE'], app.config['DB_POOL_SIZE'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'creator': pool.new_connection}
+
+
+# -- Request-scoped connection: checked out on first use, returned to the pool on teardown. --
+def get_db():
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
 db = SQLAlchemy(app)
 
 login_manager = LoginManager(app) 
 login_manager.login_view = 'login'
-bcrypt = Bcrypt(app)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SCHEMA MIGRATIONS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Schema is brought up to date whenever the app is loaded, including under gunicorn --
+with pool.connection() as migration_conn:
+    store.run_migrations(migration_conn, os.path.join(app.root_path, store.MIGRATIONS))
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- REFERENCE TABLE SNAPSHOT  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- In-memory copy of the small, rarely written tables the read-only pages look up. --
+# A snapshot is trusted for READ_SNAPSHOT_MAX_STALENESS seconds after it was last known current; the first read
+# after that compares PRAGMA data_version (bumped by every commit from another connection) with the value seen
+# when the copy was taken, and recopies only if the database changed. Every table is copied in one read
+# transaction into a new in-memory database, which is swapped in whole, so readers never see a mix of versions.
+# spots is left out on purpose: the occupancy index already serves it write-through, and it changes with every
+# claim, which would force a recopy of the largest table on nearly every check. SQLite only: with DATABASE_URL
+# set, READ_SNAPSHOT_ENABLED is off and these reads go to PostgreSQL.
+class ReferenceSnapshot:
+    TABLES = ('lot', 'zone', 'zoneAssignment', 'permitType')
+
+    def __init__(self, path, max_staleness):
+        self.path = os.path.abspath(path)
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._conn = None
+        self._source = None
+        self._data_version = None
+        self._invalidated = False
+        self.confirmed_at = None
+        self.checks = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh_ms = 0.0
+
+    def _copy(self):
+        conn = sqlite3.connect('file::memory:', uri=True, check_same_thread=False)
+        conn.execute("ATTACH DATABASE ? AS source", [f'file:{quote(self.path)}?mode=ro'])
+        try:
+            conn.execute("BEGIN")
+            placeholders = ','.join('?' * len(self.TABLES))
+            schema = conn.execute(f"""
+                SELECT sql FROM source.sqlite_master
+                WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL
+                ORDER BY type = 'index'
+            """, self.TABLES).fetchall()
+            for (sql,) in schema:
+                conn.execute(sql)
+            for table in self.TABLES:
+                conn.execute(f"INSERT INTO main.{table} SELECT * FROM source.{table}")
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE source")
+        return conn
+
+    # -- Recopies the tables if the database changed since the last copy; the caller holds _refresh_lock --
+    def _revalidate(self):
+        if self._source is None:
+            self._source = sqlite3.connect(self.path, check_same_thread=False)
+        checked_at = time.monotonic()
+        self._invalidated = False
+        # Read before copying: a commit that lands during the copy changes it again and forces the next recopy
+        data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        if self._conn is not None and data_version == self._data_version:
+            self.checks += 1
+            self.confirmed_at = checked_at
+            return
+
+        started = time.perf_counter()
+        conn = self._copy()
+        with self._lock:
+            previous, self._conn = self._conn, conn
+        if previous is not None:
+            previous.close()
+        self._data_version = data_version
+        self.confirmed_at = checked_at
+        self.refreshes += 1
+        self.last_refresh_ms = (time.perf_counter() - started) * 1000
+
+    def _expired(self):
+        return self._invalidated or self.confirmed_at is None or \
+            time.monotonic() - self.confirmed_at > self.max_staleness
+
+    # -- The snapshot, refreshed first if it has not been confirmed for longer than max_staleness. --
+    # Yields `fallback` (the request's own connection) when snapshots are off or a refresh fails.
+    @contextmanager
+    def connection(self, fallback):
+        if not app.config['READ_SNAPSHOT_ENABLED']:
+            yield fallback
+            return
+
+        if self._expired():
+            with self._refresh_lock:
+                if self._expired():
+                    try:
+                        self._revalidate()
+                    except sqlite3.Error as error:
+                        self.failures += 1
+                        print(f"Snapshot: refresh failed ({error}); reading from the database.")
+
+        if self._expired():
+            yield fallback
+            return
+        with self._lock:
+            yield self._conn
+
+    # -- For writers in this process: the next read rechecks instead of waiting out max_staleness --
+    def invalidate(self):
+        self._invalidated = True
+
+    # -- Seconds since the snapshot was last known to match the database: an upper bound on its staleness --
+    def staleness(self):
+        if self.confirmed_at is None:
+            return 0.0
+        return time.monotonic() - self.confirmed_at
+
+    def stats(self):
+        return {
+            'enabled': app.config['READ_SNAPSHOT_ENABLED'],
+            'max_staleness_seconds': self.max_staleness,
+            'staleness_seconds': self.staleness(),
+            'checks': self.checks,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_refresh_ms': self.last_refresh_ms
+        }
+
+
+reference_tables = ReferenceSnapshot(app.config['DATABASE'], app.config['READ_SNAPSHOT_MAX_STALENESS'])
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SPOT OCCUPANCY INDEX  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Process-wide copy of every spot for the map, kept current by the code paths that change spots. --
+# Each spot keeps its own pre-serialized JSON fragment, so a status change re-renders one spot and
+# the full payload is only re-joined on the next read after a change.
+# Changes made by other workers reach the index through the spotChange log, replayed by sync() at most every
+# OCCUPANCY_SYNC_SECONDS; a full reload every OCCUPANCY_RESYNC_SECONDS catches anything the log could not.
+class OccupancyIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._sync_thread = None
+        self._next_sync = 0.0
+        self.synced_at = 0.0
+        self.loaded_at = 0.0
+        self.loaded = False
+        # Starts from the clock so a restarted server never reuses versions a browser already holds
+        self.version = int(time.time() * 1000)
+        self.spot_keys = array('q')
+        self.spot_nums = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.statuses = bytearray()
+        self.actives = bytearray()
+        self.zone_keys = array('q')
+        self.lot_keys = array('q')
+        self.spot_versions = array('q')
+        self.zone_types = {}
+        self.lot_names = {}
+        self.lot_capacities = {}
+        self.counts = {}
+        self.position = {}
+        self._fragments = []
+        self._payload = b'[]'
+        self._dirty = True
+        self.loaded_version = 0
+
+    def load(self, conn):
+        started = time.time()
+        zone_types = store.zones.types(conn)
+        lots = store.zones.lots(conn)
+        rows = store.spots.for_map(conn)
+
+        with self._lock:
+            self.zone_types = zone_types
+            self.lot_names = {lot_key: name for lot_key, name, _ in lots}
+            self.lot_capacities = {lot_key: capacity for lot_key, _, capacity in lots}
+            self.spot_keys = array('q', (row[0] for row in rows))
+            self.spot_nums = [row[1] for row in rows]
+            self.latitudes = array('d', (row[2] for row in rows))
+            self.longitudes = array('d', (row[3] for row in rows))
+            self.statuses = bytearray(1 if row[4] else 0 for row in rows)
+            self.actives = bytearray(1 if row[5] else 0 for row in rows)
+            self.zone_keys = array('q', (row[6] for row in rows))
+            self.lot_keys = array('q', (row[7] for row in rows))
+            self.spot_versions = array('q', bytes(8 * len(rows)))
+            self.position = {spot_key: i for i, spot_key in enumerate(self.spot_keys)}
+            self._fragments = [self._render(i) for i in range(len(rows))]
+            self.counts = {}
+            for i in range(len(rows)):
+                self._count(i, 1)
+            self._dirty = True
+            self.version += 1
+            self.loaded = True
+            self.loaded_version = self.version
+            self.loaded_at = self.synced_at = started
+            self._next_sync = time.monotonic() + app.config['OCCUPANCY_SYNC_SECONDS']
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with pool.connection() as conn:
+                self.load(conn)
+        else:
+            self.sync()
+
+    # -- Applies the spot changes other workers logged since the last sync. Rows are re-read from spots, so --
+    # replaying a change twice is harmless, and each window reaches OCCUPANCY_SYNC_OVERLAP_SECONDS back into the
+    # previous one for transactions that logged a change before it and committed after it (the overlap also
+    # absorbs small clock differences between hosts). One thread syncs at a time; the others read as they are.
+    def sync(self):
+        now = time.monotonic()
+        if not self.loaded or now < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + app.config['OCCUPANCY_SYNC_SECONDS']
+            started = time.time()
+            with pool.connection() as conn:
+                if started - self.loaded_at > app.config['OCCUPANCY_RESYNC_SECONDS']:
+                    self.load(conn)
+                    return
+                rows = store.spots.changed_since(conn, self.synced_at - app.config['OCCUPANCY_SYNC_OVERLAP_SECONDS'])
+            self.synced_at = started
+            changed = self.apply(rows)
+        finally:
+            self._sync_lock.release()
+        publish_spot_event('sync', changed)
+
+    def sync_due(self):
+        return time.monotonic() >= self._next_sync
+
+    # -- Brings spots up to date from (spot_key, status, is_active, zone_key) rows; returns the changed keys --
+    def apply(self, rows):
+        with self._lock:
+            changed = []
+            for spot_key, status, is_active, zone_key in rows:
+                i = self.position.get(spot_key)
+                if i is None:
+                    # A spot added since the last load: only a reload renders it
+                    self.loaded_at = 0.0
+                    continue
+                status, is_active = 1 if status else 0, 1 if is_active else 0
+                if self.statuses[i] == status and self.actives[i] == is_active and self.zone_keys[i] == zone_key:
+                    continue
+                if not changed:
+                    self.version += 1
+                self._count(i, -1)
+                self.statuses[i] = status
+                self.actives[i] = is_active
+                self.zone_keys[i] = zone_key
+                self._count(i, 1)
+                self._fragments[i] = self._render(i)
+                self.spot_versions[i] = self.version
+                changed.append(spot_key)
+            if changed:
+                self._dirty = True
+            return changed
+
+    # -- Keeps syncing while live-update streams are open, so their browsers see other workers' changes without --
+    # anyone reading from this worker
+    def start_sync(self):
+        with self._sync_lock:
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._sync_worker, name='occupancy-sync', daemon=True)
+                self._sync_thread.start()
+
+    def _sync_worker(self):
+        while True:
+            time.sleep(app.config['OCCUPANCY_SYNC_SECONDS'])
+            if events.subscribers:
+                try:
+                    self.sync()
+                except store.Error as error:
+                    print(f"Occupancy: sync failed ({error})")
+
+    # -- Adds (sign=1) or removes (sign=-1) spot i from its lot/zone counters: [spots, active, occupied, available] --
+    def _count(self, i, sign):
+        counter = self.counts.get((self.lot_keys[i], self.zone_keys[i]))
+        if counter is None:
+            counter = self.counts[(self.lot_keys[i], self.zone_keys[i])] = [0, 0, 0, 0]
+        counter[0] += sign
+        counter[1] += sign * self.actives[i]
+        counter[2] += sign * self.statuses[i]
+        counter[3] += sign * (self.actives[i] and not self.statuses[i])
+
+    # -- Same keys and encoding that jsonify() produced for the old per-request query --
+    def _render(self, i):
+        return json.dumps({
+            'spot_num': self.spot_nums[i],
+            'latitude': self.latitudes[i],
+            'longitude': self.longitudes[i],
+            'is_occupied': bool(self.statuses[i]),
+            'is_active': bool(self.actives[i]),
+            'zone_type': self.zone_types.get(self.zone_keys[i]),
+            'lot_name': self.lot_names.get(self.lot_keys[i])
+        }, separators=(',', ':'), sort_keys=True)
+
+    def set_status(self, spot_key, status):
+        if not self.loaded:
+            return
+        with self._lock:
+            i = self.position.get(spot_key)
+            if i is None or self.statuses[i] == status:
+                return
+            self._count(i, -1)
+            self.statuses[i] = status
+            self._count(i, 1)
+            self._fragments[i] = self._render(i)
+            self._dirty = True
+            self.version += 1
+            self.spot_versions[i] = self.version
+
+    # -- Batched set_status for (spot_key, status) pairs under one lock and one version; returns the changed keys --
+    def set_statuses(self, changes):
+        if not self.loaded:
+            return []
+        with self._lock:
+            changed = []
+            for spot_key, status in changes:
+                i = self.position.get(spot_key)
+                if i is None or self.statuses[i] == status:
+                    continue
+                if not changed:
+                    self.version += 1
+                self._count(i, -1)
+                self.statuses[i] = status
+                self._count(i, 1)
+                self._fragments[i] = self._render(i)
+                self.spot_versions[i] = self.version
+                changed.append(spot_key)
+            if changed:
+                self._dirty = True
+            return changed
+
+    # -- Mirrors "UPDATE spots SET s_zonekey = ?, s_isactive = ? WHERE s_lotkey = ?" --
+    def set_lot_zone(self, lot_key, zone_key, is_active=1):
+        if not self.loaded:
+            return []
+        with self._lock:
+            changed = [i for i, spot_lot_key in enumerate(self.lot_keys)
+                       if spot_lot_key == lot_key and (self.zone_keys[i] != zone_key or self.actives[i] != is_active)]
+            if not changed:
+                return []
+            self.version += 1
+            for i in changed:
+                self._count(i, -1)
+                self.zone_keys[i] = zone_key
+                self.actives[i] = is_active
+                self._count(i, 1)
+                self._fragments[i] = self._render(i)
+                self.spot_versions[i] = self.version
+            self._dirty = True
+            return [self.spot_keys[i] for i in changed]
+
+    # -- Spot counters per (lot, zone) as dicts; O(lots x zones) whatever the number of spots --
+    def zone_counts(self):
+        self.ensure_loaded()
+        with self._lock:
+            return {key: {'spots': spots, 'active': active, 'occupied': occupied, 'available': available}
+                    for key, (spots, active, occupied, available) in self.counts.items()}
+
+    # -- Per-lot totals with the configured capacity next to the number of spots actually on record --
+    def lot_counts(self):
+        zone_counts = self.zone_counts()
+        with self._lock:
+            lots = {lot_key: {'lot_key': lot_key, 'lot_name': name, 'capacity': self.lot_capacities.get(lot_key),
+                              'spots': 0, 'active': 0, 'occupied': 0, 'available': 0, 'zones': []}
+                    for lot_key, name in self.lot_names.items()}
+        for (lot_key, zone_key), counter in sorted(zone_counts.items()):
+            lot = lots.get(lot_key)
+            if lot is None:
+                continue
+            for field in ('spots', 'active', 'occupied', 'available'):
+                lot[field] += counter[field]
+            lot['zones'].append(dict(counter, zone_key=zone_key, zone_type=self.zone_types.get(zone_key)))
+        for lot in lots.values():
+            lot['occupancy_rate'] = lot['occupied'] / lot['spots'] if lot['spots'] else 0.0
+            lot['capacity_matches'] = lot['capacity'] == lot['spots']
+        return [lots[lot_key] for lot_key in sorted(lots)]
+
+    # -- Returns (version, serialized JSON array) --
+    def payload(self):
+        self.ensure_loaded()
+        with self._lock:
+            if self._dirty:
+                self._payload = ('[' + ','.join(self._fragments) + ']').encode('utf-8')
+                self._dirty = False
+            return self.version, self._payload
+
+    # -- Current version and JSON fragments for the given spots --
+    def snapshot(self, spot_keys):
+        with self._lock:
+            fragments = [self._fragments[self.position[spot_key]] for spot_key in spot_keys
+                         if spot_key in self.position]
+            return self.version, fragments
+
+    # -- Returns (version, JSON change feed) holding only spots changed after `since`. --
+    # A `since` the index cannot answer from (before the last full load, or from the future) gets every spot.
+    def changes_since(self, since):
+        self.ensure_loaded()
+        with self._lock:
+            full = since < self.loaded_version or since > self.version
+            fragments = self._fragments if full else [
+                self._fragments[i] for i, spot_version in enumerate(self.spot_versions) if spot_version > since
+            ]
+            body = '{"changes":[%s],"full":%s,"version":%d}' % (','.join(fragments), 'true' if full else 'false',
+                                                                 self.version)
+            return self.version, body.encode('utf-8')
+
+
+occupancy = OccupancyIndex()
+
+
+# -- Uniform grid over the spot coordinates held by the occupancy index, for nearest-spot queries. --
+# Cells hold positions into the occupancy arrays, so free/active/zone state is read live from the index and
+# only a reload (new spots or coordinates) rebuilds the grid. Coordinates are projected to metres around the
+# campus centre, which is exact enough at parking-lot distances.
+class SpotGrid:
+    METRES_PER_DEGREE = 111320.0
+    SPOTS_PER_CELL = 4
+
+    def __init__(self, index):
+        self.index = index
+        self._lock = threading.Lock()
+        self.built_version = None
+        self.cells = {}
+        self.cell_size = 1.0
+        self.bounds = (0, -1, 0, -1)
+        self.origin = (0.0, 0.0)
+        self.scale = self.METRES_PER_DEGREE
+        self.xs = array('d')
+        self.ys = array('d')
+
+    def _build(self):
+        index = self.index
+        count = len(index.spot_keys)
+        origin_lat = sum(index.latitudes) / count if count else 0.0
+        origin_lon = sum(index.longitudes) / count if count else 0.0
+        scale = self.METRES_PER_DEGREE * math.cos(math.radians(origin_lat))
+        xs = array('d', ((lon - origin_lon) * scale for lon in index.longitudes))
+        ys = array('d', ((lat - origin_lat) * self.METRES_PER_DEGREE for lat in index.latitudes))
+
+        # Cell size targets a handful of spots per cell for the area the spots actually cover
+        width = (max(xs) - min(xs)) if count else 0.0
+        height = (max(ys) - min(ys)) if count else 0.0
+        cell_size = max(1.0, math.sqrt(max(width * height, 1.0) * self.SPOTS_PER_CELL / max(count, 1)))
+
+        cells = {}
+        for i in range(count):
+            cells.setdefault((int(xs[i] // cell_size), int(ys[i] // cell_size)), []).append(i)
+
+        self.origin = (origin_lat, origin_lon)
+        self.scale = scale
+        self.xs, self.ys = xs, ys
+        self.cell_size = cell_size
+        self.cells = cells
+        self.bounds = (min(cx for cx, _ in cells), max(cx for cx, _ in cells),
+                       min(cy for _, cy in cells), max(cy for _, cy in cells)) if cells else (0, -1, 0, -1)
+        self.built_version = index.loaded_version
+
+    def ensure_built(self):
+        self.index.ensure_loaded()
+        if self.built_version != self.index.loaded_version:
+            with self._lock:
+                if self.built_version != self.index.loaded_version:
+                    self._build()
+
+    # -- Up to k (distance_m, position) pairs nearest to (lat, lon) among spots for which accept(position) is true --
+    # Rings of cells are visited outwards until the k-th best distance is closer than anything an outer ring holds;
+    # rings are clipped to the occupied cells, so a query point far off campus costs no more than one on it.
+    def nearest(self, lat, lon, k, accept):
+        self.ensure_built()
+        with self.index._lock:
+            return self._nearest(lat, lon, k, accept)
+
+    def _nearest(self, lat, lon, k, accept):
+        x = (lon - self.origin[1]) * self.scale
+        y = (lat - self.origin[0]) * self.METRES_PER_DEGREE
+        cell_x, cell_y = int(x // self.cell_size), int(y // self.cell_size)
+        min_x, max_x, min_y, max_y = self.bounds
+        first_ring = max(0, min_x - cell_x, cell_x - max_x, min_y - cell_y, cell_y - max_y)
+        last_ring = max(cell_x - min_x, max_x - cell_x, cell_y - min_y, max_y - cell_y)
+        best = []
+
+        for ring in range(first_ring, last_ring + 1):
+            if len(best) == k and -best[0][0] <= (ring - 1) * self.cell_size:
+                break
+            for cx in range(max(cell_x - ring, min_x), min(cell_x + ring, max_x) + 1):
+                if abs(cx - cell_x) == ring:
+                    rows = range(max(cell_y - ring, min_y), min(cell_y + ring, max_y) + 1)
+                else:
+                    rows = [cy for cy in (cell_y - ring, cell_y + ring) if min_y <= cy <= max_y]
+                for cy in rows:
+                    for i in self.cells.get((cx, cy), ()):
+                        if not accept(i):
+                            continue
+                        distance = math.hypot(self.xs[i] - x, self.ys[i] - y)
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, i))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, i))
+
+        return sorted((-negative, i) for negative, i in best)
+
+
+spot_grid = SpotGrid(occupancy)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- LIVE SPOT EVENTS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Broadcast hub for spot changes. Subscribers block on one shared condition instead of owning a queue each, --
+# so an idle subscriber costs a parked thread (or greenlet under gunicorn -k gevent) and nothing per event.
+# Recent events stay in a ring buffer so a reconnecting browser can resume from Last-Event-ID.
+class EventHub:
+    def __init__(self, backlog=1024):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=backlog)
+        self.sequence = 0
+        self.subscribers = 0
+
+    def publish(self, event_type, data):
+        with self._cond:
+            self.sequence += 1
+            self._events.append((self.sequence, time.time(), event_type, data))
+            self._cond.notify_all()
+
+    # -- Blocks until there are events newer than last_seq or the timeout passes --
+    def wait(self, last_seq, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self.sequence > last_seq, timeout)
+            return [event for event in self._events if event[0] > last_seq]
+
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+            return self.sequence
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+
+events = EventHub()
+
+
+# -- Publishes the current state of the given spots as one event --
+def publish_spot_event(event_type, spot_keys):
+    if not spot_keys or not occupancy.loaded:
+        return
+    version, fragments = occupancy.snapshot(spot_keys)
+    events.publish(event_type, '{"spots":[%s],"version":%d}' % (','.join(fragments), version))
 
 
 
@@ -33,9 +1158,197 @@ class User(db.Model, UserMixin):
         return f'<User {self.username}>'
 
 
+# -- Bounded LRU of User objects keyed by u_userkey, with a TTL, so @login_required skips the ORM round-trip. --
+# With USER_CACHE_SHARED, changes are also written to userInvalidation and every worker replays that log at
+# most every USER_CACHE_SYNC_SECONDS, so an update in one worker evicts the user everywhere.
+class UserCache:
+    def __init__(self, capacity, ttl):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_invalidation = None
+        self._next_sync = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_key):
+        if app.config['USER_CACHE_SHARED']:
+            self._sync()
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(user_key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_key, user):
+        with self._lock:
+            self._entries[user_key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_key):
+        with self._lock:
+            if self._entries.pop(user_key, None) is not None:
+                self.invalidations += 1
+
+    # -- Replays invalidations written by other workers since the last sync --
+    def _sync(self):
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + app.config['USER_CACHE_SYNC_SECONDS']
+
+        with pool.connection() as conn:
+            if self._last_invalidation is None:
+                self._last_invalidation = conn.execute(
+                    "SELECT COALESCE(MAX(ui_invalidationkey), 0) FROM userInvalidation").fetchone()[0]
+                return
+            rows = conn.execute("""
+                SELECT ui_invalidationkey, ui_userkey FROM userInvalidation WHERE ui_invalidationkey > ?
+                ORDER BY ui_invalidationkey
+            """, [self._last_invalidation]).fetchall()
+
+        for invalidation_key, user_key in rows:
+            self.invalidate(user_key)
+            self._last_invalidation = invalidation_key
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations
+            }
+
+
+user_cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+# -- Any insert, update (e.g. a password change) or delete of a User evicts it from every worker's cache --
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.u_userkey)
+    if app.config['USER_CACHE_SHARED']:
+        # Written on the ORM's own connection so it commits with the change itself
+        connection.exec_driver_sql(
+            store.sql("INSERT INTO userInvalidation(ui_userkey, ui_at) VALUES(?, ?)"), (target.u_userkey, time.time()))
+        connection.exec_driver_sql(store.sql("DELETE FROM userInvalidation WHERE ui_at < ?"),
+                                   (time.time() - app.config['USER_INVALIDATION_RETENTION_SECONDS'],))
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_key = int(user_id)
+    user = user_cache.get(user_key)
+    if user is None:
+        user = User.query.get(user_key)
+        if user is not None:
+            # Detach so the cached object outlives this request's session
+            db.session.expunge(user)
+            user_cache.put(user_key, user)
+    return user
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- PASSWORD HASHING  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+class PasswordQueueFull(Exception):
+    pass
+
+
+# -- bcrypt runs in a bounded process pool, so a login storm uses at most PASSWORD_WORKERS cores and the request --
+# threads serving the map stay runnable. Calls beyond PASSWORD_QUEUE_LIMIT outstanding are refused instead of
+# queueing for ever. PASSWORD_WORKERS = 0 hashes inline in the calling thread (offline tools, debugging).
+# Workers are spawned, not forked (the parent has pool, scheduler and SSE threads a fork would copy mid-flight);
+# spawning re-imports the launching script, so scripts that log users in must keep their __main__ guard.
+class PasswordHasher:
+    def __init__(self, workers, queue_limit):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._peak = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._time = 0.0
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._outstanding >= self.queue_limit:
+                self._rejected += 1
+                raise PasswordQueueFull()
+            self._outstanding += 1
+            self._peak = max(self._peak, self._outstanding)
+        executor = self.start()
+
+        started = time.perf_counter()
+        try:
+            if executor is None:
+                return fn(*args)
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                self._completed += 1
+                self._time += time.perf_counter() - started
+
+    # -- Creates the pool and starts its workers in the background, so the first login does not wait for them --
+    def start(self):
+        if self._executor is None and self.workers > 0:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    for _ in range(self.workers):
+                        self._executor.submit(passwords.hash_rounds, '')
+        return self._executor
+
+    def hash(self, password):
+        return self._run(passwords.hash_password, password, app.config['BCRYPT_LOG_ROUNDS'])
+
+    def check(self, password_hash, password):
+        return self._run(passwords.check_password, password_hash, password)
+
+    # -- Hashes made at another cost factor are replaced the next time their owner logs in --
+    def needs_rehash(self, password_hash):
+        return passwords.hash_rounds(password_hash) != app.config['BCRYPT_LOG_ROUNDS']
+
+    def count_rehash(self):
+        with self._lock:
+            self._rehashed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'rounds': app.config['BCRYPT_LOG_ROUNDS'],
+                'queue_limit': self.queue_limit,
+                'queue_depth': self._outstanding,
+                'peak_queue_depth': self._peak,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'rehashed': self._rehashed,
+                'avg_ms': (self._time / self._completed * 1000) if self._completed else 0.0
+            }
+
+
+password_hasher = PasswordHasher(app.config['PASSWORD_WORKERS'], app.config['PASSWORD_QUEUE_LIMIT'])
 
 
 
@@ -76,7 +1389,10 @@ def signup_process():
         return render_template('signup.html', error="Email already exists.")
     
     # Create user
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(password)
+    except PasswordQueueFull:
+        return render_template('signup.html', error="Too many sign-ups right now. Please try again in a moment."), 503
     new_user = User(username=username_input, email=email_input, password=hashed_password)
     db.session.add(new_user)
     db.session.commit()
@@ -101,7 +1417,21 @@ def login():
 
     user = User.query.filter((User.username == login_id) | (User.email == login_id)).first()
 
-    if user and bcrypt.check_password_hash(user.password, password):
+    try:
+        valid = user is not None and password_hasher.check(user.password, password)
+    except PasswordQueueFull:
+        return render_template('login.html', error='Too many sign-ins right now. Please try again in a moment.'), 503
+
+    if valid and password_hasher.needs_rehash(user.password):
+        try:
+            user.password = password_hasher.hash(password)
+            db.session.commit()
+            password_hasher.count_rehash()
+        except PasswordQueueFull:
+            # The password checked out; the rehash waits for a login when the pool has room
+            pass
+
+    if valid:
         login_user(user, remember=False)
         return redirect(url_for('home', username=current_user.username))
     else:
@@ -128,6 +1458,261 @@ def home():
 
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+# --- PERMISSION MATRIX  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- permissionRule rows compiled into one 24-bit hour mask per (category, zone, lot). --
+# Index 0 of the category and lot axes stands for "any other" value, so a category or lot added later still
+# picks up the wildcard (NULL) rules. Eligibility on the claim path is a single array lookup and bit test.
+class PermissionMatrix:
+    ALL_HOURS = (1 << 24) - 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.categories = {}
+        self.zones = {}
+        self.lots = {}
+        self.zone_types = {}
+        self.masks = array('L')
+
+    @staticmethod
+    def _hours(start, end):
+        start, end = start % 24, end if end == 24 else end % 24
+        if start < end:
+            return ((1 << end) - 1) & ~((1 << start) - 1)
+        if start == end:
+            return PermissionMatrix.ALL_HOURS
+        return PermissionMatrix.ALL_HOURS & ~(((1 << start) - 1) & ~((1 << end) - 1))
+
+    def load(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT pr_category, pr_zonekey, pr_lotkey, pr_starthour, pr_endhour FROM permissionRule")
+        rules = cursor.fetchall()
+        cursor.execute("SELECT z_zonekey, z_type FROM zone ORDER BY z_zonekey")
+        zone_types = dict(cursor.fetchall())
+        cursor.execute("SELECT DISTINCT pt_category FROM permitType")
+        category_names = {row[0] for row in cursor.fetchall()} | {rule[0] for rule in rules if rule[0] is not None}
+        cursor.execute("SELECT l_lotkey FROM lot")
+        lot_keys = {row[0] for row in cursor.fetchall()} | {rule[2] for rule in rules if rule[2] is not None}
+
+        categories = {name: i + 1 for i, name in enumerate(sorted(category_names))}
+        zones = {zone_key: i for i, zone_key in enumerate(sorted(set(zone_types) | {rule[1] for rule in rules}))}
+        lots = {lot_key: i + 1 for i, lot_key in enumerate(sorted(lot_keys))}
+        zone_count, lot_count = len(zones), len(lots) + 1
+        masks = array('L', [0]) * ((len(categories) + 1) * zone_count * lot_count)
+
+        for category, zone_key, lot_key, start_hour, end_hour in rules:
+            hours = self._hours(start_hour, end_hour)
+            for category_index in ([categories[category]] if category is not None else range(len(categories) + 1)):
+                for lot_index in ([lots[lot_key]] if lot_key is not None else range(lot_count)):
+                    masks[(category_index * zone_count + zones[zone_key]) * lot_count + lot_index] |= hours
+
+        with self._lock:
+            self.categories = categories
+            self.zones = zones
+            self.lots = lots
+            self.zone_types = zone_types
+            self.masks = masks
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with pool.connection() as conn:
+                self.load(conn)
+
+    # -- Allowed hours for a category in a zone of a lot; 0 when no rule applies --
+    def hours(self, category, zone_key, lot_key):
+        self.ensure_loaded()
+        zone_index = self.zones.get(zone_key)
+        if zone_index is None:
+            return 0
+        lot_count = len(self.lots) + 1
+        return self.masks[(self.categories.get(category, 0) * len(self.zones) + zone_index) * lot_count
+                          + self.lots.get(lot_key, 0)]
+
+    def allows(self, category, zone_key, lot_key, hour):
+        return self.hours(category, zone_key, lot_key) >> hour & 1 == 1
+
+    # -- Zone types a category can use in at least one lot at some hour, in zone key order --
+    def accessible_zones(self, category):
+        self.ensure_loaded()
+        lot_count = len(self.lots) + 1
+        category_index = self.categories.get(category, 0)
+        accessible = []
+        for zone_key, zone_index in self.zones.items():
+            start = (category_index * len(self.zones) + zone_index) * lot_count
+            if any(self.masks[start:start + lot_count]) and zone_key in self.zone_types:
+                accessible.append(self.zone_types[zone_key])
+        return accessible
+
+    # -- When a vehicle parked at `at` stops being allowed: `at` itself, the end of its window, or None (never) --
+    def allowed_until(self, category, zone_key, lot_key, at):
+        hours = self.hours(category, zone_key, lot_key)
+        if hours == self.ALL_HOURS:
+            return None
+        if not hours >> at.hour & 1:
+            return at
+        boundary = at.replace(minute=0, second=0, microsecond=0)
+        for offset in range(1, 25):
+            if not hours >> (at.hour + offset) % 24 & 1:
+                return boundary + timedelta(hours=offset)
+        return None
+
+
+permissions = PermissionMatrix()
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- PARKING CONTEXT  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Per-user parking context: active permit, vehicle, category, accessible zones and current spot. --
+# Built from one permit query and one open-session query, then reused by the claim/unclaim engines and the
+# status endpoints until a permit change, claim, unclaim or enforcement invalidates it. An entry never
+# outlives its permit's expiration. Invalidations are also written to userInvalidation, which every worker
+# replays at most every PARKING_CONTEXT_SYNC_SECONDS, so a change made on one worker reaches the others'
+# copies within about a second; PARKING_CONTEXT_TTL bounds the rest (zone flips, a failed log write).
+class ParkingContextCache:
+    def __init__(self, capacity, ttl):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._synced_at = time.time()
+        self._next_sync = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _load(self, conn, user_key):
+        permit_result = store.permits.active_for_user(conn, user_key)
+        if not permit_result:
+            return {'has_permit': False, 'is_parked': False, 'accessible_zones': []}, self.ttl
+
+        permit_key, vehicle_key, permit_category, expiration = permit_result
+        context = {
+            'has_permit': True,
+            'permit_key': permit_key,
+            'vehicle_key': vehicle_key,
+            'permit_category': permit_category,
+            'permit_expiration': expiration,
+            'accessible_zones': permissions.accessible_zones(permit_category),
+            'is_parked': False
+        }
+
+        parking_result = store.sessions.current_for_vehicle(conn, vehicle_key)
+        if parking_result:
+            context.update({
+                'is_parked': True,
+                'spot': parking_result[0],
+                'lot': parking_result[1],
+                'zone': parking_result[2],
+                'arrival_time': parking_result[3]
+            })
+
+        try:
+            remaining = (datetime.fromisoformat(expiration) - campus_now()).total_seconds()
+        except (TypeError, ValueError):
+            remaining = self.ttl
+        return context, max(0.0, min(self.ttl, remaining))
+
+    # -- Cached context for a user, or None without counting a miss (the caller goes on to get(), which also --
+    # replays other workers' invalidations when they are due)
+    def peek(self, user_key):
+        if time.monotonic() >= self._next_sync:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._entries.move_to_end(user_key)
+            self.hits += 1
+            return entry[1]
+
+    # -- Cached context for a user, loading it on a miss or when `fresh`. Callers must treat the dict as read-only. --
+    def get(self, conn, user_key, fresh=False):
+        self._sync(conn)
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is not None and entry[0] > time.monotonic() and not fresh:
+                self._entries.move_to_end(user_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        context, ttl = self._load(conn, user_key)
+
+        with self._lock:
+            # An invalidation that raced with the load means the rows just read may already be stale
+            if generation == self._generation:
+                self._entries[user_key] = (time.monotonic() + ttl, context)
+                self._entries.move_to_end(user_key)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return context
+
+    # -- Evicts the users here and logs them for the other workers. Called after the change has committed, so --
+    # whatever another worker cached before the log row is written is evicted when it replays the row.
+    def invalidate(self, *user_keys):
+        self._evict(user_keys)
+        if not user_keys:
+            return
+        try:
+            with pool.connection() as conn, store.transaction(conn):
+                conn.executemany("INSERT INTO userInvalidation(ui_userkey, ui_at) VALUES(?, ?)",
+                                 [[user_key, time.time()] for user_key in user_keys])
+        except store.Error as error:
+            print(f"Parking context: invalidation not logged ({error}); other workers expire it within the TTL.")
+
+    def _evict(self, user_keys):
+        with self._lock:
+            self._generation += 1
+            for user_key in user_keys:
+                if self._entries.pop(user_key, None) is not None:
+                    self.invalidations += 1
+
+    # -- Evicts users invalidated on any worker since the last sync. Read by time with an overlap, like the --
+    # occupancy sync: keys from concurrent transactions do not commit in key order.
+    def _sync(self, conn):
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + app.config['PARKING_CONTEXT_SYNC_SECONDS']
+        started = time.time()
+        rows = conn.execute("SELECT DISTINCT ui_userkey FROM userInvalidation WHERE ui_at > ?",
+                            [self._synced_at - app.config['OCCUPANCY_SYNC_OVERLAP_SECONDS']]).fetchall()
+        self._synced_at = started
+        if rows:
+            self._evict([row[0] for row in rows])
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations
+            }
+
+
+parking_contexts = ParkingContextCache(app.config['PARKING_CONTEXT_SIZE'], app.config['PARKING_CONTEXT_TTL'])
+
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # --- MAP PAGE & API ENDPOINTS  ---
 # ----------------------------------------------------------------------------------------------------------------------
@@ -143,263 +1728,236 @@ def map_page():
 @app.route('/api/parking-data')
 @login_required
 def parking_data():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT s.s_num, s.s_latitude, s.s_longitude, s.s_status, s.s_isactive, z.z_type, l.l_name
-        FROM spots s
-        JOIN zone z ON s.s_zonekey = z.z_zonekey
-        JOIN lot l ON s.s_lotkey = l.l_lotkey
-        ORDER BY l.l_name, s.s_num
-    """)
-    
-    spots = []
-    for row in cursor.fetchall():
-        spots.append({
-            'spot_num': row[0],
-            'latitude': row[1],
-            'longitude': row[2],
-            'is_occupied': bool(row[3]),
-            'is_active': bool(row[4]),
-            'zone_type': row[5],
-            'lot_name': row[6]
-        })
-    
-    conn.close()
-    return jsonify(spots)
+    # Served from the in-memory occupancy index; no database round-trip per map load.
+    # ?since=<version> returns only the spots whose status, active flag or zone changed after that version.
+    version, payload = occupancy_payload(request.args.get('since', type=int))
+    etag = f'occ-{version}'
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Occupancy-Version'] = str(version)
+    return response
 
 
-# -- Claim spots depending on permit types --
-@app.route('/claim-spot/<spot_num>', methods=['POST'])
-@login_required
-def claim_spot(spot_num):
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-
-    # Get active permit
-    cursor.execute("""
-        SELECT p.p_permitkey, p.p_vehicleskey, pt.pt_category
-        FROM permit p
-        JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
-        WHERE p.p_userkey = ? AND p.p_expirationdate >= DATETIME('now', '-08:00')
-    """, [current_user.u_userkey])
-    
-    permit_result = cursor.fetchone()
-    if not permit_result:
-        conn.close()
-        return jsonify({'success': False, 'message': 'You do not have an active permit.'}), 403
-    
-    permit_key, vehicle_key, permit_category = permit_result
+def occupancy_payload(since=None):
+    if since is None:
+        return occupancy.payload()
+    return occupancy.changes_since(since)
 
-    # Check if already parked (defensive - UI should prevent this)
-    cursor.execute("""
-        SELECT COUNT(*) FROM parkingHistory ph
-        WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
-    """, [vehicle_key])
-    
-    if cursor.fetchone()[0] > 0:
-        conn.close()
-        return jsonify({'success': False, 'message': 'You are already parked elsewhere.'}), 400
-
-    # Get spot details
-    cursor.execute("""
-        SELECT s.s_spotskey, s.s_status, s.s_isactive, s.s_zonekey, s.s_lotkey, z.z_type, l.l_name
-        FROM spots s
-        JOIN zone z ON s.s_zonekey = z.z_zonekey
-        JOIN lot l ON s.s_lotkey = l.l_lotkey
-        WHERE s.s_num = ?
-    """, [spot_num])
-    
-    spot_result = cursor.fetchone()
-    if not spot_result:
-        conn.close()
-        return jsonify({'success': False, 'message': 'Spot not found.'}), 404
-    
-    spot_key, is_occupied, is_active, spot_zone_key, lot_key, spot_zone_type, lot_name = spot_result
-    
-    # Check spot availability
-    if is_occupied:
-        conn.close()
-        return jsonify({'success': False, 'message': 'This spot is already occupied.'}), 400
-    
-    if not is_active:
-        conn.close()
-        return jsonify({'success': False, 'message': 'This spot is currently inactive.'}), 400
-
-    # Check if zone is active in this lot (uses zoneAssignment junction table)
-    cursor.execute("""
-        SELECT za_isactive FROM zoneAssignment
-        WHERE za_lotkey = ? AND za_zonekey = ?
-    """, [lot_key, spot_zone_key])
-
-    assignment = cursor.fetchone()
-    if not assignment or not assignment[0]:
-        conn.close()
-        return jsonify({
-            'success': False,
-            'message': f'Parking in {spot_zone_type} Zone of {lot_name} is currently suspended.'
-        }), 403
-
-    # Check permit permissions
-    can_park = (
-        spot_zone_type == 'Green' or
-        (spot_zone_type == 'Gold' and permit_category == 'Faculty') or
-        (spot_zone_type == 'H' and permit_category == 'On-Campus Student')
-    )
-    
-    if not can_park:
-        conn.close()
-        return jsonify({
-            'success': False, 
-            'message': f'Your {permit_category} permit does not allow parking in {spot_zone_type} Zone.'
-        }), 403
-    
-    # Claim the spot (uses parkingHistory junction table)
-    cursor.execute("SELECT MAX(ph_parkinghistkey) FROM parkingHistory")
-    new_history_key = (cursor.fetchone()[0] or 0) + 1
-    
-    cursor.execute("""
-        INSERT INTO parkingHistory(ph_parkinghistkey, ph_vehicleskey, ph_spotskey, 
-                                   ph_arrivaltime, ph_departuretime)
-        VALUES(?, ?, ?, DATETIME('now', '-08:00'), NULL)
-    """, [new_history_key, vehicle_key, spot_key])
-    
-    cursor.execute("UPDATE spots SET s_status = 1 WHERE s_spotskey = ?", [spot_key])
-    
-    conn.commit()
-    conn.close()
 
-    return jsonify({
-        'success': True, 
+# -- Server-Sent Events stream of claim, unclaim, enforcement, zone-flip, sensor and sync events --
+@app.route('/api/parking-events')
+@login_required
+def parking_events():
+    last_seq = request.headers.get('Last-Event-ID', type=int)
+    occupancy.start_sync()
+
+    def stream(last_seq):
+        current = events.subscribe()
+        if last_seq is None or last_seq > current:
+            last_seq = current
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                pending = events.wait(last_seq, timeout=15)
+                if not pending:
+                    # Heartbeat keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                for seq, _, event_type, data in pending:
+                    last_seq = seq
+                    yield f'id: {seq}\nevent: {event_type}\ndata: {data}\n\n'
+        finally:
+            events.unsubscribe()
+
+    response = app.response_class(stream(last_seq), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# -- Claim engine: checks eligibility and reserves the spot inside one short write transaction. --
+# Returns (payload, status) so the route and load tools share the exact same code path.
+def claim_spot_for_user(conn, user_key, spot_num):
+    # Permit and current spot come from the cached context; the open-session check below stays authoritative.
+    # A cached refusal may predate a new permit or an unclaim on another worker, so only a fresh read refuses.
+    context = parking_contexts.get(conn, user_key)
+    if not context['has_permit'] or context['is_parked']:
+        context = parking_contexts.get(conn, user_key, fresh=True)
+    if not context['has_permit']:
+        return {'success': False, 'message': 'You do not have an active permit.'}, 403
+    if context['is_parked']:
+        return {'success': False, 'message': 'You are already parked elsewhere.'}, 400
+
+    vehicle_key = context['vehicle_key']
+    permit_category = context['permit_category']
+
+    # No other claim can interleave between the checks and the reservation: SQLite takes its write lock up
+    # front, PostgreSQL locks the vehicle row and then the spot row
+    with store.transaction(conn):
+        store.vehicles.lock(conn, vehicle_key)
+
+        # Check if already parked (defensive - UI should prevent this)
+        if store.sessions.has_open(conn, vehicle_key):
+            return {'success': False, 'message': 'You are already parked elsewhere.'}, 400
+
+        # Get spot details together with its zone activation in this lot
+        spot_result = store.spots.for_claim(conn, spot_num)
+        if not spot_result:
+            return {'success': False, 'message': 'Spot not found.'}, 404
+
+        spot_key, is_occupied, is_active, zone_key, lot_key, spot_zone_type, lot_name, zone_active = spot_result
+
+        # Check spot availability
+        if is_occupied:
+            return {'success': False, 'message': 'This spot is already occupied.'}, 400
+
+        if not is_active:
+            return {'success': False, 'message': 'This spot is currently inactive.'}, 400
+
+        # Check if zone is active in this lot (uses zoneAssignment junction table)
+        if not zone_active:
+            return {
+                'success': False,
+                'message': f'Parking in {spot_zone_type} Zone of {lot_name} is currently suspended.'
+            }, 403
+
+        # Check permit permissions
+        if not permissions.allows(permit_category, zone_key, lot_key, campus_now().hour):
+            return {
+                'success': False,
+                'message': f'Your {permit_category} permit does not allow parking in {spot_zone_type} Zone.'
+            }, 403
+
+        # Reserve the spot only if it is still free; a lost race shows up as zero affected rows
+        if not store.spots.reserve(conn, spot_key):
+            return {'success': False, 'message': 'This spot is already occupied.'}, 400
+
+        # Claim the spot (uses parkingHistory junction table)
+        store.sessions.start(conn, vehicle_key, spot_key)
+
+    parking_contexts.invalidate(user_key)
+    occupancy.set_status(spot_key, 1)
+    publish_spot_event('claim', [spot_key])
+    enforcer.track_vehicle(conn, vehicle_key)
+
+    return {
+        'success': True,
         'message': f'Successfully claimed spot {spot_num} in {lot_name}!',
         'spot': spot_num,
         'lot': lot_name,
         'zone': spot_zone_type
-    })
+    }, 200
+
+
+# -- Unclaim engine: closes the open session and frees its spot in one write transaction. --
+def unclaim_spot_for_user(conn, user_key):
+    # Get user's vehicle; as in the claim engine, only a fresh read refuses
+    context = parking_contexts.get(conn, user_key)
+    if not context['has_permit']:
+        context = parking_contexts.get(conn, user_key, fresh=True)
+    if not context['has_permit']:
+        return {'success': False, 'message': 'You do not have an active permit.'}, 403
+
+    vehicle_key = context['vehicle_key']
+
+    with store.transaction(conn):
+        store.vehicles.lock(conn, vehicle_key)
+
+        # Find current parking spot
+        parking_result = store.sessions.open_for_vehicle(conn, vehicle_key)
+        if not parking_result:
+            return {'success': False, 'message': 'You are not currently parked anywhere.'}, 400
+
+        history_key, spot_key, spot_num, lot_name = parking_result
+
+        # Unclaim
+        store.sessions.close(conn, history_key)
+        store.spots.free(conn, spot_key)
+
+    parking_contexts.invalidate(user_key)
+    occupancy.set_status(spot_key, 0)
+    publish_spot_event('unclaim', [spot_key])
+    enforcer.forget_session(history_key)
+
+    return {
+        'success': True,
+        'message': f'Successfully unclaimed spot {spot_num} in {lot_name}.',
+        'spot': spot_num,
+        'lot': lot_name
+    }, 200
+
+
+# -- Claim spots depending on permit types --
+@app.route('/claim-spot/<spot_num>', methods=['POST'])
+@login_required
+def claim_spot(spot_num):
+    payload, status = claim_spot_for_user(get_db(), current_user.u_userkey, spot_num)
+    return jsonify(payload), status
 
 
 # -- Unclaim spots --
 @app.route('/unclaim-spot', methods=['POST'])
 @login_required
 def unclaim_spot():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-    
-    # Get user's vehicle
-    cursor.execute("""
-        SELECT p.p_vehicleskey FROM permit p
-        WHERE p.p_userkey = ? AND p.p_expirationdate >= DATETIME('now', '-08:00')
-    """, [current_user.u_userkey])
-    
-    permit_result = cursor.fetchone()
-    if not permit_result:
-        conn.close()
-        return jsonify({'success': False, 'message': 'You do not have an active permit.'}), 403
-    
-    vehicle_key = permit_result[0]
-    
-    # Find current parking spot
-    cursor.execute("""
-        SELECT ph.ph_parkinghistkey, ph.ph_spotskey, s.s_num, l.l_name
-        FROM parkingHistory ph
-        JOIN spots s ON ph.ph_spotskey = s.s_spotskey
-        JOIN lot l ON s.s_lotkey = l.l_lotkey
-        WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
-    """, [vehicle_key])
-    
-    parking_result = cursor.fetchone()
-    if not parking_result:
-        conn.close()
-        return jsonify({'success': False, 'message': 'You are not currently parked anywhere.'}), 400
-    
-    history_key, spot_key, spot_num, lot_name = parking_result
-    
-    # Unclaim
-    cursor.execute("""
-        UPDATE parkingHistory SET ph_departuretime = DATETIME('now', '-08:00')
-        WHERE ph_parkinghistkey = ?
-    """, [history_key])
-    
-    cursor.execute("UPDATE spots SET s_status = 0 WHERE s_spotskey = ?", [spot_key])
-    
-    conn.commit()
-    conn.close()
-    
-    return jsonify({
-        'success': True, 
-        'message': f'Successfully unclaimed spot {spot_num} in {lot_name}.',
-        'spot': spot_num,
-        'lot': lot_name
-    })
+    payload, status = unclaim_spot_for_user(get_db(), current_user.u_userkey)
+    return jsonify(payload), status
 
 
 # -- Check if a user is currently parked --
 @app.route('/my-parking-status')
 @login_required
 def my_parking_status():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-    
-    # Check for active permit
-    cursor.execute("""
-        SELECT p.p_vehicleskey FROM permit p
-        WHERE p.p_userkey = ? AND p.p_expirationdate >= DATETIME('now', '-08:00')
-    """, [current_user.u_userkey])
-    
-    permit_result = cursor.fetchone()
-    if not permit_result:
-        conn.close()
-        return jsonify({'has_permit': False, 'is_parked': False})
-    
-    vehicle_key = permit_result[0]
-    
-    # Check if currently parked
-    cursor.execute("""
-        SELECT s.s_num, l.l_name, z.z_type, ph.ph_arrivaltime
-        FROM parkingHistory ph
-        JOIN spots s ON ph.ph_spotskey = s.s_spotskey
-        JOIN lot l ON s.s_lotkey = l.l_lotkey
-        JOIN zone z ON s.s_zonekey = z.z_zonekey
-        WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
-    """, [vehicle_key])
-    
-    parking_result = cursor.fetchone()
-    conn.close()
-    
-    if parking_result:
-        return jsonify({
+    return jsonify(parking_status_payload(parking_contexts.get(get_db(), current_user.u_userkey)))
+
+
+# -- Response bodies built from a parking context, shared with the ASGI fast path in asgi.py --
+def parking_status_payload(context):
+    if not context['has_permit']:
+        return {'has_permit': False, 'is_parked': False}
+
+    if context['is_parked']:
+        return {
             'has_permit': True,
             'is_parked': True,
-            'spot': parking_result[0],
-            'lot': parking_result[1],
-            'zone': parking_result[2],
-            'arrival_time': parking_result[3]
-        })
-    
-    return jsonify({'has_permit': True, 'is_parked': False})
+            'spot': context['spot'],
+            'lot': context['lot'],
+            'zone': context['zone'],
+            'arrival_time': context['arrival_time']
+        }
+
+    return {'has_permit': True, 'is_parked': False}
+
+
+def accessible_zones_payload(context):
+    if not context['has_permit']:
+        return {'has_permit': False, 'accessible_zones': []}
+
+    return {
+        'has_permit': True,
+        'permit_category': context['permit_category'],
+        'accessible_zones': context['accessible_zones']
+    }
 
 
 # -- Check which zones are available (zoneAssignments).
 @app.route('/api/zone-status')
 @login_required
 def zone_status():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-    
-    # Query zoneAssignment junction table
-    cursor.execute("""
-        SELECT l.l_lotkey, l.l_name, z.z_zonekey, z.z_type, za.za_isactive
-        FROM lot l
-        LEFT JOIN zoneAssignment za ON l.l_lotkey = za.za_lotkey
-        LEFT JOIN zone z ON za.za_zonekey = z.z_zonekey
-        ORDER BY l.l_lotkey, z.z_zonekey
-    """)
-    
-    results = cursor.fetchall()
-    conn.close()
+    return jsonify({'lots': zone_status_lots(get_db())})
+
+
+# -- Lots with their zone activations, shared by /api/zone-status and /api/my-context --
+def zone_status_lots(conn):
+    # Query zoneAssignment junction table, from the reference snapshot when it is on
+    with reference_tables.connection(conn) as reference:
+        results = store.zones.assignments(reference)
     
-    # Organize by lot
+    # Organize by lot; spot counts come from the occupancy counters, not a scan of spots
+    counts = occupancy.zone_counts()
     lots_dict = {}
     for row in results:
         lot_key, lot_name, zone_key, zone_type, is_active = row
@@ -412,54 +1970,239 @@ def zone_status():
             }
         
         if zone_key is not None:
+            counter = counts.get((lot_key, zone_key), {})
             lots_dict[lot_key]['zones'].append({
                 'zone_key': zone_key,
                 'zone_type': zone_type,
-                'is_active': bool(is_active)
+                'is_active': bool(is_active),
+                'spots': counter.get('spots', 0),
+                'occupied': counter.get('occupied', 0),
+                'available': counter.get('available', 0)
             })
     
-    return jsonify({'lots': list(lots_dict.values())})
+    return list(lots_dict.values())
 
 
 # -- Check which zones a specific user can park in from permit types --
 @app.route('/api/my-accessible-zones')
 @login_required
 def my_accessible_zones():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-    
-    # Get user's permit category
-    cursor.execute("""
-        SELECT pt.pt_category
-        FROM permit p
-        JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
-        WHERE p.p_userkey = ? AND p.p_expirationdate >= DATETIME('now', '-08:00')
-    """, [current_user.u_userkey])
-    
-    permit_result = cursor.fetchone()
-    if not permit_result:
-        conn.close()
-        return jsonify({'has_permit': False, 'accessible_zones': []})
-    
-    permit_category = permit_result[0]
-    
-    # Determine accessible zones
-    if permit_category == 'Faculty':
-        accessible_zones = ['Green', 'Gold']
-    elif permit_category == 'On-Campus Student':
-        accessible_zones = ['Green', 'H']
-    else:
-        accessible_zones = ['Green']
-    
-    conn.close()
-    
+    return jsonify(accessible_zones_payload(parking_contexts.get(get_db(), current_user.u_userkey)))
+
+
+# -- Everything the map page needs about the user in one call: permit, accessible zones, current spot, zone status --
+@app.route('/api/my-context')
+@login_required
+def my_context():
+    conn = get_db()
+    context = parking_contexts.get(conn, current_user.u_userkey)
+    payload = {key: value for key, value in context.items() if key not in ('permit_key', 'vehicle_key')}
+    payload['lots'] = zone_status_lots(conn)
+    return jsonify(payload)
+
+
+
+# -- Spots, occupied and available per lot and zone, with l_capacity next to the real spot count --
+@app.route('/api/lot-occupancy')
+@login_required
+def lot_occupancy():
+    return jsonify({'lots': occupancy.lot_counts()})
+
+
+# -- The k closest free spots the user's permit allows right now, nearest first --
+@app.route('/api/nearest-spots')
+@login_required
+def nearest_spots():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    k = request.args.get('k', 5, type=int)
+    if lat is None or lon is None or not 1 <= k <= 100:
+        return jsonify({'success': False, 'message': 'lat and lon are required and k must be 1 to 100.'}), 400
+
+    context = parking_contexts.get(get_db(), current_user.u_userkey)
+    if not context['has_permit']:
+        return jsonify({'success': False, 'message': 'You do not have an active permit.'}), 403
+
+    category = context['permit_category']
+    hour = campus_now().hour
+    allowed = {}
+
+    # Runs under the occupancy lock, so it reads the same free/active/zone state a claim would see
+    def accept(i):
+        if occupancy.statuses[i] or not occupancy.actives[i]:
+            return False
+        zone_lot = (occupancy.zone_keys[i], occupancy.lot_keys[i])
+        if zone_lot not in allowed:
+            allowed[zone_lot] = permissions.allows(category, zone_lot[0], zone_lot[1], hour)
+        return allowed[zone_lot]
+
+    permissions.ensure_loaded()
+    nearest = spot_grid.nearest(lat, lon, k, accept)
+
+    return jsonify({'spots': [{
+        'spot_num': occupancy.spot_nums[i],
+        'lot_name': occupancy.lot_names.get(occupancy.lot_keys[i]),
+        'zone_type': occupancy.zone_types.get(occupancy.zone_keys[i]),
+        'latitude': occupancy.latitudes[i],
+        'longitude': occupancy.longitudes[i],
+        'distance_m': round(distance, 1)
+    } for distance, i in nearest]})
+
+
+
+# -- Monitoring endpoints answer requests carrying X-Monitoring-Token = MONITORING_TOKEN. Without a token --
+# configured, only direct requests from this host: anything a proxy forwarded (X-Forwarded-For) is refused.
+def monitoring_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = app.config['MONITORING_TOKEN']
+        if token:
+            allowed = hmac.compare_digest(request.headers.get('X-Monitoring-Token', ''), token)
+        else:
+            allowed = (request.remote_addr in ('127.0.0.1', '::1')
+                       and 'X-Forwarded-For' not in request.headers)
+        if not allowed:
+            return jsonify({'success': False, 'message': 'Monitoring access denied.'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# -- Prometheus scrape target: request latency histograms, SQL statement counters and pool gauges --
+@app.route('/metrics')
+@monitoring_required
+def metrics_endpoint():
+    stats = pool.stats()
+    hashing = password_hasher.stats()
+    sensors = sensor_ingest.stats()
+    snapshot = reference_tables.stats()
+    body = metrics.render([
+        ('parking_db_pool_in_use', 'gauge', 'Connections checked out of the pool.', stats['in_use']),
+        ('parking_db_pool_waits_total', 'counter', 'Checkouts that waited for a free connection.', stats['waits']),
+        ('parking_occupancy_version', 'gauge', 'Current occupancy index version.', occupancy.version),
+        ('parking_password_queue_depth', 'gauge', 'Password hashes queued or running.', hashing['queue_depth']),
+        ('parking_password_rejected_total', 'counter', 'Logins and sign-ups refused with a full queue.',
+         hashing['rejected']),
+        ('parking_sensor_events_total', 'counter', 'Sensor reports received.', sensors['received']),
+        ('parking_sensor_applied_total', 'counter', 'Spot status changes applied from sensors.', sensors['applied']),
+        ('parking_sensor_pending_spots', 'gauge', 'Spots with a sensor report not yet committed.', sensors['pending_spots']),
+        ('parking_sensor_throttled_total', 'counter', 'Sensor batches refused with 429.', sensors['throttled_batches']),
+        ('parking_sensor_ingest_lag_seconds', 'gauge', 'Receive-to-commit delay of the last flush.',
+         sensors['last_ingest_lag_seconds']),
+        ('parking_reference_snapshot_staleness_seconds', 'gauge',
+         'Seconds since the reference table snapshot was last known current.', snapshot['staleness_seconds']),
+        ('parking_reference_snapshot_refreshes_total', 'counter', 'Reference table snapshot recopies.',
+         snapshot['refreshes'])
+    ])
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+# -- Connection pool statistics for monitoring --
+@app.route('/api/db-pool-stats')
+@monitoring_required
+def db_pool_stats():
+    return jsonify(pool.stats())
+
+
+# -- Reference table snapshot freshness and refresh counts --
+@app.route('/api/reference-snapshot-stats')
+@monitoring_required
+def reference_snapshot_stats():
+    return jsonify(reference_tables.stats())
+
+
+# -- Password pool queue depth, rejections and rehashes --
+@app.route('/api/password-hasher-stats')
+@monitoring_required
+def password_hasher_stats():
+    return jsonify(password_hasher.stats())
+
+
+# -- User cache hit/miss counters --
+@app.route('/api/user-cache-stats')
+@monitoring_required
+def user_cache_stats():
+    return jsonify(user_cache.stats())
+
+
+# -- Parking context cache hit/miss counters --
+@app.route('/api/parking-context-stats')
+@monitoring_required
+def parking_context_stats():
+    return jsonify(parking_contexts.stats())
+
+
+# -- Zone schedule transitions and the next window boundary --
+@app.route('/api/zone-schedule-stats')
+@monitoring_required
+def zone_schedule_stats():
+    return jsonify(zone_schedule.stats())
+
+
+# -- Enforcement queue depth and lag behind deadlines --
+@app.route('/api/enforcer-stats')
+@monitoring_required
+def enforcer_stats():
+    return jsonify(enforcer.stats())
+
+
+# -- Sensor ingestion buffer, coalescing and ingest lag --
+@app.route('/api/sensor-stats')
+@monitoring_required
+def sensor_stats():
+    return jsonify(sensor_ingest.stats())
+
+
+
+# -- Capacity planning from the history archive: average vehicles per lot by hour of day --
+@app.route('/api/history/hourly-occupancy')
+@login_required
+def history_hourly_occupancy():
+    start, end = history_range()
+    if start is None:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates.'}), 400
+    occupancy.ensure_loaded()
+    occupancy_by_lot = history_archive.hourly_occupancy(start, end)
     return jsonify({
-        'has_permit': True,
-        'permit_category': permit_category,
-        'accessible_zones': accessible_zones
+        'start': start,
+        'end': end,
+        'lots': [{
+            'lot_key': lot_key,
+            'lot_name': occupancy.lot_names.get(lot_key),
+            'hourly_average': hours
+        } for lot_key, hours in sorted(occupancy_by_lot.items(), key=lambda item: (item[0] is None, item[0]))]
+    })
+
+
+# -- Capacity planning from the history archive: average dwell time per zone --
+@app.route('/api/history/dwell-by-zone')
+@login_required
+def history_dwell_by_zone():
+    start, end = history_range()
+    if start is None:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates.'}), 400
+    occupancy.ensure_loaded()
+    dwell = history_archive.dwell_by_zone(start, end)
+    return jsonify({
+        'start': start,
+        'end': end,
+        'zones': [dict(zone_key=zone_key, zone_type=occupancy.zone_types.get(zone_key), **stats)
+                  for zone_key, stats in sorted(dwell.items(), key=lambda item: (item[0] is None, item[0]))]
     })
 
 
+# -- ?start=YYYY-MM-DD&end=YYYY-MM-DD, defaulting to the last 30 days --
+def history_range():
+    today = campus_now().date()
+    start = request.args.get('start') or (today - timedelta(days=30)).isoformat()
+    end = request.args.get('end') or (today + timedelta(days=1)).isoformat()
+    try:
+        datetime.fromisoformat(start)
+        datetime.fromisoformat(end)
+    except ValueError:
+        return None, None
+    return start, end
+
+
 
 # ----------------------------------------------------------------------------------------------------------------------
 # --- VEHICLE MANAGEMENT  ---
@@ -469,43 +2212,31 @@ def my_accessible_zones():
 @app.route('/view_vehicles', methods=['GET', 'POST'])
 @login_required
 def view_vehicles():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
+    conn = get_db()
     error = None
     
     # Handle DELETE
     if request.method == 'POST':
-        vehicle_key = request.form.get('vehicle_key')
+        vehicle_key = request.form.get('vehicle_key', type=int)
         
         if vehicle_key:
-            # Check if vehicle has active permit
-            cursor.execute("""
-                SELECT COUNT(*) FROM permit 
-                WHERE p_vehicleskey = ? AND p_expirationdate >= DATETIME('now', '-08:00')
-            """, [vehicle_key])
-            
-            if cursor.fetchone()[0] > 0:
-                error = "Cannot delete this vehicle. It is connected to an active permit."
-            else:
-                # Delete (ownership enforced in WHERE clause)
-                cursor.execute("""
-                    DELETE FROM vehicles 
-                    WHERE v_vehicleskey = ? AND v_userkey = ?
-                """, [vehicle_key, current_user.u_userkey])
-                
-                if cursor.rowcount > 0:
-                    conn.commit()
-                else:
-                    error = "Invalid vehicle selection."
+            try:
+                with store.transaction(conn):
+                    # Check if vehicle has active permit
+                    if store.permits.vehicle_has_active(conn, vehicle_key):
+                        error = "Cannot delete this vehicle. It is connected to an active permit."
+                    # Delete (ownership enforced in WHERE clause)
+                    elif not store.vehicles.delete(conn, vehicle_key, current_user.u_userkey):
+                        error = "Invalid vehicle selection."
+            except store.IntegrityError:
+                # Only where foreign keys are enforced (PostgreSQL): expired permits and past sessions keep it
+                error = "Cannot delete this vehicle. Its permit or parking history still refers to it."
+
+            if error is None:
+                parking_contexts.invalidate(current_user.u_userkey)
     
     # Display vehicles
-    cursor.execute("""
-        SELECT v_vehicleskey, v_plateno, v_platestate, v_maker, v_model, v_color
-        FROM vehicles WHERE v_userkey = ?
-        ORDER BY v_vehicleskey DESC
-    """, [current_user.u_userkey])
-    vehicles = cursor.fetchall()
-    conn.close()
+    vehicles = store.vehicles.for_user(conn, current_user.u_userkey)
     
     return render_template("view_vehicles.html", vehicles=vehicles, error=error, username=current_user.username)
 
@@ -527,29 +2258,22 @@ def reg_vehicle():
     if not all([plate_no, plate_state, maker, model, color]):
         return render_template('reg_vehicle.html', error="All fields are required.", username=current_user.username)
     
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
+    conn = get_db()
     
     # Check for duplicate plate
-    cursor.execute("SELECT v_userkey FROM vehicles WHERE v_plateno = ?", [plate_no])
-    existing = cursor.fetchone()
+    owner = store.vehicles.plate_owner(conn, plate_no)
     
-    if existing:
-        conn.close()
-        error = "You already have a vehicle with this plate." if existing[0] == current_user.u_userkey else "This plate is already registered."
+    if owner is not None:
+        error = "You already have a vehicle with this plate." if owner == current_user.u_userkey else "This plate is already registered."
         return render_template('reg_vehicle.html', error=error, username=current_user.username)
     
-    # Insert vehicle
-    cursor.execute("SELECT MAX(v_vehicleskey) FROM vehicles")
-    new_key = (cursor.fetchone()[0] or 0) + 1
-    
-    cursor.execute("""
-        INSERT INTO vehicles(v_vehicleskey, v_userkey, v_plateno, v_platestate, v_maker, v_model, v_color)
-        VALUES(?, ?, ?, ?, ?, ?, ?)
-    """, [new_key, current_user.u_userkey, plate_no, plate_state, maker, model, color])
-    
-    conn.commit()
-    conn.close()
+    # Insert vehicle; the database assigns the key, and the unique plate index catches a registration that raced us
+    try:
+        with store.transaction(conn):
+            store.vehicles.register(conn, current_user.u_userkey, plate_no, plate_state, maker, model, color)
+    except store.IntegrityError:
+        return render_template('reg_vehicle.html', error="This plate is already registered.",
+                               username=current_user.username)
     
     return redirect(url_for('view_vehicles'))
 
@@ -563,47 +2287,27 @@ def reg_vehicle():
 @app.route('/view_permit', methods=['GET', 'POST'])
 @login_required
 def view_permit():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
+    conn = get_db()
     error = None
     
     # Handle DELETE
     if request.method == 'POST':
-        permit_key = request.form.get('permit_key')
+        permit_key = request.form.get('permit_key', type=int)
         
         if permit_key:
-            # Check if vehicle is currently parked
-            cursor.execute("""
-                SELECT COUNT(*) FROM parkingHistory ph
-                JOIN permit p ON ph.ph_vehicleskey = p.p_vehicleskey
-                WHERE p.p_permitkey = ? AND p.p_userkey = ? AND ph.ph_departuretime IS NULL
-            """, [permit_key, current_user.u_userkey])
-
-            if cursor.fetchone()[0] > 0:
-                error = "Cannot delete this permit. The associated vehicle is currently parked."
-            else:
+            with store.transaction(conn):
+                # Check if vehicle is currently parked
+                if store.sessions.open_under_permit(conn, permit_key, current_user.u_userkey):
+                    error = "Cannot delete this permit. The associated vehicle is currently parked."
                 # Delete (ownership enforced in WHERE clause)
-                cursor.execute("""
-                    DELETE FROM permit WHERE p_permitkey = ? AND p_userkey = ?
-                """, [permit_key, current_user.u_userkey])
-                
-                if cursor.rowcount > 0:
-                    conn.commit()
-                else:
+                elif not store.permits.delete(conn, permit_key, current_user.u_userkey):
                     error = "Invalid permit selection."
+
+            if error is None:
+                parking_contexts.invalidate(current_user.u_userkey)
     
     # Display permits
-    cursor.execute("""
-        SELECT p.p_permitkey, v.v_plateno, v.v_maker, v.v_model, v.v_color,
-               pt.pt_category, pt.pt_duration, p.p_permitnum, 
-               p.p_issuedate, p.p_expirationdate
-        FROM permit p
-        JOIN permitType pt ON pt.pt_permittypekey = p.p_permittypekey
-        JOIN vehicles v ON p.p_vehicleskey = v.v_vehicleskey
-        WHERE p.p_userkey = ? AND p.p_expirationdate >= DATETIME('now', '-08:00')
-    """, [current_user.u_userkey])
-    permits = cursor.fetchall()
-    conn.close()
+    permits = store.permits.list_active_for_user(conn, current_user.u_userkey)
     
     return render_template('view_permit.html', permits=permits, has_permit=len(permits) > 0, 
                          error=error, username=current_user.username)
@@ -613,80 +2317,195 @@ def view_permit():
 @app.route('/apply_permit', methods=['GET', 'POST'])
 @login_required
 def apply_permit():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
+    conn = get_db()
+    error = None
     
-    if request.method == 'GET':
-        # Get user's vehicles
-        cursor.execute("""
-            SELECT v_vehicleskey, v_plateno, v_maker, v_model
-            FROM vehicles WHERE v_userkey = ?
-            ORDER BY v_vehicleskey DESC
-        """, [current_user.u_userkey])
-        vehicles = cursor.fetchall()
+    if request.method == 'POST':
+        # Process application
+        vehicle_key = request.form.get('vehicle_key', type=int)
+        permit_type_key = request.form.get('permit_type_key', type=int)
         
-        # Get permit types
-        cursor.execute("""
-            SELECT pt_permittypekey, pt_category, pt_duration 
-            FROM permitType
-            ORDER BY 
-                CASE pt_category
-                    WHEN 'Faculty' THEN 1
-                    WHEN 'On-Campus Student' THEN 2
-                    WHEN 'Off-Campus Student' THEN 3
-                    WHEN 'Guest' THEN 4
-                END,
-                CASE pt_duration
-                    WHEN 'Yearly' THEN 1
-                    WHEN 'Semester' THEN 2
-                    WHEN 'Daily' THEN 3
-                    WHEN 'Hourly' THEN 4
-                END
-        """)
-        permit_types = cursor.fetchall()
-        conn.close()
+        # Key, permit number and expiration are all assigned in one transaction
+        with store.transaction(conn):
+            permit_key = store.permits.issue(conn, current_user.u_userkey, vehicle_key, permit_type_key)
         
-        return render_template('apply_permit.html', vehicles=vehicles, permit_types=permit_types, 
-                             username=current_user.username)
-    
-    # Process application
-    vehicle_key = request.form.get('vehicle_key')
-    permit_type_key = request.form.get('permit_type_key')
-    
-    # Get permit duration
-    cursor.execute("SELECT pt_duration FROM permitType WHERE pt_permittypekey = ?", [permit_type_key])
-    permit_duration = cursor.fetchone()[0]
-    
-    # Calculate expiration
-    expiration_map = {
-        'Yearly': '2026-05-19',
-        'Semester': '2025-12-23',
-        'Daily': "DATETIME('now', '-08:00', '+1 day')",
-        'Hourly': "DATETIME('now', '-08:00', '+1 hour')"
-    }
-    expiration = expiration_map[permit_duration]
-    
-    # Generate permit
-    cursor.execute("SELECT MAX(p_permitkey) FROM permit")
-    new_key = (cursor.fetchone()[0] or 0) + 1
-    permit_num = f'PRM{new_key:04d}'
+        if permit_key is not None:
+            parking_contexts.invalidate(current_user.u_userkey)
+
+            # A parked vehicle picks up the new permit's expiration as an enforcement deadline
+            enforcer.track_vehicle(conn, vehicle_key)
+            
+            return redirect(url_for('view_permit'))
+        error = "Invalid permit type."
     
-    # Insert
-    if permit_duration in ['Yearly', 'Semester']:
-        cursor.execute("""
-            INSERT INTO permit(p_permitkey, p_userkey, p_vehicleskey, p_permittypekey, p_permitnum, p_issuedate, p_expirationdate)
-            VALUES(?, ?, ?, ?, ?, DATETIME('now', '-08:00'), ?)
-        """, [new_key, current_user.u_userkey, vehicle_key, permit_type_key, permit_num, expiration])
-    else:
-        cursor.execute(f"""
-            INSERT INTO permit(p_permitkey, p_userkey, p_vehicleskey, p_permittypekey, p_permitnum, p_issuedate, p_expirationdate)
-            VALUES(?, ?, ?, ?, ?, DATETIME('now', '-08:00'), {expiration})
-        """, [new_key, current_user.u_userkey, vehicle_key, permit_type_key, permit_num])
+    # Get user's vehicles
+    vehicles = store.vehicles.for_user(conn, current_user.u_userkey)
     
-    conn.commit()
-    conn.close()
+    # Get permit types
+    with reference_tables.connection(conn) as reference:
+        permit_types = store.permits.types(reference)
     
-    return redirect(url_for('view_permit'))
+    return render_template('apply_permit.html', vehicles=vehicles, permit_types=permit_types, error=error,
+                         username=current_user.username)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- PARKING HISTORY ARCHIVE  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Closed sessions partitioned into one SQLite file per arrival month (ARCHIVE_DIR/history-YYYY-MM.sqlite). --
+# Rows are stored with the lot and zone they were parked in and precomputed hour/dwell columns, so the
+# analytics below are plain indexed aggregates and only the months in the requested range are opened.
+class HistoryArchive:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            ph_parkinghistkey integer PRIMARY KEY,
+            ph_vehicleskey integer not null,
+            ph_spotskey integer not null,
+            ph_lotkey integer,
+            ph_zonekey integer,
+            ph_arrivaltime DATETIME,
+            ph_departuretime DATETIME,
+            ph_arrivalhour integer,
+            ph_departurehour integer,
+            ph_dwellminutes REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_lot ON sessions(ph_arrivaltime, ph_lotkey, ph_arrivalhour, ph_departurehour);
+        CREATE INDEX IF NOT EXISTS idx_sessions_zone ON sessions(ph_arrivaltime, ph_zonekey, ph_dwellminutes);
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, month):
+        return os.path.join(self.directory, f'history-{month}.sqlite')
+
+    def months(self, start=None, end=None):
+        if not os.path.isdir(self.directory):
+            return []
+        found = sorted(name[len('history-'):-len('.sqlite')] for name in os.listdir(self.directory)
+                       if name.startswith('history-') and name.endswith('.sqlite'))
+        return [month for month in found
+                if (start is None or month >= start[:7]) and (end is None or month <= end[:7])]
+
+    def _open(self, month):
+        conn = sqlite3.connect(self.path_for(month), timeout=app.config['DB_BUSY_TIMEOUT_MS'] / 1000)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    # -- rows: (key, vehicle, spot, lot, zone, arrival, departure). INSERT OR IGNORE makes re-archiving a no-op. --
+    # Returns the keys of the rows now in the archive, read back after the insert. Left out: rows whose times do
+    # not parse (they have no month to go to) and rows whose key the month already holds for a different session.
+    def store(self, rows):
+        by_month = {}
+        for key, vehicle_key, spot_key, lot_key, zone_key, arrival, departure in rows:
+            try:
+                arrived = datetime.fromisoformat(arrival)
+                departed = datetime.fromisoformat(departure)
+            except (TypeError, ValueError):
+                continue
+            # Overnight sessions count as present until the end of their arrival day
+            departure_hour = departed.hour if departed.date() == arrived.date() else 23
+            by_month.setdefault(arrival[:7], []).append((
+                key, vehicle_key, spot_key, lot_key, zone_key, arrival, departure,
+                arrived.hour, departure_hour, (departed - arrived).total_seconds() / 60
+            ))
+
+        archived = []
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for month, month_rows in by_month.items():
+                conn = self._open(month)
+                try:
+                    conn.executescript(self.SCHEMA)
+                    conn.executemany("INSERT OR IGNORE INTO sessions VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", month_rows)
+                    stored = {row[0]: row[1:] for row in conn.execute("""
+                        SELECT ph_parkinghistkey, ph_vehicleskey, ph_spotskey, ph_arrivaltime FROM sessions
+                        WHERE ph_parkinghistkey BETWEEN ? AND ?
+                    """, [min(row[0] for row in month_rows), max(row[0] for row in month_rows)])}
+                    conn.commit()
+                finally:
+                    conn.close()
+
+                for row in month_rows:
+                    if stored.get(row[0]) == (row[1], row[2], row[5]):
+                        archived.append(row[0])
+                    else:
+                        print(f"Archive: session {row[0]} has the key of another archived session; "
+                              f"left in parkingHistory.")
+        return archived
+
+    # -- Highest session key in any month file, 0 for an empty archive --
+    def max_key(self):
+        return max((key or 0 for key, in self._each_month(None, None, "SELECT MAX(ph_parkinghistkey) FROM sessions",
+                                                           [])), default=0)
+
+    # -- purge_in_chunks archive hook: copies one chunk of a history table, with each spot's lot and zone, and --
+    # returns the keys it archived
+    def store_from(self, conn, table, where, params):
+        rows = conn.execute(f"""
+            SELECT h.ph_parkinghistkey, h.ph_vehicleskey, h.ph_spotskey, s.s_lotkey, s.s_zonekey,
+                   h.ph_arrivaltime, h.ph_departuretime
+            FROM {table} h
+            LEFT JOIN spots s ON s.s_spotskey = h.ph_spotskey
+            WHERE {where}
+        """, params).fetchall()
+        return self.store(rows)
+
+    def _each_month(self, start, end, query, params):
+        for month in self.months(start, end):
+            conn = self._open(month)
+            try:
+                yield from conn.execute(query, params)
+            except sqlite3.OperationalError:
+                # A month file created but never written to has no sessions table yet
+                continue
+            finally:
+                conn.close()
+
+    # -- Average number of vehicles present in each lot for every hour of the day, over [start, end) --
+    def hourly_occupancy(self, start, end):
+        days = max(1, (datetime.fromisoformat(end) - datetime.fromisoformat(start)).days)
+        counts = {}
+        # At most lots x 24 x 24 groups come back; spreading them over the hours happens here
+        query = """
+            SELECT ph_lotkey, ph_arrivalhour, ph_departurehour, COUNT(*)
+            FROM sessions
+            WHERE ph_arrivaltime >= ? AND ph_arrivaltime < ?
+            GROUP BY ph_lotkey, ph_arrivalhour, ph_departurehour
+        """
+        for lot_key, arrival_hour, departure_hour, count in self._each_month(start, end, query, [start, end]):
+            hours = counts.setdefault(lot_key, [0] * 24)
+            for hour in range(arrival_hour, departure_hour + 1):
+                hours[hour] += count
+        return {lot_key: [count / days for count in hours] for lot_key, hours in counts.items()}
+
+    # -- Session count and average dwell time in minutes per zone, over [start, end) --
+    def dwell_by_zone(self, start, end):
+        totals = {}
+        query = """
+            SELECT ph_zonekey, COUNT(*), SUM(ph_dwellminutes)
+            FROM sessions
+            WHERE ph_arrivaltime >= ? AND ph_arrivaltime < ?
+            GROUP BY ph_zonekey
+        """
+        for zone_key, count, minutes in self._each_month(start, end, query, [start, end]):
+            total = totals.setdefault(zone_key, [0, 0.0])
+            total[0] += count
+            total[1] += minutes or 0.0
+        return {zone_key: {'sessions': count, 'avg_dwell_minutes': minutes / count}
+                for zone_key, (count, minutes) in totals.items() if count}
+
+
+history_archive = HistoryArchive(app.config['ARCHIVE_DIR'])
+
+# New sessions take keys above every archived one. Keys were reused before migration 0011, which could only
+# see the keys still in parkingHistory.
+with pool.connection() as archive_conn:
+    store.advance_keys(archive_conn, 'parkingHistory', 'ph_parkinghistkey', history_archive.max_key())
 
 
 
@@ -694,161 +2513,968 @@ def apply_permit():
 # --- AUTOMATED ENFORCEMENT  ---
 # ----------------------------------------------------------------------------------------------------------------------
 
-# -- Automatically unclaims spots for expired permits and vehicles in wrong zone after 30 minutes. --
-def enforce_parking_rules():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor() 
-    violations = {}
-
-    # Find expired permits
-    cursor.execute("""
-        SELECT ph.ph_parkinghistkey, ph.ph_spotskey, s.s_num
-        FROM parkingHistory ph
-        JOIN permit p ON ph.ph_vehicleskey = p.p_vehicleskey 
-        JOIN spots s ON ph.ph_spotskey = s.s_spotskey
-        WHERE ph.ph_departuretime IS NULL 
-            AND p.p_expirationdate < DATETIME('now', '-08:00')
-    """)
-    
-    for hist_key, spot_key, spot_num in cursor.fetchall():
-        violations[hist_key] = {'spot_key': spot_key, 'spot_num': spot_num, 'reason': 'EXPIRED_PERMIT'}
-
-    # Find zone violations after grace period
-    cursor.execute("""
-        SELECT ph.ph_parkinghistkey, ph.ph_spotskey, s.s_num
-        FROM parkingHistory ph
-        JOIN permit p ON ph.ph_vehicleskey = p.p_vehicleskey
-        JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
-        JOIN spots s ON ph.ph_spotskey = s.s_spotskey
-        JOIN zone z ON s.s_zonekey = z.z_zonekey
-        WHERE ph.ph_departuretime IS NULL 
-            AND ph.ph_arrivaltime < DATETIME('now', '-08:00', '-30 minutes') 
-            AND ((z.z_type = 'Gold' AND pt.pt_category != 'Faculty') 
-                OR (z.z_type = 'H' AND pt.pt_category != 'On-Campus Student'))
-    """)
-    
-    for hist_key, spot_key, spot_num in cursor.fetchall():
-        if hist_key not in violations:
-            violations[hist_key] = {'spot_key': spot_key, 'spot_num': spot_num, 'reason': 'ZONE_VIOLATION'}
+# -- Campus wall-clock text for a time.time() timestamp --
+def campus_time(timestamp):
+    return campus_timestamp(datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None) - timedelta(hours=8))
+
+
+# -- Deadline-driven enforcer. Every open session has at most two deadlines on a min-heap: its permit's --
+# expiration and, when parked in a zone its permit does not cover, arrival + the grace period. The worker
+# sleeps until the earliest deadline and only evicts what is due, so a pass costs O(due violations).
+class Enforcer:
+    GRACE_PERIOD = timedelta(minutes=30)
+    RESYNC_INTERVAL = 600
+    TRACK_INTERVAL = 5
+    # How far before the previous poll track_new() looks back, for claims that committed late or on a worker
+    # whose clock runs behind
+    TRACK_OVERLAP = timedelta(seconds=60)
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._sessions = set()
+        self._thread = None
+        self._generation = 0
+        self._last_sync = 0.0
+        self._last_track = 0.0
+        self._tracked_at = None
+        self.running = False
+        self.evicted = 0
+        self.passes = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    # -- Open sessions with their permit expiration and the permit category, zone and lot they are parked under --
+    def _open_sessions(self, conn, vehicle_key=None, arrived_since=None):
+        permissions.ensure_loaded()
+        return store.sessions.open_with_permits(conn, vehicle_key, arrived_since)
+
+    # -- A zone violation starts when the permission matrix stops allowing the spot (at arrival, or when its --
+    # time window closes) and becomes due after the grace period
+    def _push(self, rows):
+        for hist_key, arrival, expiration, category, zone_key, lot_key in rows:
+            self._sessions.add(hist_key)
+            try:
+                heapq.heappush(self._heap, (datetime.fromisoformat(expiration), hist_key, 'EXPIRED_PERMIT'))
+            except (TypeError, ValueError):
+                pass
+            try:
+                disallowed_at = permissions.allowed_until(category, zone_key, lot_key, datetime.fromisoformat(arrival))
+            except (TypeError, ValueError):
+                continue
+            if disallowed_at is not None:
+                heapq.heappush(self._heap, (disallowed_at + self.GRACE_PERIOD, hist_key, 'ZONE_VIOLATION'))
+
+    # -- Rebuilds the whole queue; used at startup, after zone flips and as a periodic safety net --
+    def load(self, conn):
+        started = campus_now()
+        rows = self._open_sessions(conn)
+        with self._cond:
+            self._heap = []
+            self._sessions = set()
+            self._tracked_at = started
+            self._push(rows)
+            self._last_sync = self._last_track = time.monotonic()
+            self._cond.notify()
+
+    # -- Adds sessions opened since the last load or poll, including claims made on other workers. Found by --
+    # arrival time rather than by key: keys from concurrent transactions do not commit in key order. Sessions
+    # already tracked (this worker's own claims, or seen by the previous poll's overlap) are skipped.
+    def track_new(self, conn):
+        started = campus_now()
+        since = (self._tracked_at or started) - self.TRACK_OVERLAP
+        rows = self._open_sessions(conn, arrived_since=campus_timestamp(since))
+        with self._cond:
+            self._push([row for row in rows if row[0] not in self._sessions])
+            self._tracked_at = started
+            self._last_track = time.monotonic()
+
+    # -- Adds deadlines for one vehicle's open session (after a claim or a new permit). Only the process running --
+    # the enforcer thread keeps a queue; claims on other workers reach it through track_new() and the resync.
+    def track_vehicle(self, conn, vehicle_key):
+        if not self.running:
+            return
+        rows = self._open_sessions(conn, vehicle_key)
+        if not rows:
+            return
+        with self._cond:
+            if self.running:
+                self._push(rows)
+                self._cond.notify()
+
+    def forget_session(self, hist_key):
+        with self._cond:
+            self._sessions.discard(hist_key)
+
+    # -- Pops every deadline that has passed and evicts those sessions in one batched transaction --
+    def run_due(self):
+        now = campus_now()
+        due = {}
+        with self._cond:
+            while self._heap and self._heap[0][0] < now:
+                deadline, hist_key, reason = heapq.heappop(self._heap)
+                if hist_key in self._sessions and hist_key not in due:
+                    due[hist_key] = (deadline, reason)
+
+        self.passes += 1
+        if not due:
+            return 0
+
+        try:
+            with pool.connection() as conn, store.transaction(conn):
+                # Sessions closed since they were queued (unclaimed, or evicted by another worker) are skipped
+                violations = store.sessions.open_by_keys(conn, list(due))
+                store.sessions.close(conn, *[hist_key for hist_key, _, _, _ in violations])
+                store.spots.free(conn, *[spot_key for _, spot_key, _, _ in violations])
+        except Exception:
+            # Rolled back: put the deadlines back so the next pass retries them
+            with self._cond:
+                for hist_key, (deadline, reason) in due.items():
+                    heapq.heappush(self._heap, (deadline, hist_key, reason))
+            raise
+
+        finished = campus_now()
+        with self._cond:
+            for hist_key in due:
+                self._sessions.discard(hist_key)
+            for hist_key, _, _, _ in violations:
+                lag = (finished - due[hist_key][0]).total_seconds()
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+            self.evicted += len(violations)
+
+        if violations:
+            print(f"Enforcer: Processing {len(violations)} violations...")
+            for hist_key, spot_key, spot_num, _ in violations:
+                occupancy.set_status(spot_key, 0)
+                print(f"   -> Forced unclaim: Spot {spot_num} ({due[hist_key][1]})")
+            parking_contexts.invalidate(*[user_key for _, _, _, user_key in violations])
+            publish_spot_event('enforcement', [spot_key for _, spot_key, _, _ in violations])
+        return len(violations)
+
+    # -- Runs until stop() (or a later start()) moves the generation on --
+    def _worker(self, generation):
+        while True:
+            with self._cond:
+                if self._generation != generation:
+                    return
+                timeout = min(self.RESYNC_INTERVAL - (time.monotonic() - self._last_sync),
+                              self.TRACK_INTERVAL - (time.monotonic() - self._last_track))
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - campus_now()).total_seconds())
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                if self._generation != generation:
+                    return
+
+            try:
+                if time.monotonic() - self._last_sync >= self.RESYNC_INTERVAL:
+                    with pool.connection() as conn:
+                        self.load(conn)
+                elif time.monotonic() - self._last_track >= self.TRACK_INTERVAL:
+                    with pool.connection() as conn:
+                        self.track_new(conn)
+                self.run_due()
+            except store.Error as error:
+                print(f"Enforcer: pass failed ({error}); retrying.")
+                time.sleep(1)
+            except Exception:
+                # Anything else (a bad row, a bug) is logged in full; the thread stays up so enforcement goes on
+                print("Enforcer: pass failed unexpectedly; retrying.")
+                traceback.print_exc()
+                time.sleep(1)
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+            self._generation += 1
+            self._thread = threading.Thread(target=self._worker, args=(self._generation,), name='enforcer',
+                                            daemon=True)
+            self._thread.start()
+
+    # -- Called when this process loses the scheduler lease: the new leader's enforcer owns the deadlines now. --
+    # The queue is dropped, and the next start() rebuilds it before its first pass.
+    def stop(self):
+        with self._cond:
+            if not self.running:
+                return
+            self.running = False
+            self._generation += 1
+            self._heap = []
+            self._sessions = set()
+            self._last_sync = 0.0
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            next_deadline = self._heap[0][0] if self._heap else None
+            return {
+                'queue_depth': len(self._heap),
+                'tracked_sessions': len(self._sessions),
+                'next_deadline': next_deadline.isoformat(sep=' ') if next_deadline else None,
+                'evicted': self.evicted,
+                'passes': self.passes,
+                'last_lag_seconds': self.last_lag,
+                'max_lag_seconds': self.max_lag
+            }
 
-    # Process violations
-    if not violations:
+
+enforcer = Enforcer()
+
+
+# -- Automatically unclaims spots for expired permits and vehicles in wrong zone after 30 minutes. --
+# Full pass: rebuilds the deadline queue from the database and evicts everything already due.
+def enforce_parking_rules(writer=None):
+    conn = writer or pool.acquire()
+    try:
+        enforcer.load(conn)
+    finally:
+        if writer is None:
+            pool.release(conn)
+
+    if enforcer.run_due() == 0:
         print("Enforcer: No violations found.")
-        conn.close()
         return
-    print(f"Enforcer: Processing {len(violations)} violations...")
-    
-    for history_key, data in violations.items():
-        cursor.execute("""
-            UPDATE parkingHistory SET ph_departuretime = DATETIME('now', '-08:00')
-            WHERE ph_parkinghistkey = ?
-        """, [history_key])
-        
-        cursor.execute("UPDATE spots SET s_status = 0 WHERE s_spotskey = ?", [data['spot_key']])
-        print(f"   -> Forced unclaim: Spot {data['spot_num']} ({data['reason']})")
-        
-    conn.commit()
-    conn.close()
     print("Enforcer: Enforcement complete.")
 
 
-# -- Updates North Bowl zone assignment based on time of day. --
-def update_time_based_zones():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
-    
-    # Get current hour
-    cursor.execute("SELECT CAST(strftime('%H', 'now', '-08:00') AS INTEGER)")
-    current_hour = cursor.fetchone()[0]
+# -- zoneSchedule rows per lot, evaluated incrementally: each lot keeps the time of its next window boundary, so --
+# a check between transitions is one comparison, and only lots whose boundary has passed are re-evaluated.
+# Weekday-specific windows take precedence over every-day (NULL weekday) windows for the same moment.
+class ZoneSchedule:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.windows = {}
+        self.scheduled_zones = {}
+        self.next_transition = {}
+        self.next_due = datetime.min
+        self.transitions = 0
+
+    @staticmethod
+    def _minutes(hhmm):
+        hour, minute = hhmm.split(':')
+        return int(hour) * 60 + int(minute)
+
+    def load(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT zs_lotkey, zs_zonekey, zs_weekday, zs_start, zs_end FROM zoneSchedule")
+        windows = {}
+        for lot_key, zone_key, weekday, start, end in cursor.fetchall():
+            start_minutes, end_minutes = self._minutes(start), self._minutes(end)
+            # A window whose end is not after its start runs past midnight (equal ends mean a full day)
+            length = (end_minutes - start_minutes) % 1440 or 1440
+            windows.setdefault(lot_key, []).append((weekday, start_minutes, length, zone_key))
+
+        with self._lock:
+            self.windows = windows
+            self.scheduled_zones = {lot_key: {window[3] for window in lot_windows}
+                                    for lot_key, lot_windows in windows.items()}
+            # Every lot is due on the next check, which reconciles the tables with the current windows
+            self.next_transition = {lot_key: datetime.min for lot_key in windows}
+            self.next_due = datetime.min
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with pool.connection() as conn:
+                self.load(conn)
+
+    # -- (start, end, weekday, zone) for every window of a lot that starts within [first_day, first_day + days) --
+    def _occurrences(self, lot_key, first_day, days):
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            for weekday, start_minutes, length, zone_key in self.windows[lot_key]:
+                if weekday is None or weekday == day.weekday():
+                    start = day + timedelta(minutes=start_minutes)
+                    yield start, start + timedelta(minutes=length), weekday, zone_key
+
+    def zone_at(self, lot_key, at):
+        midnight = at.replace(hour=0, minute=0, second=0, microsecond=0)
+        covering = [(weekday is None, zone_key)
+                    for start, end, weekday, zone_key in self._occurrences(lot_key, midnight - timedelta(days=1), 2)
+                    if start <= at < end]
+        return min(covering)[1] if covering else None
+
+    def _boundary_after(self, lot_key, at):
+        midnight = at.replace(hour=0, minute=0, second=0, microsecond=0)
+        boundaries = [moment for start, end, _, _ in self._occurrences(lot_key, midnight - timedelta(days=1), 9)
+                      for moment in (start, end) if moment > at]
+        return min(boundaries) if boundaries else datetime.max
+
+    # -- (lot, zone or None) for every lot whose boundary has passed; empty between transitions. Changes nothing: --
+    # the caller advance()s the lots once their zones are committed, so a failed write is retried on the next check.
+    def due(self, now):
+        if now < self.next_due:
+            return []
+        with self._lock:
+            return [(lot_key, self.zone_at(lot_key, now))
+                    for lot_key, transition in self.next_transition.items() if transition <= now]
+
+    # -- Moves each of `lot_keys` on to its next boundary after `now` --
+    def advance(self, lot_keys, now):
+        with self._lock:
+            for lot_key in lot_keys:
+                # A reload in between has already made every lot due again
+                if lot_key in self.next_transition:
+                    self.next_transition[lot_key] = self._boundary_after(lot_key, now)
+            self.next_due = min(self.next_transition.values(), default=datetime.max)
+            self.transitions += len(lot_keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lots': len(self.windows),
+                'transitions': self.transitions,
+                'next_transition': None if self.next_due in (datetime.min, datetime.max)
+                                   else self.next_due.isoformat(sep=' ')
+            }
 
-    is_nighttime = (current_hour >= 19 or current_hour < 6)
-    
-    gold_zone = 2
-    green_zone = 1
-    north_bowl = 3
 
-    if is_nighttime:
-        print("Time-based zones: North Bowl → Green (Nighttime)")
-        
-        # Update spots to Green
-        cursor.execute("""
-            UPDATE spots SET s_zonekey = ?, s_isactive = 1 
-            WHERE s_lotkey = ?
-        """, (green_zone, north_bowl))
-
-        # Update zoneAssignment: activate Green, deactivate Gold
-        cursor.execute("""
-            UPDATE zoneAssignment SET za_isactive = 1
-            WHERE za_lotkey = ? AND za_zonekey = ?
-        """, (north_bowl, green_zone))
-
-        cursor.execute("""
-            UPDATE zoneAssignment SET za_isactive = 0
-            WHERE za_lotkey = ? AND za_zonekey = ?
-        """, (north_bowl, gold_zone))
-    else:
-        print("Time-based zones: North Bowl → Gold (Daytime)")
-        
-        # Update spots to Gold
-        cursor.execute("""
-            UPDATE spots SET s_zonekey = ?, s_isactive = 1 
-            WHERE s_lotkey = ?
-        """, (gold_zone, north_bowl))
-
-        # Update zoneAssignment: activate Gold, deactivate Green
-        cursor.execute("""
-            UPDATE zoneAssignment SET za_isactive = 1
-            WHERE za_lotkey = ? AND za_zonekey = ?
-        """, (north_bowl, gold_zone))
-
-        cursor.execute("""
-            UPDATE zoneAssignment SET za_isactive = 0
-            WHERE za_lotkey = ? AND za_zonekey = ?
-        """, (north_bowl, green_zone))
-        
-    conn.commit()
-    conn.close()
+zone_schedule = ZoneSchedule()
 
 
-# -- Delete any old parking records after the departure time is 24 hours old --
-def delete_old_parking_records():
-    conn = sqlite3.connect('instance/data.sqlite')
+# -- Applies the zone schedule: for each lot that crossed a window boundary, activates the scheduled zone in --
+# zoneAssignment and moves the lot's spots into it. Every UPDATE skips rows already in the target state.
+def update_time_based_zones(writer=None):
+    zone_schedule.ensure_loaded()
+    now = campus_now()
+    lots = zone_schedule.due(now)
+    due = [(lot_key, zone_key) for lot_key, zone_key in lots if zone_key is not None]
+    if not due:
+        if lots:
+            zone_schedule.advance([lot_key for lot_key, _ in lots], now)
+        return
+
+    conn = writer or pool.acquire()
+    try:
+        flipped = []
+        with store.transaction(conn):
+            for lot_key, zone_key in due:
+                other_zones = sorted(zone_schedule.scheduled_zones[lot_key] - {zone_key})
+                store.zones.activate(conn, lot_key, zone_key, other_zones)
+
+                if store.spots.move_lot(conn, lot_key, zone_key) > 0:
+                    lot_name, zone_type = store.zones.names(conn, lot_key, zone_key) or (lot_key, zone_key)
+                    print(f"Time-based zones: {lot_name} → {zone_type}")
+                    flipped.append((lot_key, zone_key))
+        zone_schedule.advance([lot_key for lot_key, _ in lots], now)
+
+        reference_tables.invalidate()
+
+        changed = []
+        for lot_key, zone_key in flipped:
+            changed.extend(occupancy.set_lot_zone(lot_key, zone_key))
+
+        publish_spot_event('zone-flip', changed)
+
+        # Zone changes can put parked vehicles in a zone their permit does not cover
+        if flipped:
+            parking_contexts.clear()
+            enforcer.load(conn)
+    finally:
+        if writer is None:
+            pool.release(conn)
+
+
+# -- Deletes rows matching `predicate` in key order, one bounded write transaction per chunk. --
+# Each chunk is the key range (last key, highest key of the next PURGE_CHUNK_SIZE matches], so the write lock is
+# held for one chunk at a time and released for PURGE_PAUSE_SECONDS in between so claims can get through.
+# With `archive`, each chunk is first handed to archive(conn, table, where, params) outside the write lock, and
+# only the keys it returns are deleted; rows it could not take stay in the table and are counted in the log.
+def purge_in_chunks(conn, table, key, predicate, params, archive=None):
+    chunk_size = app.config['PURGE_CHUNK_SIZE']
     cursor = conn.cursor()
-    
-    cursor.execute("""
-        DELETE FROM parkingHistory
-        WHERE ph_departuretime IS NOT NULL  
-            AND ph_departuretime < DATETIME('now', '-08:00', '-24 hours')
-    """)
-    
-    deleted = cursor.rowcount
-    conn.commit()
-    conn.close()
-    
+    last_key = -1
+    total = 0
+    kept = 0
+    started = time.perf_counter()
+
+    while True:
+        if scheduler.lease_lost():
+            print(f"Cleanup: {table} purge stopped after {total} rows; another worker holds the scheduler lease.")
+            break
+        cursor.execute(f"""
+            SELECT MAX({key}), COUNT(*) FROM (
+                SELECT {key} FROM {table}
+                WHERE {key} > ? AND {predicate}
+                ORDER BY {key} LIMIT ?) AS chunk
+        """, [last_key] + params + [chunk_size])
+        high_key, count = cursor.fetchone()
+        if not count:
+            break
+
+        where = f"{key} > ? AND {key} <= ? AND {predicate}"
+        chunk = [last_key, high_key] + params
+        deleted = count
+        if archive is not None:
+            archived = archive(conn, table, where, chunk)
+            kept += count - len(archived)
+            deleted = len(archived)
+            where, chunk = store.in_list(key, archived)
+
+        if deleted:
+            with store.transaction(conn):
+                cursor.execute(f"DELETE FROM {table} WHERE {where}", chunk)
+
+        total += deleted
+        last_key = high_key
+        if count < chunk_size:
+            break
+        time.sleep(app.config['PURGE_PAUSE_SECONDS'])
+
+    if kept:
+        print(f"Cleanup: kept {kept} {table} rows the archive could not take (unparseable times or reused keys).")
+    elapsed = time.perf_counter() - started
+    return total, (total / elapsed if elapsed > 0 else 0.0)
+
+
+# -- Delete any old parking records after the departure time is 24 hours old --
+# With PURGE_ARCHIVE on (the default) they are moved into the monthly history archive first.
+def delete_old_parking_records(writer=None):
+    conn = writer or pool.acquire()
+    archive = history_archive.store_from if app.config['PURGE_ARCHIVE'] else None
+
+    # Fix the cutoff once so every chunk uses the same boundary
+    cutoff = campus_timestamp(campus_now() - timedelta(hours=24))
+    try:
+        deleted, rate = purge_in_chunks(
+            conn, 'parkingHistory', 'ph_parkinghistkey',
+            'ph_departuretime IS NOT NULL AND ph_departuretime < ?', [cutoff], archive=archive
+        )
+    finally:
+        if writer is None:
+            pool.release(conn)
+
     if deleted > 0:
-        print(f"Cleanup: Deleted {deleted} old parking records.")
+        action = 'Archived' if archive is not None else 'Deleted'
+        print(f"Cleanup: {action} {deleted} old parking records ({rate:,.0f} rows/s).")
+    return deleted
 
 
 # -- Delete expired permits --
-def delete_expired_permits():
-    conn = sqlite3.connect('instance/data.sqlite')
-    cursor = conn.cursor()
+def delete_expired_permits(writer=None):
+    conn = writer or pool.acquire()
+
+    # Delete expired permits whose vehicle has no parking history left
+    cutoff = campus_timestamp()
+    try:
+        deleted_count, rate = purge_in_chunks(
+            conn, 'permit', 'p_permitkey',
+            """p_expirationdate < ? AND NOT EXISTS (
+                SELECT 1 FROM parkingHistory ph
+                WHERE ph.ph_vehicleskey = permit.p_vehicleskey)""", [cutoff]
+        )
+    finally:
+        if writer is None:
+            pool.release(conn)
 
-    # Delete expired permits
-    cursor.execute("""
-        DELETE FROM permit 
-        WHERE p_expirationdate < DATETIME('now', '-08:00')
-        AND NOT EXISTS (
-            SELECT 1 FROM parkingHistory ph 
-            WHERE ph.ph_vehicleskey = permit.p_vehicleskey)
-    """)
-    
-    deleted_count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    
     if deleted_count > 0:
-        print(f"Cleanup: Deleted {deleted_count} expired permit records from DB.")
+        print(f"Cleanup: Deleted {deleted_count} expired permit records from DB ({rate:,.0f} rows/s).")
+    return deleted_count
+
+
+# -- Drops spotChange entries older than SPOT_CHANGE_RETENTION_SECONDS, long after every worker replayed them --
+def prune_spot_changes(writer=None):
+    conn = writer or pool.acquire()
+    try:
+        deleted_count, _ = purge_in_chunks(conn, 'spotChange', 'sc_changekey', 'sc_at < ?',
+                                           [time.time() - app.config['SPOT_CHANGE_RETENTION_SECONDS']])
+    finally:
+        if writer is None:
+            pool.release(conn)
+    return deleted_count
+
+
+# -- Drops userInvalidation entries older than USER_INVALIDATION_RETENTION_SECONDS; every worker replays the log --
+# within seconds, and claims write to it all day
+def prune_user_invalidations(writer=None):
+    conn = writer or pool.acquire()
+    try:
+        deleted_count, _ = purge_in_chunks(conn, 'userInvalidation', 'ui_invalidationkey', 'ui_at < ?',
+                                           [time.time() - app.config['USER_INVALIDATION_RETENTION_SECONDS']])
+    finally:
+        if writer is None:
+            pool.release(conn)
+    return deleted_count
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- OCCUPANCY SENSORS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Ground-sensor and camera occupancy reports, coalesced per spot and applied in batched write transactions. --
+# Requests only parse and buffer: the buffer keeps the newest report per spot, so a spot reported many times
+# within one flush window costs one row. The flusher drops reports that match the index, closes open sessions
+# on spots reported free (unless claimed within SENSOR_CLAIM_GRACE_SECONDS, i.e. the driver is still on the way),
+# and writes the rest with executemany in one transaction. When the oldest buffered report has waited longer than
+# SENSOR_MAX_LAG_SECONDS the writer is not keeping up, and new batches are refused with 429 until it catches up.
+class SensorIngest:
+    # Binary batches: packed little-endian (spot key uint32, occupied uint8, sensor time float64 epoch, 0 = now)
+    RECORD = struct.Struct('<IBd')
+    # Spots per IN list
+    CHUNK = 500
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._oldest = None
+        self._applied_at = {}
+        self._flushing = 0
+        self._thread = None
+        self._lookup_version = None
+        self._spot_keys_by_num = {}
+        self.received = 0
+        self.unknown = 0
+        self.collapsed = 0
+        self.stale = 0
+        self.throttled = 0
+        self.flushes = 0
+        self.applied = 0
+        self.unchanged = 0
+        self.held = 0
+        self.sessions_closed = 0
+        self.last_flush_ms = 0.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_sensor_lag = 0.0
+
+    def _spot_key(self, spot_num):
+        if self._lookup_version != occupancy.loaded_version:
+            with occupancy._lock:
+                self._spot_keys_by_num = dict(zip(occupancy.spot_nums, occupancy.spot_keys))
+                self._lookup_version = occupancy.loaded_version
+        return self._spot_keys_by_num.get(spot_num)
+
+    # -- Returns ([(spot_key, status, sensor_time)], unknown spots); raises ValueError for a malformed batch --
+    def parse(self, body, mimetype):
+        occupancy.ensure_loaded()
+        now = time.time()
+        parsed = []
+        unknown = 0
+
+        if mimetype == 'application/octet-stream':
+            if len(body) % self.RECORD.size:
+                raise ValueError(f'Binary batches are {self.RECORD.size}-byte records.')
+            for spot_key, occupied, at in self.RECORD.iter_unpack(body):
+                if spot_key not in occupancy.position:
+                    unknown += 1
+                    continue
+                parsed.append((spot_key, 1 if occupied else 0, at or now))
+            return parsed, unknown
+
+        # JSON lines: {"spot": "A12", "occupied": true, "at": 1760000000.5}
+        for line_number, line in enumerate(body.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                spot_key = self._spot_key(str(event['spot']))
+                status = 1 if event['occupied'] else 0
+                at = float(event.get('at') or now)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                raise ValueError(f'Malformed event on line {line_number}.')
+            if spot_key is None:
+                unknown += 1
+                continue
+            parsed.append((spot_key, status, at))
+        return parsed, unknown
+
+    # -- Buffers a parsed batch; False (nothing buffered) when the flusher is behind --
+    def submit(self, parsed, unknown=0):
+        self.start()
+        received = time.monotonic()
+        with self._cond:
+            if self._oldest is not None and received - self._oldest > app.config['SENSOR_MAX_LAG_SECONDS']:
+                self.throttled += 1
+                return False
+
+            self.received += len(parsed)
+            self.unknown += unknown
+            pending = self._pending
+            applied_at = self._applied_at
+            for spot_key, status, at in parsed:
+                # Reports can arrive out of order across batches; the sensor's own clock decides
+                if at < applied_at.get(spot_key, 0.0):
+                    self.stale += 1
+                    continue
+                current = pending.get(spot_key)
+                if current is None:
+                    pending[spot_key] = (status, at, received)
+                    continue
+                self.collapsed += 1
+                if at >= current[1]:
+                    pending[spot_key] = (status, at, current[2])
+            # Wakes the flusher to start its window, and again once the buffer is full
+            if pending and self._oldest is None:
+                self._oldest = received
+                self._cond.notify()
+            elif len(pending) >= app.config['SENSOR_FLUSH_SIZE']:
+                self._cond.notify()
+        return True
+
+    def _requeue(self, batch):
+        with self._cond:
+            self._flushing = 0
+            for spot_key, report in batch.items():
+                current = self._pending.get(spot_key)
+                if current is None or current[1] < report[1]:
+                    self._pending[spot_key] = report
+            if self._pending:
+                self._oldest = min(report[2] for report in self._pending.values())
+
+    # -- {spot_key: reported status} for the spots whose stored status differs from their report in `batch` --
+    def _disagreeing(self, conn, spot_keys, batch, lock=False):
+        changes = {}
+        for chunk_start in range(0, len(spot_keys), self.CHUNK):
+            stored = store.spots.statuses(conn, spot_keys[chunk_start:chunk_start + self.CHUNK], lock)
+            for spot_key, status in stored.items():
+                if status != batch[spot_key][0]:
+                    changes[spot_key] = batch[spot_key][0]
+        return changes
+
+    # -- Applies everything buffered so far; returns the number of spots whose status changed --
+    def flush(self):
+        with self._cond:
+            batch, self._pending, self._oldest = self._pending, {}, None
+            self._flushing = len(batch)
+            # From here on, reports older than the ones being written are stale
+            for spot_key, report in batch.items():
+                self._applied_at[spot_key] = report[1]
+        if not batch:
+            return 0
+        started = time.perf_counter()
+
+        changes = {}
+        closed = []
+        held = 0
+        try:
+            # Reports that agree with the database need no write. This first read takes no locks, so a batch of
+            # unchanged reports never waits for (or holds) the write lock; the index is not trusted for it, since
+            # other workers' writes reach it only at its next sync.
+            with pool.connection() as conn:
+                candidates = sorted(self._disagreeing(conn, sorted(batch), batch))
+            if candidates:
+                with pool.connection() as conn, store.transaction(conn):
+                    # Read again with the spots locked, so a claim committed meanwhile is seen and held
+                    changes = self._disagreeing(conn, candidates, batch, lock=True)
+                    freed = [spot_key for spot_key, status in changes.items() if status == 0]
+                    since = campus_now() - timedelta(seconds=app.config['SENSOR_CLAIM_GRACE_SECONDS'])
+                    for chunk_start in range(0, len(freed), self.CHUNK):
+                        chunk = freed[chunk_start:chunk_start + self.CHUNK]
+                        for hist_key, spot_key, user_key, recent in store.sessions.open_on_spots(conn, chunk, since):
+                            if recent:
+                                changes.pop(spot_key, None)
+                                held += 1
+                            else:
+                                closed.append((hist_key, user_key))
+
+                    store.sessions.close(conn, *[hist_key for hist_key, _ in closed])
+                    if changes:
+                        store.spots.set_statuses(conn, changes)
+        except store.Error:
+            self._requeue(batch)
+            raise
+
+        changed = occupancy.set_statuses(changes.items())
+        for hist_key, _ in closed:
+            enforcer.forget_session(hist_key)
+        if closed:
+            parking_contexts.invalidate(*{user_key for _, user_key in closed})
+        publish_spot_event('sensor', changed)
+
+        lag = time.monotonic() - min(report[2] for report in batch.values())
+        with self._cond:
+            self._flushing = 0
+            self.flushes += 1
+            self.applied += len(changed)
+            self.unchanged += len(batch) - len(changes) - held
+            self.held += held
+            self.sessions_closed += len(closed)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.last_sensor_lag = time.time() - min(report[1] for report in batch.values())
+        return len(changed)
+
+    # -- Flushes once SENSOR_FLUSH_SECONDS have passed since the oldest buffered report, or at SENSOR_FLUSH_SIZE --
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while len(self._pending) < app.config['SENSOR_FLUSH_SIZE']:
+                    remaining = self._oldest + app.config['SENSOR_FLUSH_SECONDS'] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            try:
+                self.flush()
+            except store.Error as error:
+                print(f"Sensors: flush failed ({error}); retrying.")
+                time.sleep(1)
+
+    def start(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name='sensor-ingest', daemon=True)
+                    self._thread.start()
+
+    def stats(self):
+        with self._cond:
+            return {
+                # Buffered plus being written: spots whose latest report is not committed yet
+                'pending_spots': len(self._pending) + self._flushing,
+                'oldest_pending_seconds': (time.monotonic() - self._oldest) if self._oldest is not None else 0.0,
+                'received': self.received,
+                'unknown_spots': self.unknown,
+                'collapsed': self.collapsed,
+                'stale': self.stale,
+                'throttled_batches': self.throttled,
+                'flushes': self.flushes,
+                'applied': self.applied,
+                'unchanged': self.unchanged,
+                'held_for_claims': self.held,
+                'sessions_closed': self.sessions_closed,
+                'last_flush_ms': self.last_flush_ms,
+                'last_ingest_lag_seconds': self.last_lag,
+                'max_ingest_lag_seconds': self.max_lag,
+                'last_sensor_lag_seconds': self.last_sensor_lag
+            }
+
+
+sensor_ingest = SensorIngest()
+
+
+# -- Sensor feed: JSON lines (application/x-ndjson) or packed binary records (application/octet-stream). --
+# Authenticated with the shared X-Sensor-Token; answers 202 once buffered, 429 with Retry-After when behind.
+@app.route('/api/sensor-events', methods=['POST'])
+def sensor_events():
+    token = app.config['SENSOR_TOKEN']
+    if not token or not hmac.compare_digest(request.headers.get('X-Sensor-Token', ''), token):
+        return jsonify({'success': False, 'message': 'Invalid sensor token.'}), 403
+
+    # Checked before the body is read, so an oversized batch is never buffered
+    if request.content_length is None:
+        return jsonify({'success': False, 'message': 'Content-Length is required.'}), 411
+    if request.content_length > app.config['SENSOR_MAX_BYTES']:
+        return jsonify({'success': False,
+                        'message': f"At most {app.config['SENSOR_MAX_BYTES']} bytes per batch."}), 413
+
+    try:
+        parsed, unknown = sensor_ingest.parse(request.get_data(), request.mimetype)
+    except ValueError as error:
+        return jsonify({'success': False, 'message': str(error)}), 400
+
+    if len(parsed) > app.config['SENSOR_BATCH_LIMIT']:
+        return jsonify({'success': False,
+                        'message': f"At most {app.config['SENSOR_BATCH_LIMIT']} events per batch."}), 413
+
+    if not sensor_ingest.submit(parsed, unknown):
+        response = jsonify({'success': False, 'message': 'Sensor ingestion is behind; retry shortly.'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+
+    return jsonify({'success': True, 'accepted': len(parsed), 'unknown': unknown}), 202
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- BACKGROUND SCHEDULER  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- A maintenance job: runs every `interval` seconds and/or at fixed campus times ('HH:MM'). --
+class Job:
+    def __init__(self, name, func, interval=None, at=None, jitter=0, run_at_start=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.at = [tuple(int(part) for part in hhmm.split(':')) for hhmm in (at or [])]
+        self.jitter = jitter
+        self.next_run = time.time() if run_at_start else self._next_after(time.time())
+        self.running = False
+        self.skipped = 0
+        self.history = deque(maxlen=50)
+
+    def _next_after(self, now):
+        candidates = []
+        if self.interval:
+            candidates.append(now + self.interval)
+        if self.at:
+            campus = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None) - timedelta(hours=8)
+            for hour, minute in self.at:
+                target = campus.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if target <= campus:
+                    target += timedelta(days=1)
+                candidates.append(now + (target - campus).total_seconds())
+        if not candidates:
+            return None
+        return min(candidates) + random.uniform(0, self.jitter)
+
+    def schedule_next(self, now):
+        next_run = self._next_after(now)
+        # A run that overran its next slot coalesces the missed runs instead of queueing them back to back
+        while next_run is not None and self.interval and next_run < time.time():
+            self.skipped += 1
+            next_run += self.interval
+        self.next_run = next_run
+
+
+# -- Runs maintenance jobs in one thread through one dedicated writer connection, off the request path. --
+# With several gunicorn workers only the holder of the schedulerLease row runs jobs. A second thread renews
+# the lease on its own connection every RENEW_SECONDS, including while a long job runs, and another worker
+# takes it over once it expires; a holder that fails to renew stops its jobs before their next write batch.
+class Scheduler:
+    LEASE_NAME = 'maintenance'
+    LEASE_SECONDS = 30
+    RENEW_SECONDS = 10
+
+    def __init__(self):
+        self.jobs = []
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.is_leader = False
+        self._on_leader = []
+        self._on_follower = []
+        self._lock = threading.Lock()
+        self._leadership = threading.Event()
+        self._thread = None
+        self._lease_thread = None
+        self._writer = None
+
+    def add_job(self, name, func, **schedule):
+        self.jobs.append(Job(name, func, **schedule))
+
+    # -- Callbacks run each time this process becomes the leader --
+    def on_leader(self, callback):
+        self._on_leader.append(callback)
+
+    # -- Callbacks run each time this process stops being the leader (lease lost or not renewable) --
+    def on_follower(self, callback):
+        self._on_follower.append(callback)
+
+    # -- True on the scheduler thread once the lease is lost, so a long job stops before its next write batch --
+    def lease_lost(self):
+        return threading.current_thread() is self._thread and not self.is_leader
+
+    # -- Takes or renews the lease in one upsert, which only overwrites a lease that is ours or has expired --
+    def _acquire_lease(self, conn):
+        now = time.time()
+        with store.transaction(conn):
+            return conn.execute("""
+                INSERT INTO schedulerLease(sl_name, sl_owner, sl_expires) VALUES(?, ?, ?)
+                ON CONFLICT(sl_name) DO UPDATE SET sl_owner = excluded.sl_owner, sl_expires = excluded.sl_expires
+                WHERE schedulerLease.sl_owner = excluded.sl_owner OR schedulerLease.sl_expires <= ?
+            """, [self.LEASE_NAME, self.owner, now + self.LEASE_SECONDS, now]).rowcount > 0
+
+    def _hold_lease(self):
+        conn = pool.new_connection()
+        while True:
+            try:
+                leader = self._acquire_lease(conn)
+            except store.Error as error:
+                print(f"Scheduler: lease check failed ({error})")
+                leader = False
+            if leader and not self.is_leader:
+                print(f"Scheduler: {self.owner} is now running maintenance jobs.")
+                for callback in self._on_leader:
+                    callback()
+                self.is_leader = True
+                self._leadership.set()
+            elif not leader and self.is_leader:
+                self.is_leader = False
+                print(f"Scheduler: {self.owner} lost the lease and stopped running maintenance jobs.")
+                for callback in self._on_follower:
+                    callback()
+            time.sleep(self.RENEW_SECONDS)
+
+    def _run(self, job):
+        job.running = True
+        started = time.time()
+        error = None
+        try:
+            job.func(self._writer)
+        except Exception as exc:
+            error = repr(exc)
+            if self._writer.in_transaction:
+                self._writer.rollback()
+            print(f"Scheduler: {job.name} failed: {error}")
+        finally:
+            job.running = False
+        with self._lock:
+            job.history.append({
+                'started': campus_time(started),
+                'duration_ms': (time.time() - started) * 1000,
+                'error': error
+            })
+            job.schedule_next(started)
+
+    def _loop(self):
+        self._writer = pool.new_connection()
+        while True:
+            if not self.is_leader:
+                self._leadership.wait(self.RENEW_SECONDS)
+                self._leadership.clear()
+                continue
+
+            for job in self.jobs:
+                if self.is_leader and job.next_run is not None and job.next_run <= time.time() and not job.running:
+                    self._run(job)
+
+            upcoming = [job.next_run for job in self.jobs if job.next_run is not None]
+            time.sleep(max(0.0, min([time.time() + self.RENEW_SECONDS] + upcoming) - time.time()))
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._lease_thread = threading.Thread(target=self._hold_lease, name='scheduler-lease', daemon=True)
+                self._lease_thread.start()
+                self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'owner': self.owner,
+                'is_leader': self.is_leader,
+                'jobs': [{
+                    'name': job.name,
+                    'running': job.running,
+                    'next_run': campus_time(job.next_run) if job.next_run is not None else None,
+                    'skipped_overlaps': job.skipped,
+                    'history': list(job.history)
+                } for job in self.jobs]
+            }
+
+
+scheduler = Scheduler()
+scheduler.add_job('enforce_parking_rules', enforce_parking_rules, run_at_start=True)
+scheduler.add_job('update_time_based_zones', update_time_based_zones, interval=30, run_at_start=True)
+scheduler.add_job('delete_old_parking_records', delete_old_parking_records, interval=3600, jitter=60,
+                  run_at_start=True)
+scheduler.add_job('delete_expired_permits', delete_expired_permits, interval=3600, jitter=60, run_at_start=True)
+scheduler.add_job('prune_spot_changes', prune_spot_changes, interval=60, jitter=10)
+scheduler.add_job('prune_user_invalidations', prune_user_invalidations, interval=60, jitter=10)
+scheduler.on_leader(enforcer.start)
+scheduler.on_follower(enforcer.stop)
+
+
+# -- Workers started by gunicorn never run the __main__ block, so the scheduler starts with the first request --
+@app.before_request
+def start_scheduler():
+    if app.config['SCHEDULER_ENABLED']:
+        scheduler.start()
+
+
+# -- Scheduler leadership and per-job timing history --
+@app.route('/api/scheduler-stats')
+@monitoring_required
+def scheduler_stats():
+    return jsonify(scheduler.stats())
 
 
 
@@ -857,18 +3483,11 @@ def delete_expired_permits():
 # ----------------------------------------------------------------------------------------------------------------------
 
 if __name__ == '__main__':
-    resetTheTable = False  
-
-    with app.app_context():
-        if resetTheTable:
-            db.drop_all()
-        db.create_all()
-
-    # Run automated tasks on startup
-    enforce_parking_rules()
-    update_time_based_zones()
-    delete_old_parking_records()
-    delete_expired_permits()
+    # Automated tasks run on startup and on their schedules from the background scheduler
+    occupancy.ensure_loaded()
+    password_hasher.start()
+    if app.config['SCHEDULER_ENABLED']:
+        scheduler.start()
 
     print("Server starting on port 5001...")
     app.run(port=5001, debug=True)
\ No newline at end of file
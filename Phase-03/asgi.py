@@ -0,0 +1,434 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie, parse_etags
+
+import app as parking
+
+# ASGI entry point: uvicorn asgi:application --workers 1 (run from Phase-03, like app.py).
+#
+# The map page's four read-only calls (parking data, zone status, accessible zones, parking status) are served
+# on the event loop. Their data lives in the occupancy index and the parking context cache, so a request that
+# hits those never takes a thread; misses and the zone status query run on a small thread pool with a pooled
+# connection. Everything else, and any of the four that need more than the Flask session cookie to
+# authenticate (no cookie, remember-me, strong session protection, a user not in the cache and not in the
+# database), goes to the unchanged Flask app on a separate thread pool, so flask_login stays the single authority.
+#
+# The live event stream is served on the event loop too: one thread follows the EventHub for the whole process,
+# so an open stream holds a coroutine rather than a thread. Streams that fall back to Flask are relayed on their
+# own thread pool and never take the threads the rest of the app is served on.
+
+flask_app = parking.app
+db_threads = ThreadPoolExecutor(flask_app.config['ASGI_DB_THREADS'], thread_name_prefix='asgi-db')
+wsgi_threads = ThreadPoolExecutor(flask_app.config['ASGI_WSGI_THREADS'], thread_name_prefix='asgi-wsgi')
+stream_threads = ThreadPoolExecutor(flask_app.config['ASGI_STREAM_THREADS'], thread_name_prefix='asgi-stream')
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SESSION AUTH  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+# -- The user key in a valid Flask session cookie, or None when the request has to go through flask_login --
+def session_user_key(cookie_header):
+    if not cookie_header or parking.login_manager.session_protection == 'strong':
+        return None
+    value = parse_cookie(cookie_header).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not value:
+        return None
+    try:
+        session = session_serializer.loads(value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    try:
+        return int(session['_user_id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def load_user(user_key):
+    with flask_app.app_context():
+        return parking.load_user(user_key)
+
+
+# -- Runs fn on the database threads, profiled under `route`; returns (result, SQL statements executed) --
+async def offload(route, fn, *args):
+    def run():
+        if not flask_app.config['METRICS_ENABLED']:
+            return fn(*args), 0
+        # Most fast-path requests run no SQL, so the few that reach the database are always profiled: sampling
+        # them would skew the statements-per-request average toward the requests served from memory
+        parking.metrics.start_request(route, profiled=True)
+        try:
+            result = fn(*args)
+        finally:
+            queries = parking.metrics.detach_request()[2]
+        return result, queries
+
+    return await asyncio.get_running_loop().run_in_executor(db_threads, run)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- READ-ONLY ENDPOINTS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Each returns (status, body, headers, SQL statements executed); mirrors the Flask view of the same name --
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+
+# -- Byte for byte what jsonify() sends outside debug mode --
+def json_body(payload):
+    return (flask_app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+async def parking_data(user_key, query, headers):
+    queries = 0
+    # Loading, and replaying other workers' changes once a sync is due, take the database
+    if not parking.occupancy.loaded or parking.occupancy.sync_due():
+        _, queries = await offload('parking_data', parking.occupancy.ensure_loaded)
+    try:
+        since = int(query['since']) if 'since' in query else None
+    except ValueError:
+        since = None
+    version, payload = parking.occupancy_payload(since)
+
+    etag = f'occ-{version}'
+    response_headers = [(b'etag', f'"{etag}"'.encode('latin-1')), (b'cache-control', b'no-cache'),
+                        (b'x-occupancy-version', str(version).encode('latin-1'))]
+    if parse_etags(headers.get('if-none-match')).contains(etag):
+        return 304, b'', response_headers, queries
+    return 200, payload, [(b'content-type', b'application/json')] + response_headers, queries
+
+
+def load_context(user_key):
+    with parking.pool.connection() as conn:
+        return parking.parking_contexts.get(conn, user_key)
+
+
+async def parking_context(route, user_key):
+    context = parking.parking_contexts.peek(user_key)
+    if context is not None:
+        return context, 0
+    return await offload(route, load_context, user_key)
+
+
+async def my_parking_status(user_key, query, headers):
+    context, queries = await parking_context('my_parking_status', user_key)
+    return 200, json_body(parking.parking_status_payload(context)), JSON_HEADERS, queries
+
+
+async def my_accessible_zones(user_key, query, headers):
+    context, queries = await parking_context('my_accessible_zones', user_key)
+    return 200, json_body(parking.accessible_zones_payload(context)), JSON_HEADERS, queries
+
+
+def load_zone_status():
+    with parking.pool.connection() as conn:
+        return parking.zone_status_lots(conn)
+
+
+async def zone_status(user_key, query, headers):
+    lots, queries = await offload('zone_status', load_zone_status)
+    return 200, json_body({'lots': lots}), JSON_HEADERS, queries
+
+
+# Path -> (Flask endpoint name, used as the metrics route, and handler)
+FAST_ROUTES = {
+    '/api/parking-data': ('parking_data', parking_data),
+    '/api/zone-status': ('zone_status', zone_status),
+    '/api/my-accessible-zones': ('my_accessible_zones', my_accessible_zones),
+    '/my-parking-status': ('my_parking_status', my_parking_status)
+}
+
+
+def request_headers(scope):
+    headers = {}
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        # Browsers send one cookie header; HTTP/2 proxies may split it
+        if name == 'cookie' and name in headers:
+            value = f"{headers[name]}; {value}"
+        headers[name] = value
+    return headers
+
+
+# -- The logged-in user's key, or None when the request has to go through flask_login --
+async def authenticate(route, headers):
+    user_key = session_user_key(headers.get('cookie'))
+    if user_key is None:
+        return None
+    # A hit costs no database work (USER_CACHE_SHARED adds one indexed read every USER_CACHE_SYNC_SECONDS)
+    if parking.user_cache.get(user_key) is None:
+        user, _ = await offload(route, load_user, user_key)
+        if user is None:
+            return None
+    return user_key
+
+
+# -- Serves one of FAST_ROUTES, or returns False to let the Flask app handle the request --
+async def serve_fast(scope, send, route, handler):
+    headers = request_headers(scope)
+    user_key = await authenticate(route, headers)
+    if user_key is None:
+        return False
+
+    started = time.perf_counter()
+    try:
+        status, body, response_headers, queries = await handler(
+            user_key, dict(parse_qsl(scope['query_string'].decode('latin-1'))), headers)
+    except Exception:
+        traceback.print_exc()
+        status, body, response_headers, queries = 500, b'Internal Server Error', \
+            [(b'content-type', b'text/plain; charset=utf-8')], 0
+    if flask_app.config['METRICS_ENABLED']:
+        parking.metrics.record_request(route, 'GET', status, time.perf_counter() - started, queries)
+
+    # Same caching semantics as the Flask responses, which vary on the session cookie
+    response_headers = response_headers + [(b'content-length', str(len(body)).encode('latin-1')),
+                                           (b'vary', b'Cookie')]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body})
+    return True
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- LIVE EVENTS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Follows the EventHub on one thread and wakes every waiting stream on the event loop when events arrive --
+class EventRelay:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._arrived = None
+
+    def start(self, loop):
+        with self._lock:
+            if self._thread is None:
+                self._loop = loop
+                self._arrived = asyncio.Event()
+                self._thread = threading.Thread(target=self._follow, name='asgi-events', daemon=True)
+                self._thread.start()
+
+    def _follow(self):
+        last_seq = parking.events.sequence
+        while True:
+            pending = parking.events.wait(last_seq, timeout=15)
+            if pending:
+                last_seq = pending[-1][0]
+                self._loop.call_soon_threadsafe(self._wake)
+
+    # -- On the loop: releases everything waiting on the current generation and starts the next one --
+    def _wake(self):
+        arrived, self._arrived = self._arrived, asyncio.Event()
+        arrived.set()
+
+    # -- Events newer than last_seq, waiting up to `timeout` seconds for some; [] on timeout --
+    async def wait(self, last_seq, timeout):
+        if parking.events.sequence <= last_seq:
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return parking.events.wait(last_seq, timeout=0)
+
+
+relay = EventRelay()
+
+
+# -- /api/parking-events for a session-cookie user, same stream as the Flask view; False to fall back to it --
+async def serve_events(scope, receive, send):
+    headers = request_headers(scope)
+    if await authenticate('parking_events', headers) is None:
+        return False
+
+    loop = asyncio.get_running_loop()
+    relay.start(loop)
+    parking.occupancy.start_sync()
+    try:
+        last_seq = int(headers['last-event-id'])
+    except (KeyError, ValueError):
+        last_seq = None
+
+    # The request body (empty for a GET) comes first; after it, the next message is the disconnect
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return True
+        if not message.get('more_body', False):
+            break
+
+    current = parking.events.subscribe()
+    if last_seq is None or last_seq > current:
+        last_seq = current
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'), (b'vary', b'Cookie')]})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            waiting = asyncio.ensure_future(relay.wait(last_seq, 15))
+            await asyncio.wait([waiting, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiting.cancel()
+                break
+            pending = waiting.result()
+            if not pending:
+                # Heartbeat keeps proxies from closing an idle stream
+                chunk = ': keep-alive\n\n'
+            else:
+                last_seq = pending[-1][0]
+                chunk = ''.join(f'id: {seq}\nevent: {event_type}\ndata: {data}\n\n'
+                                for seq, _, event_type, data in pending)
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    except OSError:
+        # The client went away while we were sending
+        pass
+    finally:
+        disconnected.cancel()
+        parking.events.unsubscribe()
+    return True
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- WSGI FALLBACK  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+# -- Runs the Flask app on the WSGI threads. Responses with a Content-Length are read in one hop; --
+# streams (the SSE feed) are relayed chunk by chunk on the stream threads until the client disconnects.
+async def serve_wsgi(scope, receive, send):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            break
+
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        started['sized'] = any(name.lower() == 'content-length' for name, _ in headers)
+
+    def begin():
+        iterable = flask_app(wsgi_environ(scope, bytes(body)), start_response)
+        iterator = iter(iterable)
+        if started['sized']:
+            return iterable, iterator, b''.join(iterator), True
+        return iterable, iterator, next(iterator, None), False
+
+    iterable, iterator, chunk, finished = await loop.run_in_executor(wsgi_threads, begin)
+    try:
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        disconnected = asyncio.ensure_future(receive())
+        while not finished and chunk is not None:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            pending = loop.run_in_executor(stream_threads, next, iterator, None)
+            await asyncio.wait([pending, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                # The stream's thread is blocked in the generator until its next chunk (at most one keep-alive)
+                await pending
+                break
+            chunk = pending.result()
+        else:
+            await send({'type': 'http.response.body', 'body': chunk or b''})
+        disconnected.cancel()
+    finally:
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(wsgi_threads if finished else stream_threads, iterable.close)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- APPLICATION  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- What app.py's __main__ block does before serving --
+def startup():
+    parking.occupancy.ensure_loaded()
+    parking.password_hasher.start()
+    if flask_app.config['SCHEDULER_ENABLED']:
+        parking.scheduler.start()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(wsgi_threads, startup)
+            except Exception as error:
+                await send({'type': 'lifespan.startup.failed', 'message': str(error)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_threads.shutdown(wait=False)
+            wsgi_threads.shutdown(wait=False)
+            stream_threads.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    fast = FAST_ROUTES.get(scope['path']) if scope['method'] == 'GET' else None
+    if fast is not None and await serve_fast(scope, send, *fast):
+        return
+    if scope['path'] == '/api/parking-events' and scope['method'] == 'GET' and await serve_events(scope, receive, send):
+        return
+    await serve_wsgi(scope, receive, send)
@@ -0,0 +1,111 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SYNTHETIC YEAR  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- One year of closed sessions: weekday arrivals peak around 8 AM, stays of 30 minutes to 9 hours --
+def synthetic_year(per_day, year, lots, zones, seed=111):
+    rng = random.Random(seed)
+    key = 0
+    day = datetime(year, 1, 1)
+    while day.year == year:
+        daily = per_day if day.weekday() < 5 else per_day // 4
+        for _ in range(daily):
+            key += 1
+            arrival = day + timedelta(minutes=max(0, min(1439, int(rng.gauss(8 * 60, 120)))))
+            departure = arrival + timedelta(minutes=rng.randint(30, 540))
+            yield (key, rng.randint(1, 5000), rng.randint(1, 280), rng.choice(lots), rng.choice(zones),
+                   arrival.isoformat(sep=' '), departure.isoformat(sep=' '))
+        day += timedelta(days=1)
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<44} {(time.perf_counter() - started) * 1000:9.1f} ms")
+    return result
+
+
+# -- The same questions asked of one unpartitioned table without the precomputed columns --
+def naive_hourly(conn, start, end):
+    return conn.execute("""
+        WITH RECURSIVE hours(h) AS (SELECT 0 UNION ALL SELECT h + 1 FROM hours WHERE h < 23)
+        SELECT lot, hours.h, COUNT(*)
+        FROM flat JOIN hours
+            ON hours.h BETWEEN CAST(strftime('%H', arrival) AS INTEGER)
+                           AND CASE WHEN date(departure) = date(arrival)
+                                    THEN CAST(strftime('%H', departure) AS INTEGER) ELSE 23 END
+        WHERE arrival >= ? AND arrival < ?
+        GROUP BY lot, hours.h
+    """, [start, end]).fetchall()
+
+
+def naive_dwell(conn, start, end):
+    return conn.execute("""
+        SELECT zone, COUNT(*), AVG((julianday(departure) - julianday(arrival)) * 1440)
+        FROM flat WHERE arrival >= ? AND arrival < ?
+        GROUP BY zone
+    """, [start, end]).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a year of sessions into the monthly archive and time analytics.')
+    parser.add_argument('--per-day', type=int, default=5000)
+    parser.add_argument('--year', type=int, default=2025)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='archive-bench-')
+    os.environ['PARKING_ARCHIVE_DIR'] = os.path.join(workdir, 'archive')
+    os.environ['PARKING_DB'] = os.path.join(workdir, 'data.sqlite')
+    shutil.copyfile(os.path.join(APP_DIR, 'instance', 'data.sqlite'), os.environ['PARKING_DB'])
+    os.environ['PARKING_SCHEDULER'] = '0'
+    sys.path.insert(0, APP_DIR)
+    import app as parking_app
+
+    rows = list(synthetic_year(args.per_day, args.year, [1, 2, 3], [1, 2, 3]))
+    archive = parking_app.history_archive
+    started = time.perf_counter()
+    for i in range(0, len(rows), 50_000):
+        archive.store(rows[i:i + 50_000])
+    elapsed = time.perf_counter() - started
+    print(f"archived {len(rows):,} sessions into {len(archive.months())} monthly files "
+          f"in {elapsed:.1f} s ({len(rows) / elapsed:,.0f} rows/s)")
+
+    flat = sqlite3.connect(os.path.join(workdir, 'flat.sqlite'))
+    flat.execute("CREATE TABLE flat (key integer PRIMARY KEY, vehicle, spot, lot, zone, arrival, departure)")
+    flat.executemany("INSERT INTO flat VALUES(?, ?, ?, ?, ?, ?, ?)", rows)
+    flat.execute("CREATE INDEX idx_flat_arrival ON flat(arrival)")
+    flat.commit()
+
+    year_start, year_end = f'{args.year}-01-01', f'{args.year + 1}-01-01'
+    month_start, month_end = f'{args.year}-03-01', f'{args.year}-04-01'
+
+    timed('archive: hourly occupancy per lot, full year', archive.hourly_occupancy, year_start, year_end)
+    timed('single table: hourly occupancy, full year', naive_hourly, flat, year_start, year_end)
+    timed('archive: hourly occupancy per lot, one month', archive.hourly_occupancy, month_start, month_end)
+    timed('single table: hourly occupancy, one month', naive_hourly, flat, month_start, month_end)
+    timed('archive: dwell per zone, full year', archive.dwell_by_zone, year_start, year_end)
+    timed('single table: dwell per zone, full year', naive_dwell, flat, year_start, year_end)
+    timed('archive: dwell per zone, one month', archive.dwell_by_zone, month_start, month_end)
+    timed('single table: dwell per zone, one month', naive_dwell, flat, month_start, month_end)
+
+    flat.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
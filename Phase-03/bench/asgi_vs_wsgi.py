@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import generate_campus
+
+SERVERS = ('werkzeug', 'gunicorn', 'uvicorn')
+MAP_CALLS = ('/api/parking-data', '/api/zone-status', '/api/my-accessible-zones', '/my-parking-status')
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SERVERS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Runs in the server subprocess: app.run's threaded Werkzeug server (a thread and a connection per request), --
+# one gunicorn gthread worker (keep-alive, a thread per open connection) or asgi.py under uvicorn
+def serve(mode, port, threads):
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    if mode == 'werkzeug':
+        from werkzeug.serving import run_simple
+        import app as parking_app
+        parking_app.occupancy.ensure_loaded()
+        run_simple('127.0.0.1', port, parking_app.app, threaded=True)
+    elif mode == 'gunicorn':
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1',
+                                   '--worker-class', 'gthread', '--threads', str(threads), '--keep-alive', '30',
+                                   '--backlog', '4096', '--log-level', 'warning', 'app:app'])
+    else:
+        import uvicorn
+        uvicorn.run('asgi:application', host='127.0.0.1', port=port, log_level='warning', backlog=4096,
+                    timeout_keep_alive=30, timeout_graceful_shutdown=1)
+
+
+def start_server(mode, port, threads):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port),
+                                '--threads', str(threads)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            asyncio.run(HttpConnection('127.0.0.1', port).request('GET', '/login'))
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{mode} server did not start')
+
+
+# -- Stops the server and its children: a gunicorn worker still draining event streams would otherwise outlive --
+# its master and keep the port
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+# -- CPU seconds and thread count of a server and its children (gunicorn's worker), from /proc --
+def process_usage(pid):
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    cpu, threads = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{pid}/status') as f:
+                threads += next(int(line.split()[1]) for line in f if line.startswith('Threads:'))
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu, threads
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CLIENT  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Minimal keep-alive HTTP/1.1 client, so one process can hold thousands of viewer connections --
+class HttpConnection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    # -- Like a browser, a request that finds its idle keep-alive connection closed is retried on a new one --
+    async def request(self, method, path, headers=None, body=b''):
+        if self.writer is not None:
+            try:
+                return await self._request(method, path, headers, body)
+            except (ConnectionResetError, BrokenPipeError):
+                self.close()
+        return await self._request(method, path, headers, body)
+
+    async def _request(self, method, path, headers, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        try:
+            head = await self.reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            self.close()
+            raise ConnectionResetError('connection closed by server')
+
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        for line in header_lines:
+            if line:
+                name, value = line.split(':', 1)
+                response_headers.setdefault(name.strip().lower(), []).append(value.strip())
+
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length'][0]))
+        elif response_headers.get('transfer-encoding', [''])[0].lower() == 'chunked':
+            data = b''
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                data += await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            data = b''
+        if status_line.startswith('HTTP/1.0') or response_headers.get('connection', [''])[0].lower() == 'close':
+            self.close()
+        return status, response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+# -- Logs a viewer in and returns their session cookie --
+async def login(host, port, user_number):
+    body = urllib.parse.urlencode({'login_id': f'user{user_number}',
+                                   'password': generate_campus.DEFAULT_PASSWORD}).encode('utf-8')
+    connection = HttpConnection(host, port)
+    try:
+        status, headers, _ = await connection.request(
+            'POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    finally:
+        connection.close()
+    cookies = [value.split(';', 1)[0] for value in headers.get('set-cookie', []) if value.startswith('session=')]
+    if status != 302 or not cookies:
+        raise RuntimeError(f'login of user{user_number} failed with {status}')
+    return cookies[0]
+
+
+# -- Viewers reload the four read-only map calls in parallel, one connection per call like a browser, then idle --
+async def run_viewers(port, cookies, duration, think):
+    latencies, statuses, loads = [], {}, [0]
+    deadline = time.perf_counter() + duration
+
+    async def timed(connection, path, headers):
+        started = time.perf_counter()
+        try:
+            status, response_headers, _ = await asyncio.wait_for(connection.request('GET', path, headers), 30)
+        except (OSError, EOFError, asyncio.TimeoutError):
+            connection.close()
+            status, response_headers = 'error', {}
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+        return response_headers
+
+    async def viewer(cookie, rng):
+        connections = [HttpConnection('127.0.0.1', port) for _ in MAP_CALLS]
+        version = etag = None
+        # Spread the first loads over one think time so the viewers do not arrive in lockstep
+        await asyncio.sleep(rng.uniform(0, think))
+        while time.perf_counter() < deadline:
+            # After the first full load, parking data is polled as the map page does: ?since= with If-None-Match
+            requests = []
+            for path in MAP_CALLS:
+                headers = {'Cookie': cookie}
+                if path == '/api/parking-data' and version is not None:
+                    path = f'{path}?since={version}'
+                    headers['If-None-Match'] = etag
+                requests.append((path, headers))
+            responses = await asyncio.gather(*(timed(connection, path, headers)
+                                               for connection, (path, headers) in zip(connections, requests)))
+            if 'x-occupancy-version' in responses[0]:
+                version = responses[0]['x-occupancy-version'][0]
+                etag = responses[0]['etag'][0]
+            loads[0] += 1
+            await asyncio.sleep(rng.expovariate(1 / think))
+        for connection in connections:
+            connection.close()
+
+    rng = random.Random(111)
+    started = time.perf_counter()
+    await asyncio.gather(*(viewer(cookie, random.Random(rng.random())) for cookie in cookies))
+    return time.perf_counter() - started, sorted(latencies), statuses, loads[0]
+
+
+# -- An open EventSource on the live event stream, held until `deadline`; True if it stayed open that long --
+async def hold_stream(port, cookie, deadline):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return False
+    try:
+        writer.write((f'GET /api/parking-events HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nCookie: {cookie}\r\n'
+                      f'Accept: text/event-stream\r\n\r\n').encode('latin-1'))
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 30)
+        if int(head.split()[1]) != 200:
+            return False
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return True
+            try:
+                # Keep-alives and events are read and dropped; only the open connection matters here
+                if not await asyncio.wait_for(reader.read(65536), remaining):
+                    return False
+            except asyncio.TimeoutError:
+                return True
+    except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+def percentile(samples, share):
+    return samples[min(len(samples) - 1, int(len(samples) * share))] if samples else 0.0
+
+
+def run_level(mode, port, threads, user_numbers, duration, think, streams):
+    process = start_server(mode, port, threads)
+    try:
+        async def logins():
+            # A few at a time: the logins themselves are not what is being measured
+            cookies = []
+            for start in range(0, len(user_numbers), 20):
+                cookies += await asyncio.gather(*(login('127.0.0.1', port, number)
+                                                  for number in user_numbers[start:start + 20]))
+            return cookies
+
+        cookies = asyncio.run(logins())
+        cpu_before, _ = process_usage(process.pid)
+        peak_threads = [0]
+
+        async def measured():
+            async def sample_threads():
+                while True:
+                    peak_threads[0] = max(peak_threads[0], process_usage(process.pid)[1])
+                    await asyncio.sleep(0.5)
+            sampler = asyncio.ensure_future(sample_threads())
+            # Open map pages also hold the event stream for the whole run, as the browser's EventSource does
+            deadline = time.perf_counter() + duration
+            held = asyncio.gather(*(hold_stream(port, cookies[i % len(cookies)], deadline) for i in range(streams)))
+            try:
+                return await run_viewers(port, cookies, duration, think), await held
+            finally:
+                sampler.cancel()
+
+        (elapsed, latencies, statuses, loads), held = asyncio.run(measured())
+        cpu_after, _ = process_usage(process.pid)
+    finally:
+        stop_server(process)
+
+    requests = len(latencies)
+    return {
+        'requests': requests,
+        'requests_per_second': requests / elapsed,
+        'map_loads': loads,
+        'ok': statuses.get(200, 0) + statuses.get(304, 0),
+        'failed': requests - statuses.get(200, 0) - statuses.get(304, 0),
+        'p50_ms': statistics.median(latencies) if latencies else 0.0,
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'server_cpu_ms_per_request': (cpu_after - cpu_before) * 1000 / requests if requests else 0.0,
+        'server_threads': peak_threads[0],
+        'streams_held': sum(held)
+    }
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- COMPARISON  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent map viewers against the WSGI servers and the ASGI "
+                                                 "entry point (asgi.py), side by side.")
+    parser.add_argument('--viewers', type=int, nargs='+', default=[50, 500, 2000],
+                        help='concurrent logged-in viewers per run')
+    parser.add_argument('--think', type=float, default=2.0, help='mean seconds between a viewer\'s map reloads')
+    parser.add_argument('--streams', type=int, default=64,
+                        help='open /api/parking-events streams held next to the viewers')
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--modes', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--spots', type=int, default=10_000)
+    parser.add_argument('--port', type=int, default=8411)
+    parser.add_argument('--seed', type=int, default=111)
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.threads)
+        return
+
+    import endpoint_benchmarks
+    workdir = tempfile.mkdtemp(prefix='asgi-vs-wsgi-')
+    try:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Enough users for the largest run; build_campus sets PARKING_DB and the archive dir for the servers
+            database, counts = endpoint_benchmarks.build_campus(workdir, max(args.spots, max(args.viewers) * 10),
+                                                                args.seed)
+        os.environ.update(PARKING_DB=database, PARKING_SCHEDULER='0', PARKING_PASSWORD_WORKERS='0')
+        print(f"{counts['spots']:,} spots, {counts['users']:,} users; viewers reload the 4 map calls every "
+              f"{args.think:.1f} s on average for {args.duration:.0f} s with {args.streams} event streams open; "
+              f"{os.cpu_count()} CPUs shared with the client")
+        print(f"{'server':<9} {'viewers':>8} {'req/s':>8} {'ok':>8} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'cpu ms/req':>11} {'peak threads':>13} {'streams held':>13}")
+
+        for viewers in args.viewers:
+            user_numbers = random.Random(args.seed).sample(range(1, counts['users'] + 1), viewers)
+            for mode in args.modes:
+                r = run_level(mode, args.port, args.threads, user_numbers, args.duration, args.think, args.streams)
+                print(f"{mode:<9} {viewers:>8} {r['requests_per_second']:>8.1f} {r['ok']:>8} {r['failed']:>7} "
+                      f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                      f"{r['server_cpu_ms_per_request']:>11.3f} {r['server_threads']:>13} "
+                      f"{r['streams_held']:>8}/{args.streams:<4}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- BROADCAST LATENCY  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Parks `subscribers` listeners on the event hub and measures publish -> delivery time for each event. --
+# Every listener runs the same wait loop as the /api/parking-events stream.
+def measure(hub, subscribers, event_count, interval):
+    latencies = []
+    latencies_lock = threading.Lock()
+    ready = threading.Barrier(subscribers + 1)
+    stop = threading.Event()
+
+    def listen():
+        last_seq = hub.subscribe()
+        ready.wait()
+        try:
+            while not stop.is_set():
+                pending = hub.wait(last_seq, timeout=1)
+                received = time.time()
+                local = []
+                for seq, published, _, _ in pending:
+                    last_seq = seq
+                    local.append((received - published) * 1000)
+                if local:
+                    with latencies_lock:
+                        latencies.extend(local)
+        finally:
+            hub.unsubscribe()
+
+    threading.stack_size(256 * 1024)
+    listeners = [threading.Thread(target=listen, daemon=True) for _ in range(subscribers)]
+    for listener in listeners:
+        listener.start()
+    ready.wait()
+
+    for i in range(event_count):
+        hub.publish('claim', '{"spots":[],"version":%d}' % i)
+        time.sleep(interval)
+
+    # Give the slowest listener time to drain the last event
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with latencies_lock:
+            if len(latencies) >= subscribers * event_count:
+                break
+        time.sleep(0.05)
+
+    stop.set()
+    for listener in listeners:
+        listener.join(timeout=2)
+
+    latencies.sort()
+    return {
+        'delivered': len(latencies),
+        'expected': subscribers * event_count,
+        'p50_ms': statistics.median(latencies) if latencies else 0.0,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0,
+        'max_ms': latencies[-1] if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure spot event broadcast latency at increasing subscriber counts.')
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--gevent', action='store_true', help='monkey-patch with gevent, as under gunicorn -k gevent')
+    args = parser.parse_args()
+
+    if args.gevent:
+        from gevent import monkey
+        monkey.patch_all()
+
+    # Only the event hub is used, but importing the app migrates its database, so point it at a copy
+    workdir = tempfile.mkdtemp(prefix='broadcast-bench-')
+    os.environ['PARKING_DB'] = os.path.join(workdir, 'data.sqlite')
+    os.environ['PARKING_SCHEDULER'] = '0'
+    shutil.copyfile(os.path.join(APP_DIR, 'instance', 'data.sqlite'), os.environ['PARKING_DB'])
+    sys.path.insert(0, APP_DIR)
+    import app as parking_app
+
+    for subscribers in args.subscribers:
+        hub = parking_app.EventHub()
+        result = measure(hub, subscribers, args.events, args.interval)
+        print(f"{subscribers:>6} subscribers: delivered {result['delivered']}/{result['expected']}  "
+              f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms  max {result['max_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+PHASE2_DATA = os.path.join(os.path.dirname(APP_DIR), 'Phase-02', 'data')
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SYNTHETIC .TBL FILES  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Writes a campus of about `rows` rows in Phase-02 .tbl format, NULLs and trailing spaces included --
+def write_dataset(directory, rows, seed):
+    rng = random.Random(seed)
+    users = rows // 4
+    spots = rows // 20
+    sessions = rows - 3 * users - spots + users // 5
+
+    for table in ('zone', 'lot', 'permitType', 'zoneAssignment'):
+        shutil.copyfile(os.path.join(PHASE2_DATA, f'{table}.tbl'), os.path.join(directory, f'{table}.tbl'))
+
+    def write(table, lines):
+        with open(os.path.join(directory, f'{table}.tbl'), 'w') as f:
+            f.writelines(lines)
+
+    write('users', (f'{i}|User {i}|user{i}@ucmerced.edu|pass{i}\n' for i in range(1, users + 1)))
+    write('vehicles', (f'{i}|{i}|P{i:07d}|CA|Honda|Civic|Gray\n' for i in range(1, users + 1)))
+    write('permit', (f'{i}|{i}|{i}|{rng.randint(1, 8)}|PRM{i:07d}|2025-08-15|2026-05-19\n'
+                     for i in range(1, users - users // 5 + 1)))
+    write('spots', (f'{i}|{rng.randint(1, 3)}|0|S{i}|1|{rng.uniform(37.355, 37.375):.6f}|'
+                    f'{rng.uniform(-120.435, -120.415):.6f}|{rng.randint(1, 3)}\n' for i in range(1, spots + 1)))
+
+    def history():
+        for i in range(1, sessions + 1):
+            departure = 'NULL   ' if rng.random() < 0.05 else '2025-11-20 17:00:00'
+            yield f'{i}|{rng.randint(1, users)}|{rng.randint(1, spots)}|2025-11-20 08:00:00|{departure}\n'
+    write('parkingHistory', history())
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- BASELINE: sqlite3 shell .import (Phase-02/data/bulkLoad.txt)  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def shell_import(path, directory, tables):
+    script = '.mode csv\n.separator "|"\n' + ''.join(
+        f'.import {os.path.join(directory, table + ".tbl")} {table}\n' for table in tables)
+    subprocess.run(['sqlite3', path], input=script, text=True, check=True, capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the bulk loader against sqlite3 .import on synthetic data.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bulk-load-bench-')
+    data_dir = os.path.join(workdir, 'data')
+    os.mkdir(data_dir)
+    started = time.perf_counter()
+    write_dataset(data_dir, args.rows, args.seed)
+    print(f"wrote synthetic .tbl files in {time.perf_counter() - started:.1f} s")
+
+    sys.path.insert(0, APP_DIR)
+    import bulk_load
+
+    # Both targets start from the same migrated, empty schema (indexes included)
+    loader_db = os.path.join(workdir, 'loader.sqlite')
+    bulk_load.migrate(loader_db)
+    shell_db = os.path.join(workdir, 'shell.sqlite')
+    shutil.copyfile(loader_db, shell_db)
+
+    started = time.perf_counter()
+    results, index_seconds, violations, failed_indexes = bulk_load.bulk_load(loader_db, data_dir)
+    loader_seconds = time.perf_counter() - started
+    total = sum(loaded for _, loaded, _, _ in results)
+    for table, loaded, rejects, seconds in results:
+        print(f"  {table:<16} {loaded:>10,} rows  {loaded / seconds if seconds else 0:>12,.0f} rows/s")
+    print(f"bulk loader : {total:,} rows in {loader_seconds:.2f} s ({total / loader_seconds:,.0f} rows/s), "
+          f"indexes {index_seconds:.2f} s, {len(violations)} FK violations, {len(failed_indexes)} indexes not rebuilt")
+
+    if shutil.which('sqlite3'):
+        started = time.perf_counter()
+        shell_import(shell_db, data_dir, [table for table, _, _, _ in results])
+        shell_seconds = time.perf_counter() - started
+        conn = sqlite3.connect(shell_db)
+        literal_nulls = conn.execute(
+            "SELECT COUNT(*) FROM parkingHistory WHERE ph_departuretime IS NOT NULL "
+            "AND TRIM(ph_departuretime) = 'NULL'").fetchone()[0]
+        conn.close()
+        print(f"sqlite3 .import : {shell_seconds:.2f} s ({total / shell_seconds:,.0f} rows/s), "
+              f"{literal_nulls:,} departures stored as the text 'NULL'")
+    else:
+        print("sqlite3 shell not found; skipped the .import baseline")
+
+    conn = sqlite3.connect(loader_db)
+    loader_nulls = conn.execute("SELECT COUNT(*) FROM parkingHistory WHERE ph_departuretime IS NULL").fetchone()[0]
+    conn.close()
+    print(f"bulk loader stored {loader_nulls:,} open sessions as SQL NULL")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, APP_DIR)
+
+from storage import campus_now, campus_timestamp
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SETUP  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Copies the database so the stress run never touches instance/data.sqlite --
+def copy_database(source):
+    workdir = tempfile.mkdtemp(prefix='claim-stress-')
+    target = os.path.join(workdir, 'data.sqlite')
+    shutil.copyfile(source, target)
+    return target
+
+
+# -- A new PostgreSQL database on the server `url` points at, loaded with the .tbl files in data_dir --
+def load_postgresql(url, data_dir):
+    import bulk_load
+    import endpoint_benchmarks
+    target = endpoint_benchmarks.create_database(url, 'claim_stress')
+    bulk_load.migrate(target)
+    bulk_load.bulk_load(target, data_dir)
+    return target
+
+
+# -- A SQLite path or a postgresql:// URL; both connections take ? placeholders --
+def connect(target):
+    if target.startswith('postgresql://'):
+        import postgres
+        return postgres.connect(target)
+    return sqlite3.connect(target)
+
+
+# -- Creates drivers with a Daily Off-Campus permit (Green zone access) --
+def seed_drivers(target, count):
+    conn = connect(target)
+    cursor = conn.cursor()
+    issued = campus_now()
+    cursor.execute("SELECT COALESCE(MAX(u_userkey), 0), (SELECT COALESCE(MAX(v_vehicleskey), 0) FROM vehicles), "
+                   "(SELECT COALESCE(MAX(p_permitkey), 0) FROM permit) FROM users")
+    user_base, vehicle_base, permit_base = cursor.fetchone()
+
+    users = []
+    for i in range(1, count + 1):
+        user_key, vehicle_key, permit_key = user_base + i, vehicle_base + i, permit_base + i
+        cursor.execute("INSERT INTO users VALUES(?, ?, ?, ?)",
+                       [user_key, f'stress{i}', f'stress{i}@ucmerced.edu', 'x'])
+        cursor.execute("INSERT INTO vehicles VALUES(?, ?, ?, 'CA', 'Honda', 'Civic', 'Gray')",
+                       [vehicle_key, user_key, f'ST{i:05d}'])
+        cursor.execute("INSERT INTO permit VALUES(?, ?, ?, 6, ?, ?, ?)",
+                       [permit_key, user_key, vehicle_key, f'STR{i:05d}', campus_timestamp(issued),
+                        campus_timestamp(issued + timedelta(days=1))])
+        users.append(user_key)
+
+    conn.commit()
+    conn.close()
+    return users
+
+
+# -- Free, active Green spots in the target lot. The raw .tbl data has open sessions on some spots marked free; --
+# those are left out so every double booking the check finds was made during the run.
+def free_spots(target, lot_key):
+    conn = connect(target)
+    rows = conn.execute("""
+        SELECT s.s_num FROM spots s JOIN zone z ON s.s_zonekey = z.z_zonekey
+        WHERE s.s_lotkey = ? AND s.s_status = 0 AND s.s_isactive = 1 AND z.z_type = 'Green'
+          AND NOT EXISTS (SELECT 1 FROM parkingHistory ph
+                          WHERE ph.ph_spotskey = s.s_spotskey AND ph.ph_departuretime IS NULL)
+    """, [lot_key]).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- LEGACY CLAIM PATH (pre claim-engine, kept for comparison)  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def legacy_claim(path, user_key, spot_num):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT p.p_permitkey, p.p_vehicleskey, pt.pt_category
+            FROM permit p
+            JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
+            WHERE p.p_userkey = ? AND p.p_expirationdate >= DATETIME('now', '-08:00')
+        """, [user_key])
+        permit_result = cursor.fetchone()
+        if not permit_result:
+            return 403
+        permit_key, vehicle_key, permit_category = permit_result
+
+        cursor.execute("""
+            SELECT COUNT(*) FROM parkingHistory ph
+            WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
+        """, [vehicle_key])
+        if cursor.fetchone()[0] > 0:
+            return 400
+
+        cursor.execute("""
+            SELECT s.s_spotskey, s.s_status, s.s_isactive, s.s_zonekey, s.s_lotkey, z.z_type, l.l_name
+            FROM spots s
+            JOIN zone z ON s.s_zonekey = z.z_zonekey
+            JOIN lot l ON s.s_lotkey = l.l_lotkey
+            WHERE s.s_num = ?
+        """, [spot_num])
+        spot_result = cursor.fetchone()
+        if not spot_result:
+            return 404
+        spot_key, is_occupied, is_active, spot_zone_key, lot_key, spot_zone_type, lot_name = spot_result
+        if is_occupied or not is_active:
+            return 400
+
+        cursor.execute("SELECT za_isactive FROM zoneAssignment WHERE za_lotkey = ? AND za_zonekey = ?",
+                       [lot_key, spot_zone_key])
+        assignment = cursor.fetchone()
+        if not assignment or not assignment[0]:
+            return 403
+
+        cursor.execute("SELECT MAX(ph_parkinghistkey) FROM parkingHistory")
+        new_history_key = (cursor.fetchone()[0] or 0) + 1
+        cursor.execute("""
+            INSERT INTO parkingHistory(ph_parkinghistkey, ph_vehicleskey, ph_spotskey,
+                                       ph_arrivaltime, ph_departuretime)
+            VALUES(?, ?, ?, DATETIME('now', '-08:00'), NULL)
+        """, [new_history_key, vehicle_key, spot_key])
+        cursor.execute("UPDATE spots SET s_status = 1 WHERE s_spotskey = ?", [spot_key])
+        conn.commit()
+        return 200
+    except sqlite3.Error:
+        return 500
+    finally:
+        conn.close()
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- RUN + VERIFY  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def fire(claim, jobs, threads):
+    def timed(job):
+        started = time.perf_counter()
+        status = claim(*job)
+        return status, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(timed, jobs))
+
+    latencies = sorted(ms for _, ms in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'statuses': statuses
+    }
+
+
+# -- Number of spots with more than one open parking session --
+def double_bookings(target):
+    conn = connect(target)
+    doubled = conn.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT ph_spotskey FROM parkingHistory WHERE ph_departuretime IS NULL
+            GROUP BY ph_spotskey HAVING COUNT(*) > 1) AS doubled
+    """).fetchone()[0]
+    conn.close()
+    return doubled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fire parallel claims at one lot and check for double booking.')
+    parser.add_argument('--db', default=os.path.join(APP_DIR, 'instance', 'data.sqlite'))
+    parser.add_argument('--lot', type=int, default=2)
+    parser.add_argument('--drivers', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=111)
+    parser.add_argument('--postgres-url', help='run the claim engine on PostgreSQL instead: a claim_stress database '
+                                               'is created on this server, loaded from --data and dropped afterwards')
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(APP_DIR), 'Phase-02', 'data'),
+                        help='.tbl files loaded into the PostgreSQL database')
+    args = parser.parse_args()
+
+    # The legacy path is SQLite only; on PostgreSQL just the claim engine runs, under its row locks
+    if args.postgres_url:
+        engine_db = load_postgresql(args.postgres_url, args.data)
+        legacy_db = None
+    else:
+        engine_db = copy_database(args.db)
+        legacy_db = copy_database(args.db)
+    parking_app = None
+    try:
+        users = seed_drivers(engine_db, args.drivers)
+        if legacy_db:
+            seed_drivers(legacy_db, args.drivers)
+
+        # Every driver aims at a random free spot, so most spots are contested several times over
+        spots = free_spots(engine_db, args.lot)
+        if not spots:
+            print(f"FAIL: lot {args.lot} has no free Green spots")
+            sys.exit(1)
+        rng = random.Random(args.seed)
+        jobs = [(user_key, rng.choice(spots)) for user_key in users]
+
+        if legacy_db:
+            os.environ['PARKING_DB'] = engine_db
+        os.environ['PARKING_SCHEDULER'] = '0'
+        import app as parking_app
+
+        def engine_claim(user_key, spot_num):
+            with parking_app.pool.connection() as conn:
+                return parking_app.claim_spot_for_user(conn, user_key, spot_num)[1]
+
+        engine = fire(engine_claim, jobs, args.threads)
+        engine_doubled = double_bookings(engine_db)
+
+        print(f"{len(jobs)} claims over {len(spots)} free spots, {args.threads} threads, {parking_app.store.name}")
+        print(f"claim engine : p50 {engine['p50_ms']:.2f} ms  p99 {engine['p99_ms']:.2f} ms  "
+              f"statuses {engine['statuses']}  double-booked spots {engine_doubled}")
+        if legacy_db:
+            legacy = fire(lambda user_key, spot_num: legacy_claim(legacy_db, user_key, spot_num), jobs, args.threads)
+            legacy_doubled = double_bookings(legacy_db)
+            print(f"legacy path  : p50 {legacy['p50_ms']:.2f} ms  p99 {legacy['p99_ms']:.2f} ms  "
+                  f"statuses {legacy['statuses']}  double-booked spots {legacy_doubled}")
+    finally:
+        if parking_app is not None:
+            parking_app.pool.close()
+        if args.postgres_url:
+            import endpoint_benchmarks
+            endpoint_benchmarks.drop_database(args.postgres_url, 'claim_stress')
+
+    if engine_doubled:
+        print("FAIL: claim engine double-booked a spot")
+        sys.exit(1)
+    print("OK: no spot was double-booked by the claim engine")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+DEFAULT_BASELINE = os.path.join(HERE, 'baselines', 'endpoints.json')
+sys.path.insert(0, HERE)
+
+import generate_campus
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CAMPUS FIXTURE  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- A generated campus with `size` spots and roughly `size` closed sessions, plus one open session per 10 spots. --
+# Loaded into workdir/data.sqlite, or into `database_url` (PostgreSQL) when given.
+def build_campus(workdir, size, seed, database_url=None):
+    import bcrypt
+    data_dir = os.path.join(workdir, 'data')
+    os.mkdir(data_dir)
+    lots = max(2, size // 500)
+    users = max(100, size // 10)
+    password_hash = bcrypt.hashpw(generate_campus.DEFAULT_PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+    counts = generate_campus.generate(data_dir, lots, size // lots, users, 30, seed, password_hash)
+
+    os.environ['PARKING_ARCHIVE_DIR'] = os.path.join(workdir, 'archive')
+    sys.path.insert(0, APP_DIR)
+    import bulk_load
+    database = database_url or os.path.join(workdir, 'data.sqlite')
+    bulk_load.migrate(database)
+    bulk_load.bulk_load(database, data_dir)
+    return database, counts
+
+
+# -- A new, empty database named `name` on the server `url` points at; returns its URL --
+def create_database(url, name):
+    import psycopg
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+        admin.execute(f"CREATE DATABASE {name}")
+    return urlsplit(url)._replace(path=f'/{name}').geturl()
+
+
+def drop_database(url, name):
+    import psycopg
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+
+
+# -- Parks `count` permit holders in free Green spots an hour ago, skipping the benchmark driver --
+def open_sessions(conn, count, skip_user):
+    vehicles = [row[0] for row in conn.execute("""
+        SELECT DISTINCT p_vehicleskey FROM permit WHERE p_userkey != ? LIMIT ?
+    """, [skip_user, count])]
+    spots = [row[0] for row in conn.execute("""
+        SELECT s_spotskey FROM spots WHERE s_zonekey = 1 AND s_status = 0 AND s_isactive = 1
+        ORDER BY s_spotskey DESC LIMIT ?
+    """, [len(vehicles)])]
+    arrival = generate_campus.fmt(generate_campus.campus_now() - timedelta(hours=1))
+    conn.executemany("""
+        INSERT INTO parkingHistory(ph_vehicleskey, ph_spotskey, ph_arrivaltime, ph_departuretime) VALUES(?, ?, ?, NULL)
+    """, [(vehicle, spot, arrival) for vehicle, spot in zip(vehicles, spots)])
+    conn.executemany("UPDATE spots SET s_status = 1 WHERE s_spotskey = ?", [(spot,) for spot in spots])
+    conn.commit()
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- MEASUREMENT  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'iterations': len(samples),
+        'p50_ms': round(statistics.median(samples), 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        'mean_ms': round(statistics.fmean(samples), 4)
+    }
+
+
+# -- Times fn() `iterations` times after `warmup` untimed calls; setup() runs untimed before every call --
+def measure(fn, iterations, warmup=3, setup=None):
+    samples = []
+    for i in range(warmup + iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+
+def expect(response, *statuses):
+    if response.status_code not in statuses:
+        raise RuntimeError(f"{response.request.method} {response.request.path} returned {response.status_code}")
+    return response
+
+
+# -- Runs every benchmark against one campus size; only called in a fresh process, as app binds to one database. --
+# With `postgres_url`, the campus goes into a new PostgreSQL database on that server, dropped afterwards.
+def run_size(size, iterations, job_iterations, seed, postgres_url=None):
+    workdir = tempfile.mkdtemp(prefix=f'endpoint-bench-{size}-')
+    database_name = f'parking_bench_{size}_{os.getpid()}'
+    try:
+        database_url = create_database(postgres_url, database_name) if postgres_url else None
+        database, counts = build_campus(workdir, size, seed, database_url)
+        import app as parking_app
+        parking_app.app.config['PURGE_PAUSE_SECONDS'] = 0
+        pool = parking_app.pool
+
+        # The driver holds a Faculty Yearly permit, which every seeded rule lets park in Green
+        with pool.connection() as conn:
+            user_key, vehicle_key = conn.execute("""
+                SELECT p_userkey, p_vehicleskey FROM permit WHERE p_permittypekey = 1 ORDER BY p_permitkey LIMIT 1
+            """).fetchone()
+            open_sessions(conn, size // 10, user_key)
+            free_green = [row[0] for row in conn.execute("""
+                SELECT s_num FROM spots WHERE s_zonekey = 1 AND s_status = 0 AND s_isactive = 1
+                ORDER BY s_spotskey LIMIT 500
+            """)]
+            counts['open sessions'] = conn.execute(
+                "SELECT COUNT(*) FROM parkingHistory WHERE ph_departuretime IS NULL").fetchone()[0]
+
+        client = parking_app.app.test_client()
+        expect(client.post('/login', data={'login_id': f'user{user_key}',
+                                           'password': generate_campus.DEFAULT_PASSWORD}), 302)
+        results = {}
+
+        def get(path):
+            return lambda: expect(client.get(path), 200)
+
+        results['parking_data'] = measure(get('/api/parking-data'), iterations)
+        results['my_parking_status'] = measure(get('/my-parking-status'), iterations)
+        results['zone_status'] = measure(get('/api/zone-status'), iterations)
+        results['view_permit'] = measure(get('/view_permit'), iterations)
+        results['apply_permit_form'] = measure(get('/apply_permit'), iterations)
+
+        # Claim and unclaim alternate on the same driver, each timed on its own
+        claims, unclaims = [], []
+        for i in range(iterations + 3):
+            started = time.perf_counter()
+            expect(client.post(f'/claim-spot/{free_green[i % len(free_green)]}'), 200)
+            claimed = time.perf_counter()
+            expect(client.post('/unclaim-spot'), 200)
+            if i >= 3:
+                claims.append((claimed - started) * 1000)
+                unclaims.append((time.perf_counter() - claimed) * 1000)
+        results['claim_spot'] = summarize(claims)
+        results['unclaim_spot'] = summarize(unclaims)
+
+        results['apply_permit'] = measure(
+            lambda: expect(client.post('/apply_permit', data={'vehicle_key': vehicle_key, 'permit_type_key': 1}), 302),
+            iterations)
+
+        # The jobs print a line per pass; keep that out of the report
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            results['enforce_parking_rules'] = measure(parking_app.enforce_parking_rules, job_iterations, warmup=1)
+
+            # Each purge pass starts from the same rows: the deleted ones are put back untimed beforehand.
+            # CREATE TABLE AS takes no parameters on PostgreSQL, so the cutoff is written into the statement.
+            cutoff = generate_campus.fmt(generate_campus.campus_now() - timedelta(hours=24))
+            with pool.connection() as conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS bench_history AS
+                    SELECT * FROM parkingHistory
+                    WHERE ph_departuretime < '{cutoff}'
+                """)
+                expired_vehicles = conn.execute("""
+                    SELECT v_vehicleskey, v_userkey FROM vehicles
+                    WHERE v_vehicleskey NOT IN (SELECT ph_vehicleskey FROM parkingHistory) LIMIT ?
+                """, [max(1, size // 10)]).fetchall()
+
+            # Session keys are GENERATED ALWAYS on PostgreSQL; putting the same rows back has to say so
+            overriding = ' OVERRIDING SYSTEM VALUE' if parking_app.store.name == 'postgresql' else ''
+
+            def restore_history():
+                with pool.connection() as conn:
+                    conn.execute(f"""
+                        INSERT INTO parkingHistory{overriding}
+                        SELECT * FROM bench_history WHERE true ON CONFLICT DO NOTHING
+                    """)
+                    conn.commit()
+
+            def add_expired_permits():
+                with pool.connection() as conn:
+                    conn.executemany("""
+                        INSERT INTO permit(p_userkey, p_vehicleskey, p_permittypekey, p_permitnum,
+                                           p_issuedate, p_expirationdate)
+                        VALUES(?, ?, 8, ?, '2000-01-01 08:00:00', '2000-01-01 09:00:00')
+                    """, [(owner, vehicle, f'EXP{vehicle}') for vehicle, owner in expired_vehicles])
+                    conn.commit()
+
+            results['delete_old_parking_records'] = measure(
+                parking_app.delete_old_parking_records, job_iterations, warmup=1, setup=restore_history)
+            results['delete_expired_permits'] = measure(
+                parking_app.delete_expired_permits, job_iterations, warmup=1, setup=add_expired_permits)
+
+        return {'rows': counts, 'benchmarks': results}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if postgres_url:
+            drop_database(postgres_url, database_name)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- BASELINES AND REGRESSION GATE  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- The machine and engine versions the timings were taken on, stored with each baseline entry. Timings from --
+# another machine say nothing about this change, so the gate only compares runs with the same environment.
+def environment(postgres_url=None):
+    processor = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            processor = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), processor)
+    found = {
+        'processor': processor,
+        'cpus': os.cpu_count(),
+        'system': platform.system(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version
+    }
+    if postgres_url:
+        import psycopg
+        with psycopg.connect(postgres_url) as conn:
+            found['postgresql'] = conn.execute("SHOW server_version").fetchone()[0]
+    return found
+
+
+# Below this many samples the p95 is just the slowest run, so those benchmarks (the jobs) are gated on p50
+MIN_P95_SAMPLES = 20
+
+
+# -- (regressions, sizes skipped): p95 regressions beyond `threshold` (a fraction) and at least `noise_ms` slower --
+# than the stored baseline, and the sizes whose baseline was recorded in another environment
+def regressions(baseline, results, threshold, noise_ms):
+    found = []
+    skipped = []
+    for size, result in results.items():
+        if size in baseline and baseline[size].get('environment') != result['environment']:
+            skipped.append(size)
+            continue
+        stored = baseline.get(size, {}).get('benchmarks', {})
+        for name, current in result['benchmarks'].items():
+            if name not in stored:
+                continue
+            stat = 'p95' if min(stored[name]['iterations'], current['iterations']) >= MIN_P95_SAMPLES else 'p50'
+            before, after = stored[name][f'{stat}_ms'], current[f'{stat}_ms']
+            if after > before * (1 + threshold) and after - before > noise_ms:
+                found.append((size, name, stat, before, after))
+    return found, skipped
+
+
+# -- {baseline key: result} for each size, each run in its own worker process; prints each size's table --
+def run_sizes(args, sizes, current):
+    engine = 'postgresql/' if args.postgres_url else ''
+    results = {}
+    for size in sizes:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as output:
+            pass
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(size),
+                        '--iterations', str(args.iterations), '--job-iterations', str(args.job_iterations),
+                        '--seed', str(args.seed), '--output', output.name]
+                       + (['--postgres-url', args.postgres_url] if args.postgres_url else []), check=True)
+        with open(output.name) as f:
+            results[f'{engine}{size}'] = json.load(f)
+        os.unlink(output.name)
+        results[f'{engine}{size}']['environment'] = current
+
+        result = results[f'{engine}{size}']
+        print(f"\n{engine}{size:,} spots: " + ', '.join(f'{count:,} {table}' for table, count in result['rows'].items()
+                                               if table in ('spots', 'users', 'parkingHistory', 'open sessions')))
+        print(f"  {'benchmark':<28} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+        for name, stats in result['benchmarks'].items():
+            print(f"  {name:<28} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['mean_ms']:>9.3f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main endpoints and jobs on generated campuses and '
+                                                 'fail when p95 latency regresses against the stored baseline.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 100_000],
+                        help='spots (and roughly closed sessions) per campus')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--job-iterations', type=int, default=10, help='iterations for the enforcer and purge jobs')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help='write these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed p95 growth, as a fraction')
+    parser.add_argument('--noise-ms', type=float, default=0.5, help='ignore p95 changes smaller than this')
+    parser.add_argument('--seed', type=int, default=111)
+    parser.add_argument('--postgres-url', help='run on PostgreSQL instead: each size gets a new database on this '
+                                               'server (e.g. postgresql://postgres@localhost/postgres)')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_size(args.worker, args.iterations, args.job_iterations, args.seed, args.postgres_url)
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        return
+
+    # PostgreSQL results get their own baseline entries, so each engine is only compared with itself
+    current = environment(args.postgres_url)
+    results = run_sizes(args, args.sizes, current)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nbaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}; run with --save to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    found, skipped = regressions(baseline, results, args.threshold, args.noise_ms)
+    for size in skipped:
+        print(f"\nnot compared at {size} spots: the baseline was recorded on {baseline[size].get('environment')}, "
+              f"this run on {current}; record one here with --save (e.g. on the base branch) to gate on this machine")
+    if found:
+        # A stall on a shared machine can take out one run's tail; only a regression that repeats counts
+        sizes = sorted({int(size.rsplit('/', 1)[-1]) for size, *_ in found})
+        print(f"\npossible regressions at {', '.join(f'{size:,}' for size in sizes)} spots; measuring again")
+        again, _ = regressions(baseline, run_sizes(args, sizes, current), args.threshold, args.noise_ms)
+        repeated = {(size, name) for size, name, *_ in again}
+        found = [regression for regression in found if regression[:2] in repeated]
+    for size, name, stat, before, after in found:
+        print(f"REGRESSION {name} at {size} spots: {stat} {before:.3f} ms -> {after:.3f} ms")
+    if found:
+        sys.exit(1)
+    if len(skipped) < len(results):
+        print(f"\nno p95 (p50 for the jobs) regression beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+PHASE2_DATA = os.path.join(os.path.dirname(APP_DIR), 'Phase-02', 'data')
+
+# Spot pitch used by Phase-02/data/spots.tbl
+LAT_STEP = 0.000166
+LON_STEP = 0.000241
+CAMPUS_SOUTHWEST = (37.352, -120.437)
+CAMPUS_NORTHEAST = (37.378, -120.413)
+
+# Permit type keys from permitType.tbl and how common each is among drivers
+PERMIT_MIX = {1: 0.10, 2: 0.05, 3: 0.20, 4: 0.15, 5: 0.25, 6: 0.15, 7: 0.06, 8: 0.04}
+DURATIONS = {1: 365, 2: 120, 3: 365, 4: 120, 5: 120, 6: 1, 7: 1, 8: 1 / 24}
+DEFAULT_PASSWORD = 'password'
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CAMPUS LAYOUT  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Spreadsheet-style lot prefixes: A..Z, AA..AZ, ... so every s_num stays unique across lots --
+def lot_prefix(index):
+    prefix = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        prefix = chr(ord('A') + remainder) + prefix
+    return prefix
+
+
+def campus_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=8)
+
+
+def fmt(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# -- Lot centres on a coarse grid over the campus; each lot is a block of spot rows around its centre --
+def layout_lots(lot_count, spots_per_lot):
+    columns = math.ceil(math.sqrt(lot_count))
+    rows = math.ceil(lot_count / columns)
+    lat_span = CAMPUS_NORTHEAST[0] - CAMPUS_SOUTHWEST[0]
+    lon_span = CAMPUS_NORTHEAST[1] - CAMPUS_SOUTHWEST[1]
+    lots = []
+    for i in range(lot_count):
+        row, column = divmod(i, columns)
+        lots.append((i + 1, f'Lot {lot_prefix(i)}', spots_per_lot,
+                     CAMPUS_SOUTHWEST[0] + lat_span * (row + 0.5) / rows,
+                     CAMPUS_SOUTHWEST[1] + lon_span * (column + 0.5) / columns))
+    return lots
+
+
+# -- Morning-heavy arrival minute of day: a commute peak near 8:30 and a smaller one after lunch --
+def arrival_minute(rng):
+    if rng.random() < 0.75:
+        minute = rng.gauss(8.5 * 60, 70)
+    else:
+        minute = rng.gauss(13 * 60, 90)
+    return int(min(max(minute, 6 * 60), 21 * 60))
+
+
+# -- Dwell in minutes: classes and shifts cluster around 3-5 hours with a long tail --
+def dwell_minutes(rng):
+    return int(min(max(rng.lognormvariate(math.log(210), 0.5), 20), 12 * 60))
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- .TBL WRITER  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Writes every table as Phase-02 style .tbl files into `directory`; returns row counts per table --
+def generate(directory, lots=3, spots_per_lot=100, users=30, history_days=30, seed=111, password_hash=None):
+    rng = random.Random(seed)
+    now = campus_now().replace(microsecond=0)
+    counts = {}
+
+    def write(table, rows):
+        count = 0
+        with open(os.path.join(directory, f'{table}.tbl'), 'w') as f:
+            for row in rows:
+                f.write('|'.join('NULL' if value is None else str(value) for value in row) + '\n')
+                count += 1
+        counts[table] = count
+
+    for table in ('zone', 'permitType'):
+        shutil.copyfile(os.path.join(PHASE2_DATA, f'{table}.tbl'), os.path.join(directory, f'{table}.tbl'))
+
+    lot_rows = layout_lots(lots, spots_per_lot)
+    write('lot', ((key, name, capacity, f'{lat:.5f}', f'{lon:.5f}') for key, name, capacity, lat, lon in lot_rows))
+
+    # Each lot is mostly Green with Gold and H rows at the back; zone keys 1 Green, 2 Gold, 3 H
+    def spot_rows():
+        spot_key = 0
+        per_row = 12
+        for lot_key, _, capacity, center_lat, center_lon in lot_rows:
+            rows = math.ceil(capacity / per_row)
+            for n in range(capacity):
+                row, column = divmod(n, per_row)
+                zone_key = 1 if row < rows * 0.7 else (2 if row < rows * 0.9 else 3)
+                spot_key += 1
+                yield (spot_key, zone_key, 0, f'{lot_prefix(lot_key - 1)}{n + 1}', 1,
+                       f'{center_lat + (row - rows / 2) * LAT_STEP:.6f}',
+                       f'{center_lon + (column - per_row / 2) * LON_STEP:.6f}', lot_key)
+    write('spots', spot_rows())
+    spot_count = counts['spots']
+
+    write('zoneAssignment', ((zone_key, lot_key, 1) for lot_key, *_ in lot_rows for zone_key in (1, 2, 3)))
+
+    write('users', ((i, f'user{i}', f'user{i}@ucmerced.edu', password_hash or DEFAULT_PASSWORD)
+                    for i in range(1, users + 1)))
+    write('vehicles', ((i, i, f'{i:07d}'[-7:] if i < 10_000_000 else f'V{i}', 'CA',
+                        rng.choice(['Honda', 'Toyota', 'Ford', 'Tesla', 'Subaru']),
+                        rng.choice(['Civic', 'Corolla', 'F-150', 'Model 3', 'Outback']),
+                        rng.choice(['Gray', 'White', 'Black', 'Blue', 'Red'])) for i in range(1, users + 1)))
+
+    # About 85% of drivers hold a permit, spread over every permitType row
+    type_keys, weights = zip(*PERMIT_MIX.items())
+    permit_holders = []
+
+    def permit_rows():
+        permit_key = 0
+        for user_key in range(1, users + 1):
+            if rng.random() >= 0.85:
+                continue
+            type_key = rng.choices(type_keys, weights)[0]
+            days = DURATIONS[type_key]
+            issued = now - timedelta(days=min(days, 30) * rng.random() * 0.5)
+            permit_key += 1
+            permit_holders.append(user_key)
+            yield (permit_key, user_key, user_key, type_key, f'PRM{permit_key:06d}', fmt(issued),
+                   fmt(now + timedelta(days=days) if days < 1 else issued + timedelta(days=days)))
+    write('permit', permit_rows())
+
+    # Closed sessions for the past `history_days` days: weekdays busy, weekends light
+    def history_rows():
+        history_key = 0
+        for day_offset in range(history_days, 0, -1):
+            day = (now - timedelta(days=day_offset)).replace(hour=0, minute=0, second=0)
+            share = 0.6 if day.weekday() < 5 else 0.1
+            for vehicle_key in rng.sample(permit_holders, int(len(permit_holders) * share)):
+                arrival = day + timedelta(minutes=arrival_minute(rng))
+                history_key += 1
+                yield (history_key, vehicle_key, rng.randint(1, spot_count), fmt(arrival),
+                       fmt(arrival + timedelta(minutes=dwell_minutes(rng))))
+    write('parkingHistory', history_rows())
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic campus as .tbl files or a data.sqlite.')
+    parser.add_argument('--out', required=True, help='directory for the .tbl files')
+    parser.add_argument('--sqlite', help='also bulk load the files into this database')
+    parser.add_argument('--lots', type=int, default=20)
+    parser.add_argument('--spots-per-lot', type=int, default=500)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--history-days', type=int, default=30)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12,
+                        help=f'every user gets the password "{DEFAULT_PASSWORD}" hashed at this cost')
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+
+    import bcrypt
+    password_hash = bcrypt.hashpw(DEFAULT_PASSWORD.encode('utf-8'), bcrypt.gensalt(args.bcrypt_rounds)).decode('utf-8')
+
+    os.makedirs(args.out, exist_ok=True)
+    counts = generate(args.out, args.lots, args.spots_per_lot, args.users, args.history_days, args.seed, password_hash)
+    for table, count in counts.items():
+        print(f"{table:<16} {count:>10,} rows")
+
+    if args.sqlite:
+        sys.path.insert(0, APP_DIR)
+        import bulk_load
+        bulk_load.migrate(args.sqlite)
+        results, _, violations, failed_indexes = bulk_load.bulk_load(args.sqlite, args.out)
+        print(f"loaded {sum(loaded for _, loaded, _, _ in results):,} rows into {args.sqlite}, "
+              f"{len(violations)} foreign key violations, {len(failed_indexes)} indexes not rebuilt")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import generate_campus
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- STORM  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+def percentile(samples, share):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * share))] if samples else 0.0
+
+
+# -- Storm threads log distinct users in back to back while viewers keep reloading the map's API calls --
+def run_storm(users, rounds, storm_threads, viewers, duration, seed):
+    import bcrypt
+    workdir = tempfile.mkdtemp(prefix='login-storm-')
+    try:
+        data_dir = os.path.join(workdir, 'data')
+        os.mkdir(data_dir)
+        password_hash = bcrypt.hashpw(generate_campus.DEFAULT_PASSWORD.encode('utf-8'),
+                                      bcrypt.gensalt(rounds)).decode('utf-8')
+        generate_campus.generate(data_dir, 4, 250, users, 7, seed, password_hash)
+
+        # Same cost as the stored hashes, so no login in the storm pays for a rehash
+        os.environ['PARKING_BCRYPT_ROUNDS'] = str(rounds)
+        sys.path.insert(0, APP_DIR)
+        import bulk_load
+        database = os.path.join(workdir, 'data.sqlite')
+        bulk_load.migrate(database)
+        bulk_load.bulk_load(database, data_dir)
+        import app as parking_app
+
+        def login(client, user_number):
+            return client.post('/login', data={'login_id': f'user{user_number}',
+                                               'password': generate_campus.DEFAULT_PASSWORD}).status_code
+
+        viewer_clients = [parking_app.app.test_client() for _ in range(viewers)]
+        for number, client in enumerate(viewer_clients, 1):
+            assert login(client, number) == 302
+        parking_app.password_hasher.start()
+        time.sleep(1.0)
+
+        deadline = time.perf_counter() + duration
+        lock = threading.Lock()
+        next_user = [viewers + 1]
+        login_ms, map_ms, statuses = [], [], {}
+
+        def storm():
+            client = parking_app.app.test_client()
+            while time.perf_counter() < deadline:
+                with lock:
+                    user_number = next_user[0]
+                    next_user[0] = user_number % users + 1
+                started = time.perf_counter()
+                status = login(client, user_number)
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    login_ms.append(elapsed)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        def view(client):
+            while time.perf_counter() < deadline:
+                for path in ('/api/parking-data', '/api/my-context', '/my-parking-status'):
+                    started = time.perf_counter()
+                    client.get(path)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        map_ms.append(elapsed)
+                time.sleep(0.02)
+
+        threads = [threading.Thread(target=storm) for _ in range(storm_threads)]
+        threads += [threading.Thread(target=view, args=(client,)) for client in viewer_clients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'logins': statuses.get(302, 0),
+            'logins_per_second': statuses.get(302, 0) / elapsed,
+            'rejected': statuses.get(503, 0),
+            'login_p50_ms': statistics.median(login_ms) if login_ms else 0.0,
+            'login_p95_ms': percentile(login_ms, 0.95),
+            'map_requests': len(map_ms),
+            'map_p50_ms': statistics.median(map_ms) if map_ms else 0.0,
+            'map_p95_ms': percentile(map_ms, 0.95),
+            'map_p99_ms': percentile(map_ms, 0.99),
+            'peak_queue_depth': parking_app.password_hasher.stats()['peak_queue_depth']
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput and map API latency during a login storm, '
+                                                 'hashing inline versus in the password process pool.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt cost of the stored hashes')
+    parser.add_argument('--storm-threads', type=int, default=16, help='concurrent logins')
+    parser.add_argument('--viewers', type=int, default=4, help='logged-in users reloading the map meanwhile')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='password pool size for the pooled run')
+    parser.add_argument('--seed', type=int, default=111)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_storm(args.users, args.rounds, args.storm_threads, args.viewers, args.duration, args.seed)
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        return
+
+    # One process per mode: PASSWORD_WORKERS is read when the app is imported
+    print(f"{args.storm_threads} concurrent logins at bcrypt cost {args.rounds}, "
+          f"{args.viewers} map viewers, {args.duration:.0f} s, {os.cpu_count()} CPUs")
+    print(f"{'mode':<12} {'logins/s':>9} {'login p50':>10} {'login p95':>10} {'503s':>6} "
+          f"{'map reqs':>9} {'map p50':>8} {'map p95':>8} {'map p99':>8} {'peak queue':>11}")
+    for mode, workers in (('inline', 0), (f'pool x{args.workers}', args.workers)):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as output:
+            pass
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--output', output.name,
+                        '--users', str(args.users), '--rounds', str(args.rounds),
+                        '--storm-threads', str(args.storm_threads), '--viewers', str(args.viewers),
+                        '--duration', str(args.duration), '--seed', str(args.seed)],
+                       env=dict(os.environ, PARKING_PASSWORD_WORKERS=str(workers), PARKING_SCHEDULER='0'),
+                       check=True)
+        with open(output.name) as f:
+            r = json.load(f)
+        os.unlink(output.name)
+        print(f"{mode:<12} {r['logins_per_second']:>9.1f} {r['login_p50_ms']:>8.1f}ms {r['login_p95_ms']:>8.1f}ms "
+              f"{r['rejected']:>6} {r['map_requests']:>9} {r['map_p50_ms']:>6.2f}ms {r['map_p95_ms']:>6.2f}ms "
+              f"{r['map_p99_ms']:>6.2f}ms {r['peak_queue_depth']:>11}")
+
+
+if __name__ == '__main__':
+    main()
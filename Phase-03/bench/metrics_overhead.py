@@ -0,0 +1,141 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from endpoint_benchmarks import build_campus, expect, open_sessions
+import generate_campus
+
+# name -> (METRICS_ENABLED, SQL_PROFILE_EVERY); None is --sample-every
+MODES = {
+    'metrics off': (False, 1),
+    'every request profiled': (True, 1),
+    'sampled': (True, None)
+}
+CALLS = ('zone_status', 'view_permit', 'apply_permit_form', 'claim + unclaim')
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- DRIVERS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- The benchmark driver (a Faculty Yearly permit holder) and a free Green spot it can claim --
+def driver_and_spot(conn, size):
+    user_key = conn.execute("""
+        SELECT p_userkey FROM permit WHERE p_permittypekey = 1 ORDER BY p_permitkey LIMIT 1
+    """).fetchone()[0]
+    open_sessions(conn, size // 10, user_key)
+    spot = conn.execute("""
+        SELECT s_num FROM spots WHERE s_zonekey = 1 AND s_status = 0 AND s_isactive = 1 ORDER BY s_spotskey LIMIT 1
+    """).fetchone()[0]
+    return user_key, spot
+
+
+# -- {call: fn} through the Flask test client of the app imported into this process --
+def test_client_calls(parking_app, user_key, spot):
+    client = parking_app.app.test_client()
+    expect(client.post('/login', data={'login_id': f'user{user_key}',
+                                       'password': generate_campus.DEFAULT_PASSWORD}), 302)
+
+    def claim_and_unclaim():
+        expect(client.post(f'/claim-spot/{spot}'), 200)
+        expect(client.post('/unclaim-spot'), 200)
+
+    return dict(zip(CALLS, (lambda: expect(client.get('/api/zone-status'), 200),
+                            lambda: expect(client.get('/view_permit'), 200),
+                            lambda: expect(client.get('/apply_permit'), 200),
+                            claim_and_unclaim)))
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- MEASUREMENT  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- {call: mean ms} per call of each of `calls` over `requests` calls, after a few untimed ones --
+def time_calls(calls, requests):
+    means = {}
+    for name, fn in calls.items():
+        for _ in range(5):
+            fn()
+        started = time.perf_counter()
+        for _ in range(requests):
+            fn()
+        means[name] = (time.perf_counter() - started) * 1000 / requests
+    return means
+
+
+# -- {mode: [means of each round]}, all in this process. Modes alternate within each round and the order rotates, --
+# so drift over the run affects all of them alike. Whether a connection can be profiled at all is fixed when the pool
+# opens it (METRICS_ENABLED), so switching modes closes the idle ones; nothing is checked out between requests.
+def run_rounds(parking_app, calls, rounds, requests, sample_every):
+    timings = {mode: [] for mode in MODES}
+    for i in range(rounds):
+        for mode in list(MODES)[i % len(MODES):] + list(MODES)[:i % len(MODES)]:
+            enabled, every = MODES[mode]
+            parking_app.app.config['METRICS_ENABLED'] = enabled
+            parking_app.app.config['SQL_PROFILE_EVERY'] = every or sample_every
+            parking_app.pool.close_idle()
+            timings[mode].append(time_calls(calls, requests))
+    return timings
+
+
+# -- Each mode's best round, as with timeit: noise on a shared machine only ever adds time --
+def report(timings):
+    def best(mode, names):
+        return sum(min(means[name] for means in timings[mode]) for name in names)
+
+    print(f"  {'ms per call':<20}" + ''.join(f"{mode:>26}" for mode in MODES))
+    for name in CALLS + ('all',):
+        names = CALLS if name == 'all' else (name,)
+        cells = []
+        for mode in MODES:
+            ms = best(mode, names)
+            cells.append(f"{ms:.4f}" + (f" ({100 * (ms / best('metrics off', names) - 1):+.1f}%)"
+                                        if mode != 'metrics off' else ''))
+        print(f"  {name:<20}" + ''.join(f"{cell:>26}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request time of the main endpoints through the Flask test client '
+                                                 'with metrics off, with every request profiled and with SQL '
+                                                 'profiling sampled, interleaved in one process.')
+    parser.add_argument('--size', type=int, default=1000, help='spots in the generated campus')
+    parser.add_argument('--requests', type=int, default=500, help='timed calls per endpoint, mode and round')
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--sample-every', type=int, default=10, help='SQL_PROFILE_EVERY for the sampled mode')
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='metrics-overhead-')
+    try:
+        # build_campus points PARKING_DB and the archive dir at the work directory
+        database, _ = build_campus(workdir, args.size, args.seed)
+        os.environ.update(PARKING_PASSWORD_WORKERS='0', PARKING_SCHEDULER='0')
+        conn = sqlite3.connect(database)
+        try:
+            user_key, spot = driver_and_spot(conn, args.size)
+        finally:
+            conn.close()
+
+        sys.path.insert(0, APP_DIR)
+        import app as parking_app
+        calls = test_client_calls(parking_app, user_key, spot)
+        timings = run_rounds(parking_app, calls, args.rounds, args.requests, args.sample_every)
+        print(f"\n{args.size:,} spots, Flask test client, {args.rounds} rounds of {args.requests} calls; "
+              f"sampled = one request in {args.sample_every} profiled")
+        report(timings)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import generate_campus
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CLIENTS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- In-process driver: one Flask test client (and so one session cookie) per simulated driver --
+class TestClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, headers=None):
+        response = self.client.open(path, method=method, data=form, headers=headers or {})
+        return response.status_code, response.get_data(), response.headers
+
+
+# -- Drives a running server over HTTP; redirects are not followed so a login shows up as its own 302 --
+class HttpClient:
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), self._NoRedirect)
+
+    def request(self, method, path, form=None, headers=None):
+        data = urllib.parse.urlencode(form).encode('utf-8') if form is not None else None
+        if method == 'POST' and data is None:
+            data = b''
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as error:
+            return error.code, error.read(), error.headers
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- DRIVERS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Latency samples per endpoint; paths with a spot number or query string are grouped under one name --
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.statuses = {}
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds * 1000)
+            statuses = self.statuses.setdefault(endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+
+def timed(client, recorder, endpoint, method, path, form=None, headers=None):
+    started = time.perf_counter()
+    try:
+        status, body, response_headers = client.request(method, path, form, headers)
+    except OSError:
+        status, body, response_headers = 'error', b'', {}
+    recorder.record(endpoint, status, time.perf_counter() - started)
+    return status, body, response_headers
+
+
+# -- One driver's morning: log in, load the map, find a spot near their building, claim it. --
+# Claims that lose a race to another driver retry with the next candidate; some drivers leave again.
+def drive(client, recorder, user_number, rng, unclaim_share):
+    status, _, _ = timed(client, recorder, 'POST /login', 'POST', '/login',
+                         {'login_id': f'user{user_number}', 'password': generate_campus.DEFAULT_PASSWORD})
+    if status != 302:
+        return 'login failed'
+
+    timed(client, recorder, 'GET /map', 'GET', '/map')
+    status, body, _ = timed(client, recorder, 'GET /api/my-context', 'GET', '/api/my-context')
+    context = json.loads(body) if status == 200 else {}
+    status, _, headers = timed(client, recorder, 'GET /api/parking-data', 'GET', '/api/parking-data')
+    version = headers.get('X-Occupancy-Version', '0')
+    timed(client, recorder, 'GET /api/parking-data?since', 'GET', f'/api/parking-data?since={version}',
+          headers={'If-None-Match': headers.get('ETag', '')})
+    timed(client, recorder, 'GET /my-parking-status', 'GET', '/my-parking-status')
+
+    if not context.get('has_permit'):
+        return 'no permit'
+    if context.get('is_parked'):
+        return 'already parked'
+
+    lat = rng.uniform(generate_campus.CAMPUS_SOUTHWEST[0], generate_campus.CAMPUS_NORTHEAST[0])
+    lon = rng.uniform(generate_campus.CAMPUS_SOUTHWEST[1], generate_campus.CAMPUS_NORTHEAST[1])
+    status, body, _ = timed(client, recorder, 'GET /api/nearest-spots', 'GET',
+                            f'/api/nearest-spots?lat={lat:.6f}&lon={lon:.6f}&k=5')
+    candidates = [spot['spot_num'] for spot in json.loads(body)['spots']] if status == 200 else []
+
+    for spot_num in candidates:
+        status, _, _ = timed(client, recorder, 'POST /claim-spot/<num>', 'POST', f'/claim-spot/{spot_num}')
+        if status == 200:
+            break
+    else:
+        return 'no spot'
+
+    if rng.random() < unclaim_share:
+        timed(client, recorder, 'POST /unclaim-spot', 'POST', '/unclaim-spot')
+        return 'claimed and left'
+    return 'claimed'
+
+
+def percentile(samples, share):
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+def report(recorder, elapsed, outcomes):
+    print(f"\n{'endpoint':<30} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for endpoint, samples in recorder.samples.items():
+        samples = sorted(samples)
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(recorder.statuses[endpoint].items(), key=str))
+        print(f"{endpoint:<30} {len(samples):>7} {len(samples) / elapsed:>8.1f} {statistics.median(samples):>8.2f} "
+              f"{percentile(samples, 0.95):>8.2f} {percentile(samples, 0.99):>8.2f}  {statuses}")
+    total = sum(len(samples) for samples in recorder.samples.values())
+    print(f"\n{total:,} requests in {elapsed:.1f} s ({total / elapsed:,.1f} req/s)")
+    print('drivers: ' + ', '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a morning rush against the parking app and report '
+                                                 'throughput and latency percentiles per endpoint.')
+    parser.add_argument('--url', help='drive a running server instead of the in-process test client; '
+                                      'its database must come from generate_campus.py')
+    parser.add_argument('--drivers', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds the arrival peak is spread over')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--unclaim', type=float, default=0.2, help='share of parked drivers who leave again')
+    parser.add_argument('--lots', type=int, default=10)
+    parser.add_argument('--spots-per-lot', type=int, default=300)
+    parser.add_argument('--users', type=int, default=None, help='defaults to --drivers')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+    users = max(args.users or args.drivers, args.drivers)
+
+    workdir = None
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        import bcrypt
+        workdir = tempfile.mkdtemp(prefix='morning-rush-')
+        data_dir = os.path.join(workdir, 'data')
+        os.mkdir(data_dir)
+        password_hash = bcrypt.hashpw(generate_campus.DEFAULT_PASSWORD.encode('utf-8'),
+                                      bcrypt.gensalt(args.bcrypt_rounds)).decode('utf-8')
+        counts = generate_campus.generate(data_dir, args.lots, args.spots_per_lot, users, 30, args.seed, password_hash)
+        print('campus: ' + ', '.join(f'{count:,} {table}' for table, count in counts.items()))
+
+        sys.path.insert(0, APP_DIR)
+        import bulk_load
+        database = os.path.join(workdir, 'data.sqlite')
+        bulk_load.migrate(database)
+        bulk_load.bulk_load(database, data_dir)
+        import app as parking_app
+        make_client = lambda: TestClient(parking_app.app)
+
+    # Arrivals bunch up in the middle of the window, like cars queueing for the 9 o'clock classes
+    rng = random.Random(args.seed)
+    drivers = rng.sample(range(1, users + 1), args.drivers)
+    offsets = sorted(min(max(rng.gauss(args.duration / 2, args.duration / 6), 0), args.duration)
+                     for _ in drivers)
+    recorder = Recorder()
+    outcomes = {}
+    outcomes_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def run(user_number, offset, seed):
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        outcome = drive(make_client(), recorder, user_number, random.Random(seed), args.unclaim)
+        with outcomes_lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run, user_number, offset, rng.random())
+                   for user_number, offset in zip(drivers, offsets)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - started
+
+    report(recorder, elapsed, outcomes)
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    server_errors = sum(count for statuses in recorder.statuses.values()
+                        for status, count in statuses.items() if status == 'error' or status >= 500)
+    if server_errors:
+        print(f"{server_errors} requests failed with a server or connection error")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
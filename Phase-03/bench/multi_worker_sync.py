@@ -0,0 +1,134 @@
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+# Two app processes on one database, as two gunicorn workers would run. Each worker changes spot statuses through
+# its own index and the check times how long the other worker's index (map payload, ETag version, counters and
+# change feed) takes to agree with it.
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- WORKER PROCESS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Serves commands from the parent over a pipe until told to stop --
+def worker(conn, environ):
+    os.environ.update(environ)
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    import app as parking_app
+
+    index = parking_app.occupancy
+    index.ensure_loaded()
+    while True:
+        command, argument = conn.recv()
+        if command == 'stop':
+            break
+        if command == 'state':
+            version, payload = index.payload()
+            conn.send((version, hashlib.sha1(payload).hexdigest(), index.zone_counts()))
+        elif command == 'changes':
+            conn.send(parking_app.json.loads(index.changes_since(argument)[1]))
+        elif command == 'spots':
+            conn.send(list(zip(index.spot_keys, index.statuses)))
+        elif command == 'set':
+            # What a sensor flush does: the database in one transaction, then this worker's index
+            with parking_app.pool.connection() as db, parking_app.store.transaction(db):
+                parking_app.store.spots.set_statuses(db, dict(argument))
+            conn.send(index.set_statuses(argument))
+    conn.close()
+
+
+class Worker:
+    def __init__(self, context, environ):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=worker, args=(child, environ), daemon=True)
+        self.process.start()
+
+    def call(self, command, argument=None):
+        self.conn.send((command, argument))
+        return self.conn.recv()
+
+    def stop(self):
+        self.conn.send(('stop', None))
+        self.process.join(10)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- RUN + VERIFY  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Seconds until `reader` serves the same map as `writer`, or None after `timeout` --
+def converge(writer, reader, timeout):
+    _, expected, expected_counts = writer.call('state')
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        _, digest, counts = reader.call('state')
+        if digest == expected and counts == expected_counts:
+            return time.perf_counter() - started
+        time.sleep(0.02)
+    return None
+
+
+def check(name, writer, reader, changes, timeout):
+    before, _, _ = reader.call('state')
+    changed = writer.call('set', changes)
+    seconds = converge(writer, reader, timeout)
+    after, _, _ = reader.call('state')
+    feed = reader.call('changes', before)
+    ok = (seconds is not None and after != before and not feed['full']
+          and len(feed['changes']) >= len(changed))
+    waited = f"{seconds * 1000:.0f} ms" if seconds is not None else f"not within {timeout:.0f} s"
+    print(f"{name}: {len(changed)} spots changed, other worker agreed after {waited}, "
+          f"version {before} -> {after}, change feed {len(feed['changes'])} spots  {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that two workers on one database keep the same occupancy.')
+    parser.add_argument('--db', default=os.path.join(APP_DIR, 'instance', 'data.sqlite'))
+    parser.add_argument('--postgres-url', help='run against this (loaded) PostgreSQL database instead of a copy of --db')
+    parser.add_argument('--spots', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+
+    environ = {'PARKING_SCHEDULER': '0'}
+    workdir = None
+    if args.postgres_url:
+        environ['PARKING_DATABASE_URL'] = args.postgres_url
+    else:
+        workdir = tempfile.mkdtemp(prefix='multi-worker-')
+        environ['PARKING_DB'] = os.path.join(workdir, 'data.sqlite')
+        shutil.copyfile(args.db, environ['PARKING_DB'])
+
+    context = multiprocessing.get_context('spawn')
+    first, second = Worker(context, environ), Worker(context, environ)
+    try:
+        spots = first.call('spots')
+        chosen = random.Random(args.seed).sample(spots, min(args.spots, len(spots)))
+        flipped = [(spot_key, 1 - status) for spot_key, status in chosen]
+
+        ok = check('worker 1 -> worker 2', first, second, flipped, args.timeout)
+        ok = check('worker 2 -> worker 1', second, first, chosen, args.timeout) and ok
+    finally:
+        first.stop()
+        second.stop()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SYNTHETIC SPOTS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Adds `count` spots scattered over the campus bounds; `occupied` of them taken, zones split evenly --
+def add_spots(path, count, occupied, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    start_key = conn.execute("SELECT COALESCE(MAX(s_spotskey), 0) FROM spots").fetchone()[0] + 1
+    lot_keys = [row[0] for row in conn.execute("SELECT l_lotkey FROM lot")]
+    zone_keys = [row[0] for row in conn.execute("SELECT z_zonekey FROM zone")]
+    conn.executemany("INSERT INTO spots VALUES(?, ?, ?, ?, 1, ?, ?, ?)", (
+        (start_key + i, rng.choice(zone_keys), 1 if rng.random() < occupied else 0, f'N{i}',
+         rng.uniform(37.355, 37.375), rng.uniform(-120.435, -120.415), rng.choice(lot_keys))
+        for i in range(count)))
+    conn.commit()
+    conn.close()
+
+
+# -- Straightforward alternative: filter in SQL and sort every candidate by projected distance --
+def naive_nearest(conn, lat, lon, k, zone_keys, scale):
+    return conn.execute(f"""
+        SELECT s_num FROM spots
+        WHERE s_status = 0 AND s_isactive = 1 AND s_zonekey IN ({','.join('?' * len(zone_keys))})
+        ORDER BY (s_latitude - ?) * (s_latitude - ?) * ? + (s_longitude - ?) * (s_longitude - ?) * ?
+        LIMIT ?
+    """, list(zone_keys) + [lat, lat, 111320.0 ** 2, lon, lon, scale ** 2, k]).fetchall()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare grid-indexed and SQL nearest-free-spot queries.')
+    parser.add_argument('--db', default=os.path.join(APP_DIR, 'instance', 'data.sqlite'))
+    parser.add_argument('--spots', type=int, default=50_000)
+    parser.add_argument('--occupied', type=float, default=0.7)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--category', default='Faculty')
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='nearest-bench-')
+    os.environ['PARKING_DB'] = os.path.join(workdir, 'data.sqlite')
+    os.environ['PARKING_SCHEDULER'] = '0'
+    shutil.copyfile(args.db, os.environ['PARKING_DB'])
+    sys.path.insert(0, APP_DIR)
+    import app as parking_app
+
+    add_spots(os.environ['PARKING_DB'], args.spots, args.occupied, args.seed)
+    occupancy, grid, permissions = parking_app.occupancy, parking_app.spot_grid, parking_app.permissions
+    with parking_app.pool.connection() as conn:
+        occupancy.load(conn)
+    started = time.perf_counter()
+    grid.ensure_built()
+    print(f"{len(occupancy.spot_keys):,} spots, grid of {len(grid.cells):,} cells ({grid.cell_size:.1f} m) "
+          f"built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    hour = 12
+    allowed_zones = [zone_key for zone_key in occupancy.zone_types
+                     if any(permissions.allows(args.category, zone_key, lot_key, hour)
+                            for lot_key in occupancy.lot_names)]
+
+    def accept(i):
+        return (not occupancy.statuses[i] and occupancy.actives[i]
+                and permissions.allows(args.category, occupancy.zone_keys[i], occupancy.lot_keys[i], hour))
+
+    rng = random.Random(args.seed + 1)
+    points = [(rng.uniform(37.355, 37.375), rng.uniform(-120.435, -120.415)) for _ in range(args.queries)]
+    conn = sqlite3.connect(os.environ['PARKING_DB'])
+
+    grid_ms, naive_ms, mismatches = [], [], 0
+    for lat, lon in points:
+        started = time.perf_counter()
+        found = grid.nearest(lat, lon, args.k, accept)
+        grid_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        expected = naive_nearest(conn, lat, lon, args.k, allowed_zones, grid.scale)
+        naive_ms.append((time.perf_counter() - started) * 1000)
+
+        mismatches += {occupancy.spot_nums[i] for _, i in found} != {row[0] for row in expected}
+    conn.close()
+
+    grid_p50, grid_p99 = percentiles(grid_ms)
+    naive_p50, naive_p99 = percentiles(naive_ms)
+    print(f"grid index : p50 {grid_p50:.3f} ms  p99 {grid_p99:.3f} ms")
+    print(f"SQL sort   : p50 {naive_p50:.3f} ms  p99 {naive_p99:.3f} ms")
+    print(f"{args.queries} queries, k={args.k}, {mismatches} result sets differed from the SQL answer")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SYNTHETIC HISTORY  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Fills parkingHistory with `rows` sessions; `old_fraction` of them departed more than a day ago --
+def build_history(path, rows, old_fraction):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    spot_count = conn.execute("SELECT COUNT(*) FROM spots").fetchone()[0]
+    vehicle_count = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+    start_key = conn.execute("SELECT COALESCE(MAX(ph_parkinghistkey), 0) FROM parkingHistory").fetchone()[0] + 1
+    old_rows = int(rows * old_fraction)
+
+    def sessions():
+        for i in range(rows):
+            # Old sessions first, so purge-eligible keys form a long leading range
+            day = '2025-01-01' if i < old_rows else '2099-01-01'
+            yield (start_key + i, i % vehicle_count + 1, i % spot_count + 1,
+                   f'{day} 08:00:00', f'{day} 17:00:00')
+
+    conn.executemany("INSERT INTO parkingHistory VALUES(?, ?, ?, ?, ?)", sessions())
+    conn.commit()
+    conn.close()
+    return old_rows
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CLAIM TRAFFIC PROBE  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Issues a small write transaction every few ms (the shape of a claim) and records how long each one waited --
+class ClaimProbe:
+    def __init__(self, path):
+        self.path = path
+        self.latencies = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode = WAL")
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE spots SET s_status = s_status WHERE s_spotskey = 1")
+            conn.commit()
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.005)
+        conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        latencies = sorted(self.latencies) or [0.0]
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], latencies[-1]
+
+
+# -- The pre-chunking job: one unbounded DELETE under a single write lock --
+def legacy_purge(path):
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode = WAL")
+    cursor = conn.execute("""
+        DELETE FROM parkingHistory
+        WHERE ph_departuretime IS NOT NULL
+            AND ph_departuretime < DATETIME('now', '-08:00', '-24 hours')
+    """)
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare one-shot and chunked parkingHistory purges.')
+    parser.add_argument('--db', default=os.path.join(APP_DIR, 'instance', 'data.sqlite'))
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--old-fraction', type=float, default=0.9)
+    parser.add_argument('--chunk', type=int, default=5000)
+    parser.add_argument('--archive', action='store_true', help='move purged rows into the monthly archive')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='purge-bench-')
+    legacy_db = os.path.join(workdir, 'legacy.sqlite')
+    chunked_db = os.path.join(workdir, 'chunked.sqlite')
+    shutil.copyfile(args.db, chunked_db)
+
+    # Importing the app migrates the copy (indexes + archive table) before it is filled
+    os.environ['PARKING_DB'] = chunked_db
+    os.environ['PARKING_SCHEDULER'] = '0'
+    os.environ['PARKING_ARCHIVE_DIR'] = os.path.join(workdir, 'archive')
+    sys.path.insert(0, APP_DIR)
+    import app as parking_app
+    parking_app.app.config['PURGE_CHUNK_SIZE'] = args.chunk
+    parking_app.app.config['PURGE_ARCHIVE'] = args.archive
+
+    started = time.perf_counter()
+    old_rows = build_history(chunked_db, args.rows, args.old_fraction)
+    shutil.copyfile(chunked_db, legacy_db)
+    print(f"built {args.rows:,} sessions ({old_rows:,} purgeable) in {time.perf_counter() - started:.1f} s")
+
+    with ClaimProbe(legacy_db) as probe:
+        started = time.perf_counter()
+        deleted = legacy_purge(legacy_db)
+        elapsed = time.perf_counter() - started
+    p99, worst = probe.summary()
+    print(f"single DELETE : {deleted:,} rows in {elapsed:.2f} s ({deleted / elapsed:,.0f} rows/s)  "
+          f"claim p99 {p99:.1f} ms  worst {worst:.1f} ms")
+
+    writer = parking_app.pool.new_connection()
+    with ClaimProbe(chunked_db) as probe:
+        started = time.perf_counter()
+        deleted = parking_app.delete_old_parking_records(writer)
+        elapsed = time.perf_counter() - started
+    writer.close()
+    p99, worst = probe.summary()
+    print(f"chunked purge : {deleted:,} rows in {elapsed:.2f} s ({deleted / elapsed:,.0f} rows/s)  "
+          f"claim p99 {p99:.1f} ms  worst {worst:.1f} ms")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, APP_DIR)
+
+from storage import campus_now, campus_timestamp
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- HOT QUERIES  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+NOW = campus_timestamp()
+DAY_AGO = campus_timestamp(campus_now() - timedelta(hours=24))
+
+# -- (name, query, parameters, table names/aliases that must be reached through an index) --
+HOT_QUERIES = [
+    ('open session by vehicle', """
+        SELECT COUNT(*) FROM parkingHistory ph
+        WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
+    """, [1], ['ph']),
+
+    ('current spot by vehicle', """
+        SELECT s.s_num, l.l_name, z.z_type, ph.ph_arrivaltime
+        FROM parkingHistory ph
+        JOIN spots s ON ph.ph_spotskey = s.s_spotskey
+        JOIN lot l ON s.s_lotkey = l.l_lotkey
+        JOIN zone z ON s.s_zonekey = z.z_zonekey
+        WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
+    """, [1], ['ph', 's']),
+
+    ('active permit by user', """
+        SELECT p.p_permitkey, p.p_vehicleskey, pt.pt_category
+        FROM permit p
+        JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
+        WHERE p.p_userkey = ? AND p.p_expirationdate >= ?
+    """, [1, NOW], ['p']),
+
+    ('active permit by vehicle', """
+        SELECT COUNT(*) FROM permit
+        WHERE p_vehicleskey = ? AND p_expirationdate >= ?
+    """, [1, NOW], ['permit']),
+
+    ('spot by number', """
+        SELECT s.s_spotskey, s.s_status, s.s_isactive, s.s_zonekey, s.s_lotkey, z.z_type, l.l_name, za.za_isactive
+        FROM spots s
+        JOIN zone z ON s.s_zonekey = z.z_zonekey
+        JOIN lot l ON s.s_lotkey = l.l_lotkey
+        LEFT JOIN zoneAssignment za ON za.za_lotkey = s.s_lotkey AND za.za_zonekey = s.s_zonekey
+        WHERE s.s_num = ?
+    """, ['A1'], ['s', 'za']),
+
+    ('vehicle by plate', """
+        SELECT v_userkey FROM vehicles WHERE v_plateno = ?
+    """, ['8PLD442'], ['vehicles']),
+
+    ('vehicles by user', """
+        SELECT v_vehicleskey, v_plateno, v_platestate, v_maker, v_model, v_color
+        FROM vehicles WHERE v_userkey = ?
+        ORDER BY v_vehicleskey DESC
+    """, [1], ['vehicles']),
+
+    ('zone assignment', """
+        SELECT za_isactive FROM zoneAssignment
+        WHERE za_lotkey = ? AND za_zonekey = ?
+    """, [2, 1], ['zoneAssignment']),
+
+    ('spots by lot', """
+        SELECT s_spotskey FROM spots WHERE s_lotkey = ?
+    """, [3], ['spots']),
+
+    ('old closed sessions', """
+        SELECT COUNT(*) FROM parkingHistory
+        WHERE ph_departuretime IS NOT NULL
+            AND ph_departuretime < ?
+    """, [DAY_AGO], ['parkingHistory']),
+]
+
+
+# -- Plan lines that read a guarded table without an index. SQLite says "SCAN ph" instead of "SEARCH ph USING --
+# INDEX ..."; PostgreSQL says "Seq Scan on parkinghistory ph" and folds unquoted names to lower case.
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)(?: (\w+))?')
+
+
+def full_scans(store, conn, query, params, guarded):
+    guarded = {name.lower() for name in guarded}
+    problems = []
+    for line in store.explain(conn, query, params):
+        if store.name == 'postgresql':
+            match = SEQ_SCAN.search(line)
+            if match and guarded & {name.lower() for name in match.groups() if name}:
+                problems.append(match.group(0))
+            continue
+        words = line.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and words[1].lower() in guarded and 'INDEX' not in words:
+            problems.append(line)
+    return problems
+
+
+# -- A copy of the SQLite database, or a new PostgreSQL database loaded from the .tbl files; importing the app --
+# applies every migration to it. Returns (target, app module).
+def prepare(args):
+    if args.postgres_url:
+        import bulk_load
+        import endpoint_benchmarks
+        target = endpoint_benchmarks.create_database(args.postgres_url, 'query_plans')
+        bulk_load.migrate(target)
+        bulk_load.bulk_load(target, args.data)
+    else:
+        workdir = tempfile.mkdtemp(prefix='query-plans-')
+        target = os.path.join(workdir, 'data.sqlite')
+        shutil.copyfile(args.db, target)
+        os.environ['PARKING_DB'] = target
+    os.environ['PARKING_SCHEDULER'] = '0'
+    import app
+    return target, app
+
+
+def connect(target):
+    if target.startswith('postgresql://'):
+        import postgres
+        return postgres.connect(target)
+    return sqlite3.connect(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the hot queries reach their tables through an index.')
+    parser.add_argument('db', nargs='?', default=os.path.join(APP_DIR, 'instance', 'data.sqlite'))
+    parser.add_argument('--postgres-url', help='check PostgreSQL plans instead: a query_plans database is created on '
+                                               'this server, loaded from --data and dropped afterwards')
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(APP_DIR), 'Phase-02', 'data'),
+                        help='.tbl files loaded into the PostgreSQL database')
+    args = parser.parse_args()
+
+    target, app = prepare(args)
+    failures = 0
+    try:
+        conn = connect(target)
+        conn.execute("ANALYZE")
+        # The campus tables are small enough that PostgreSQL reads them sequentially whenever it can; with
+        # sequential scans priced out, a Seq Scan left in a plan means no index serves the query.
+        if app.store.name == 'postgresql':
+            conn.execute("SET enable_seqscan = off")
+        for name, query, params, tables in HOT_QUERIES:
+            problems = full_scans(app.store, conn, query, params, tables)
+            status = 'FULL SCAN' if problems else 'ok'
+            print(f"{status:>9}  {name}" + (f"  -> {'; '.join(problems)}" if problems else ''))
+            failures += bool(problems)
+        conn.close()
+    finally:
+        if args.postgres_url:
+            app.pool.close()
+            import endpoint_benchmarks
+            endpoint_benchmarks.drop_database(args.postgres_url, 'query_plans')
+
+    if failures:
+        print(f"FAIL: {failures} hot queries fall back to a full table scan on {app.store.name}")
+        sys.exit(1)
+    print(f"OK: every hot query uses an index on {app.store.name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import generate_campus
+
+RECORD = struct.Struct('<IBd')
+DEFAULT_TOKEN = 'sensor-simulator'
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SENSOR FEED  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- In-process target: posts through the Flask test client --
+class TestTarget:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, body, content_type, headers):
+        response = self.client.post('/api/sensor-events', data=body, content_type=content_type, headers=headers)
+        return response.status_code
+
+    def stats(self):
+        return self.client.get('/api/sensor-stats').get_json()
+
+
+class HttpTarget:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def post(self, body, content_type, headers):
+        req = urllib.request.Request(self.base_url + '/api/sensor-events', data=body, method='POST',
+                                     headers=dict(headers, **{'Content-Type': content_type}))
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    # -- Sends PARKING_MONITORING_TOKEN when set, which a server not on this host requires --
+    def stats(self):
+        token = os.environ.get('PARKING_MONITORING_TOKEN')
+        req = urllib.request.Request(self.base_url + '/api/sensor-stats',
+                                     headers={'X-Monitoring-Token': token} if token else {})
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return json.load(response)
+
+
+# -- One gateway's feed: mostly heartbeats repeating a spot's state, the rest cars arriving and leaving --
+def encode(reports, fmt, spot_nums):
+    if fmt == 'binary':
+        return b''.join(RECORD.pack(spot_key, occupied, at) for spot_key, occupied, at in reports), \
+            'application/octet-stream'
+    return '\n'.join(json.dumps({'spot': spot_nums[spot_key], 'occupied': bool(occupied), 'at': at})
+                     for spot_key, occupied, at in reports).encode('utf-8'), 'application/x-ndjson'
+
+
+def run_feed(target, token, spots, rate, batch, fmt, duration, heartbeat, gateways, seed):
+    spot_nums = {spot_key: spot_num for spot_key, spot_num, _ in spots}
+    spot_keys = list(spot_nums)
+    state = {spot_key: status for spot_key, _, status in spots}
+    headers = {'X-Sensor-Token': token}
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+    sent = [0]
+    started = time.perf_counter()
+    deadline = started + duration
+    interval = batch * gateways / rate
+
+    def gateway(number):
+        rng = random.Random(seed + number)
+        next_post = started + rng.uniform(0, interval)
+        while next_post < deadline:
+            delay = next_post - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            reports = []
+            with lock:
+                for _ in range(batch):
+                    spot_key = rng.choice(spot_keys)
+                    if rng.random() >= heartbeat:
+                        state[spot_key] ^= 1
+                    reports.append((spot_key, state[spot_key], time.time()))
+            body, content_type = encode(reports, fmt, spot_nums)
+
+            # A gateway keeps its readings and re-posts them when told to back off
+            while True:
+                posted = time.perf_counter()
+                status = target.post(body, content_type, headers)
+                elapsed = (time.perf_counter() - posted) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status == 202:
+                        sent[0] += len(reports)
+                if status != 429:
+                    break
+                time.sleep(1)
+            next_post += interval
+
+    threads = [threading.Thread(target=gateway, args=(number,)) for number in range(gateways)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sent[0], sorted(latencies), statuses, state
+
+
+def percentile(samples, share):
+    return samples[min(len(samples) - 1, int(len(samples) * share))] if samples else 0.0
+
+
+# -- Waits for the flusher to drain, then reports what the server made of the feed --
+def report(target, elapsed, sent, latencies, statuses):
+    deadline = time.perf_counter() + 30
+    stats = target.stats()
+    while stats['pending_spots'] and time.perf_counter() < deadline:
+        time.sleep(0.2)
+        stats = target.stats()
+
+    print(f"\nposted {sent:,} accepted events in {elapsed:.1f} s ({sent / elapsed:,.0f} events/s)")
+    print('batches: ' + ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items())))
+    if latencies:
+        print(f"POST latency: p50 {statistics.median(latencies):.2f} ms, p95 {percentile(latencies, 0.95):.2f} ms, "
+              f"p99 {percentile(latencies, 0.99):.2f} ms")
+    print(f"server: {stats['received']:,} received, {stats['collapsed']:,} collapsed, {stats['stale']:,} stale, "
+          f"{stats['unchanged']:,} unchanged, {stats['applied']:,} applied in {stats['flushes']:,} flushes, "
+          f"{stats['sessions_closed']:,} sessions closed, {stats['held_for_claims']:,} held for claims")
+    print(f"ingest lag: last {stats['last_ingest_lag_seconds'] * 1000:.0f} ms, "
+          f"max {stats['max_ingest_lag_seconds'] * 1000:.0f} ms; last flush {stats['last_flush_ms']:.1f} ms")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate occupancy sensor gateways posting to '
+                                                 '/api/sensor-events and report ingest throughput and lag.')
+    parser.add_argument('--url', help='feed a running server instead of an in-process app')
+    parser.add_argument('--token', default=os.environ.get('PARKING_SENSOR_TOKEN', DEFAULT_TOKEN),
+                        help="the server's PARKING_SENSOR_TOKEN")
+    parser.add_argument('--db', help="the running server's database, to read its spots (required with --url)")
+    parser.add_argument('--rate', type=float, default=20_000, help='sensor reports per second, all gateways')
+    parser.add_argument('--batch', type=int, default=1000, help='reports per POST')
+    parser.add_argument('--gateways', type=int, default=4, help='concurrent posters')
+    parser.add_argument('--format', choices=('json', 'binary'), default='binary')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--heartbeat', type=float, default=0.9, help='share of reports repeating the last state')
+    parser.add_argument('--lots', type=int, default=10)
+    parser.add_argument('--spots-per-lot', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=111)
+    args = parser.parse_args()
+
+    workdir = None
+    if args.url:
+        if not args.db:
+            parser.error('--db is required with --url')
+        target = HttpTarget(args.url)
+        database = args.db
+    else:
+        import bcrypt
+        workdir = tempfile.mkdtemp(prefix='sensor-sim-')
+        data_dir = os.path.join(workdir, 'data')
+        os.mkdir(data_dir)
+        password_hash = bcrypt.hashpw(generate_campus.DEFAULT_PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+        counts = generate_campus.generate(data_dir, args.lots, args.spots_per_lot, args.users, 7, args.seed,
+                                          password_hash)
+        print('campus: ' + ', '.join(f'{count:,} {table}' for table, count in counts.items()))
+
+        sys.path.insert(0, APP_DIR)
+        import bulk_load
+        import endpoint_benchmarks
+        # migrate() imports the app, which reads its settings from the environment
+        os.environ['PARKING_SENSOR_TOKEN'] = args.token
+        os.environ['PARKING_ARCHIVE_DIR'] = os.path.join(workdir, 'archive')
+        database = os.path.join(workdir, 'data.sqlite')
+        bulk_load.migrate(database)
+        bulk_load.bulk_load(database, data_dir)
+        # Cars parked an hour ago, so their sensors reporting free closes the session
+        with sqlite3.connect(database) as conn:
+            endpoint_benchmarks.open_sessions(conn, args.users // 2, 0)
+        import app as parking_app
+        target = TestTarget(parking_app.app)
+
+    with sqlite3.connect(database) as conn:
+        spots = conn.execute("SELECT s_spotskey, s_num, s_status FROM spots").fetchall()
+        parked = conn.execute("SELECT COUNT(*) FROM parkingHistory WHERE ph_departuretime IS NULL").fetchone()[0]
+    print(f"{len(spots):,} spots, {parked:,} open sessions; {args.gateways} gateways posting {args.format} batches "
+          f"of {args.batch:,} at {args.rate:,.0f} reports/s for {args.duration:.0f} s")
+
+    elapsed, sent, latencies, statuses, state = run_feed(
+        target, args.token, spots, args.rate, args.batch, args.format, args.duration, args.heartbeat,
+        args.gateways, args.seed)
+    report(target, elapsed, sent, latencies, statuses)
+
+    if workdir:
+        # Every spot should now agree with the last report sent for it
+        with sqlite3.connect(database) as conn:
+            stored = dict(conn.execute("SELECT s_spotskey, s_status FROM spots"))
+            open_on_free = conn.execute("""
+                SELECT COUNT(*) FROM parkingHistory ph JOIN spots s ON ph.ph_spotskey = s.s_spotskey
+                WHERE ph.ph_departuretime IS NULL AND s.s_status = 0
+            """).fetchone()[0]
+        mismatched = sum(1 for spot_key, status in state.items() if stored[spot_key] != status)
+        print(f"consistency: {mismatched:,} spots differ from their last report, "
+              f"{open_on_free:,} open sessions on free spots")
+        shutil.rmtree(workdir, ignore_errors=True)
+        if open_on_free or mismatched:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
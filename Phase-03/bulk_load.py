@@ -0,0 +1,207 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(HERE), 'Phase-02', 'data')
+
+# Parents before children, so a partial load never leaves rows pointing at tables that were not loaded yet
+TABLES = ['zone', 'lot', 'permitType', 'users', 'zoneAssignment', 'spots', 'vehicles', 'permit', 'parkingHistory']
+BATCH_SIZE = 50_000
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- .TBL PARSING  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Streams one .tbl file as tuples: '|' separated, fields stripped, literal NULL (or nothing) becomes None. --
+# Lines with the wrong number of fields are collected in `rejects` as (line number, reason) instead of loaded.
+def read_tbl(path, column_count, rejects):
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                continue
+            fields = [field.strip() for field in line.split('|')]
+            # The sqlite3 shell tolerated a trailing separator; so do we
+            if len(fields) == column_count + 1 and fields[-1] == '':
+                fields.pop()
+            if len(fields) != column_count:
+                rejects.append((line_number, f'expected {column_count} fields, found {len(fields)}'))
+                continue
+            yield tuple(None if field in ('', 'NULL') else field for field in fields)
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- LOADER  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- A database path is SQLite; a postgresql:// URL is PostgreSQL --
+def is_postgresql(target):
+    return target.startswith(('postgresql://', 'postgres://'))
+
+
+# -- Brings the target database to the current schema by importing the app, which runs the migrations. --
+# Returns the app's storage, whose Error and IntegrityError match the target's driver.
+def migrate(target):
+    if is_postgresql(target):
+        os.environ['PARKING_DATABASE_URL'] = target
+    else:
+        os.environ['PARKING_DB'] = target
+    os.environ['PARKING_SCHEDULER'] = '0'
+    sys.path.insert(0, HERE)
+    import app
+    # journal_mode cannot leave WAL while another connection is open
+    app.pool.close_idle()
+    return app.store
+
+
+def existing_tables(data_dir, tables):
+    return [table for table in (tables or TABLES) if os.path.exists(os.path.join(data_dir, f'{table}.tbl'))]
+
+
+# -- Loads every TABLES entry that has a <table>.tbl in data_dir. Returns ([(table, rows, rejects, seconds)], --
+# index seconds, foreign key violations, [(index, error)] for indexes that could not be rebuilt).
+# During the load: no journal, no fsync, foreign keys off, and the secondary indexes of the loaded tables
+# dropped; the indexes are rebuilt once at the end and foreign keys are checked in one pass afterwards.
+# Without a journal a failed load cannot be rolled back cleanly, so load into a fresh copy and swap it in.
+def bulk_load(path, data_dir, tables=None, replace=False):
+    if is_postgresql(path):
+        return bulk_load_postgresql(path, data_dir, tables)
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    tables = existing_tables(data_dir, tables)
+
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+
+    placeholders = ','.join('?' * len(tables))
+    indexes = conn.execute(f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    """, tables).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+
+    results = []
+    failed_indexes = []
+    try:
+        for table in tables:
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+            insert = (f'INSERT {"OR REPLACE " if replace else ""}INTO "{table}" '
+                      f'VALUES({",".join("?" * len(columns))})')
+            rejects = []
+            loaded = 0
+            started = time.perf_counter()
+
+            conn.execute("BEGIN")
+            for batch in batches(read_tbl(os.path.join(data_dir, f'{table}.tbl'), len(columns), rejects), BATCH_SIZE):
+                conn.executemany(insert, batch)
+                loaded += len(batch)
+            conn.execute("COMMIT")
+
+            results.append((table, loaded, rejects, time.perf_counter() - started))
+    finally:
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+            # Recreated even when a load failed, so the database is never left without its indexes. Each one is
+            # built on its own: a UNIQUE index the loaded rows violate is reported and the others still get built.
+            started = time.perf_counter()
+            for name, sql in indexes:
+                try:
+                    conn.execute(sql)
+                except sqlite3.Error as error:
+                    failed_indexes.append((name, str(error)))
+                    print(f"Bulk load: could not rebuild index {name} ({error}).")
+            index_seconds = time.perf_counter() - started
+        finally:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+    violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+    conn.execute("ANALYZE")
+    conn.close()
+    return results, index_seconds, violations, failed_indexes
+
+
+# -- PostgreSQL: one COPY per table, each in its own transaction, so a failed table leaves the ones before it --
+# loaded. Foreign keys are checked as rows arrive, which fails the table at the first bad reference instead of
+# reporting violations afterwards, and indexes stay in place.
+def bulk_load_postgresql(url, data_dir, tables=None):
+    import postgres
+    conn = postgres.connect(url)
+    results = []
+    try:
+        for table in existing_tables(data_dir, tables):
+            rejects = []
+            started = time.perf_counter()
+            rows = read_tbl(os.path.join(data_dir, f'{table}.tbl'), postgres.column_count(conn, table), rejects)
+            loaded = postgres.copy_rows(conn, table, rows)
+            results.append((table, loaded, rejects, time.perf_counter() - started))
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return results, 0.0, [], []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load Phase-02 style .tbl files into the parking database.')
+    parser.add_argument('--db', default=os.path.join(HERE, 'instance', 'data.sqlite'),
+                        help='SQLite database path, or a postgresql:// URL')
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help='directory holding <table>.tbl files')
+    parser.add_argument('--tables', nargs='+', choices=TABLES, help='load only these tables')
+    parser.add_argument('--replace', action='store_true', help='overwrite rows whose primary key already exists')
+    args = parser.parse_args()
+    if args.replace and is_postgresql(args.db):
+        parser.error('--replace is only supported for SQLite databases')
+
+    store = migrate(args.db)
+    started = time.perf_counter()
+    try:
+        results, index_seconds, violations, failed_indexes = bulk_load(args.db, args.data, args.tables, args.replace)
+    except store.IntegrityError as error:
+        hint = '' if is_postgresql(args.db) else '; use --replace to overwrite existing rows'
+        print(f"Bulk load: failed ({error}){hint}.")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    total = 0
+    for table, loaded, rejects, seconds in results:
+        total += loaded
+        print(f"{table:<16} {loaded:>10,} rows  {seconds:7.2f} s  {loaded / seconds if seconds else 0:>12,.0f} rows/s"
+              + (f"  {len(rejects)} rejected" if rejects else ''))
+        for line_number, reason in rejects[:5]:
+            print(f"    line {line_number}: {reason}")
+    print(f"indexes rebuilt in {index_seconds:.2f} s")
+    print(f"total {total:,} rows in {elapsed:.2f} s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    if failed_indexes:
+        print(f"Bulk load: {len(failed_indexes)} indexes missing, e.g. {failed_indexes[:5]}; "
+              f"remove the duplicate rows and run the load again.")
+    if violations:
+        print(f"Bulk load: {len(violations)} foreign key violations, e.g. {violations[:5]}")
+    if failed_indexes or violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+-- Baseline schema (Phase-02/tracker-schema.sql). IF NOT EXISTS so existing databases are adopted as-is.
+
+CREATE TABLE IF NOT EXISTS users (
+    u_userkey integer PRIMARY KEY not null,
+    u_name varchar(20) not null,
+    u_email varchar(20) not null,
+    u_password varchar(20) not null
+);
+
+CREATE TABLE IF NOT EXISTS permitType (
+    pt_permittypekey integer PRIMARY KEY,
+    pt_category varchar(20),
+    pt_duration varchar(20)
+);
+
+CREATE TABLE IF NOT EXISTS zone (
+    z_zonekey integer PRIMARY KEY,
+    z_type varchar(10)
+);
+
+CREATE TABLE IF NOT EXISTS lot (
+    l_lotkey integer PRIMARY KEY,
+    l_name varchar(20) not null,
+    l_capacity integer not null,
+    l_latitude DECIMAL(9,6),
+    l_longitude DECIMAL(9,6) 
+);
+
+CREATE TABLE IF NOT EXISTS zoneAssignment (
+    za_zonekey integer not null,
+    za_lotkey integer not null,
+    za_isactive BOOL,
+
+    FOREIGN KEY (za_zonekey) REFERENCES zone(z_zonekey),
+    FOREIGN KEY (za_lotkey) REFERENCES lot(l_lotkey)
+);
+
+CREATE TABLE IF NOT EXISTS vehicles (
+    v_vehicleskey integer PRIMARY KEY,
+    v_userkey integer not null,
+    v_plateno varchar(7) not null,
+    v_platestate varchar(20),
+    v_maker varchar(20),
+    v_model varchar(10),
+    v_color varchar(10),
+
+    FOREIGN KEY (v_userkey) REFERENCES users(u_userkey)
+);
+
+CREATE TABLE IF NOT EXISTS permit (
+    p_permitkey integer PRIMARY KEY,
+    p_userkey integer not null,
+    p_vehicleskey integer not null,
+    p_permittypekey integer not null,
+    p_permitnum varchar(20) NOT NULL,
+    p_issuedate date not null,
+    p_expirationdate date not null,
+
+    FOREIGN KEY (p_userkey) REFERENCES users(u_userkey),
+    FOREIGN KEY (p_vehicleskey) REFERENCES vehicles(v_vehicleskey),
+    FOREIGN KEY (p_permittypekey) REFERENCES permitType(pt_permittypekey)
+);
+
+CREATE TABLE IF NOT EXISTS spots (
+    s_spotskey integer PRIMARY KEY,
+    s_zonekey integer not null,
+    s_status BOOL,
+    s_num varchar(5) not null,
+    s_isactive BOOL,
+    s_latitude DECIMAL(9,6),
+    s_longitude DECIMAL(9,6),
+    s_lotkey integer not null,
+
+    FOREIGN KEY (s_zonekey) REFERENCES zone(z_zonekey),
+    FOREIGN KEY (s_lotkey) REFERENCES lot(l_lotkey)
+);
+
+CREATE TABLE IF NOT EXISTS parkingHistory (
+    ph_parkinghistkey integer PRIMARY KEY,
+    ph_vehicleskey integer not null,
+    ph_spotskey integer not null,
+    ph_arrivaltime DATETIME,
+    ph_departuretime DATETIME,
+
+    FOREIGN KEY (ph_vehicleskey) REFERENCES vehicles(v_vehicleskey),
+    FOREIGN KEY (ph_spotskey) REFERENCES spots(s_spotskey)
+);
@@ -0,0 +1,35 @@
+-- Indexes for the predicates on the request path and in the enforcement/cleanup jobs.
+
+-- Open parking sessions: "ph_vehicleskey = ? AND ph_departuretime IS NULL" (claim, unclaim, status, view_permit)
+CREATE INDEX idx_parkinghistory_open_vehicle
+    ON parkingHistory(ph_vehicleskey, ph_spotskey, ph_arrivaltime)
+    WHERE ph_departuretime IS NULL;
+
+-- Closed sessions by departure time (delete_old_parking_records)
+CREATE INDEX idx_parkinghistory_departed
+    ON parkingHistory(ph_departuretime)
+    WHERE ph_departuretime IS NOT NULL;
+
+-- Any session for a vehicle (delete_expired_permits NOT EXISTS probe)
+CREATE INDEX idx_parkinghistory_vehicle
+    ON parkingHistory(ph_vehicleskey);
+
+-- Active permit lookup by user, covering the columns the handlers read
+CREATE INDEX idx_permit_user_expiration
+    ON permit(p_userkey, p_expirationdate, p_vehicleskey, p_permittypekey);
+
+-- Active permit lookup by vehicle (view_vehicles delete guard, enforcement join)
+CREATE INDEX idx_permit_vehicle_expiration
+    ON permit(p_vehicleskey, p_expirationdate);
+
+-- Expired permit sweep
+CREATE INDEX idx_permit_expiration
+    ON permit(p_expirationdate);
+
+CREATE UNIQUE INDEX idx_spots_num ON spots(s_num);
+
+CREATE INDEX idx_spots_lot_zone ON spots(s_lotkey, s_zonekey);
+
+CREATE UNIQUE INDEX idx_vehicles_plate ON vehicles(v_plateno);
+
+CREATE INDEX idx_vehicles_user ON vehicles(v_userkey);
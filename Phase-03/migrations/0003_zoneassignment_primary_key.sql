@@ -0,0 +1,19 @@
+-- zoneAssignment gets a composite primary key on (lot, zone). SQLite cannot add a primary key in place,
+-- so the table is rebuilt and renamed.
+
+CREATE TABLE zoneAssignment_new (
+    za_zonekey integer not null,
+    za_lotkey integer not null,
+    za_isactive BOOL,
+
+    PRIMARY KEY (za_lotkey, za_zonekey),
+    FOREIGN KEY (za_zonekey) REFERENCES zone(z_zonekey),
+    FOREIGN KEY (za_lotkey) REFERENCES lot(l_lotkey)
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO zoneAssignment_new(za_zonekey, za_lotkey, za_isactive)
+SELECT za_zonekey, za_lotkey, za_isactive FROM zoneAssignment;
+
+DROP TABLE zoneAssignment;
+
+ALTER TABLE zoneAssignment_new RENAME TO zoneAssignment;
@@ -0,0 +1,7 @@
+-- Leader lease for the background scheduler: one row per lease, held by the worker that runs maintenance jobs.
+
+CREATE TABLE schedulerLease (
+    sl_name varchar(20) PRIMARY KEY,
+    sl_owner varchar(60) not null,
+    sl_expires REAL not null
+);
@@ -0,0 +1,9 @@
+-- Closed parking sessions moved out of parkingHistory by the purge job when PURGE_ARCHIVE is on.
+
+CREATE TABLE parkingHistoryArchive (
+    ph_parkinghistkey integer PRIMARY KEY,
+    ph_vehicleskey integer not null,
+    ph_spotskey integer not null,
+    ph_arrivaltime DATETIME,
+    ph_departuretime DATETIME
+);
@@ -0,0 +1,9 @@
+-- Log of changed users, replayed by every worker to evict them from its in-process user cache.
+
+CREATE TABLE userInvalidation (
+    ui_invalidationkey integer PRIMARY KEY,
+    ui_userkey integer not null,
+    ui_at REAL not null
+);
+
+CREATE INDEX idx_userinvalidation_at ON userInvalidation(ui_at);
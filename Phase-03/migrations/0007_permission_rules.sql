@@ -0,0 +1,19 @@
+-- Parking eligibility as data: a rule lets a permit category park in a zone, optionally only in one lot and only
+-- during campus hours [pr_starthour, pr_endhour). A NULL category or lot matches any; a window with
+-- start > end wraps past midnight.
+
+CREATE TABLE permissionRule (
+    pr_rulekey integer PRIMARY KEY,
+    pr_category varchar(30),
+    pr_zonekey integer not null,
+    pr_lotkey integer,
+    pr_starthour integer not null DEFAULT 0,
+    pr_endhour integer not null DEFAULT 24,
+    FOREIGN KEY (pr_zonekey) REFERENCES zone(z_zonekey),
+    FOREIGN KEY (pr_lotkey) REFERENCES lot(l_lotkey)
+);
+
+-- The rules that were hard-coded before: Green for every permit, Gold for Faculty, H for On-Campus Students
+INSERT INTO permissionRule(pr_category, pr_zonekey) VALUES(NULL, 1);
+INSERT INTO permissionRule(pr_category, pr_zonekey) VALUES('Faculty', 2);
+INSERT INTO permissionRule(pr_category, pr_zonekey) VALUES('On-Campus Student', 3);
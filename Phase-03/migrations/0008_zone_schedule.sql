@@ -0,0 +1,21 @@
+-- Time-window zone schedules: while a window is open its zone is the active zone of the lot, every spot in the
+-- lot belongs to it and the lot's other scheduled zones are deactivated. Times are campus 'HH:MM'; a window
+-- whose end is not after its start runs past midnight. zs_weekday is 0 (Monday) to 6 (Sunday) and applies to
+-- windows starting that day; NULL means every day, and weekday rows take precedence over it.
+
+CREATE TABLE zoneSchedule (
+    zs_schedulekey integer PRIMARY KEY,
+    zs_lotkey integer not null,
+    zs_zonekey integer not null,
+    zs_weekday integer,
+    zs_start varchar(5) not null,
+    zs_end varchar(5) not null,
+    FOREIGN KEY (zs_lotkey) REFERENCES lot(l_lotkey),
+    FOREIGN KEY (zs_zonekey) REFERENCES zone(z_zonekey)
+);
+
+CREATE INDEX idx_zoneschedule_lot ON zoneSchedule(zs_lotkey);
+
+-- North Bowl: Gold during the day, Green from 19:00 to 06:00
+INSERT INTO zoneSchedule(zs_lotkey, zs_zonekey, zs_weekday, zs_start, zs_end) VALUES(3, 2, NULL, '06:00', '19:00');
+INSERT INTO zoneSchedule(zs_lotkey, zs_zonekey, zs_weekday, zs_start, zs_end) VALUES(3, 1, NULL, '19:00', '06:00');
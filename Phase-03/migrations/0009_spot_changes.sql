@@ -0,0 +1,10 @@
+-- Log of spots changed by claims, unclaims, enforcement, zone flips and sensor reports. Every worker replays it
+-- to bring its in-process occupancy index up to date with the writes made by the others; the scheduler prunes it.
+
+CREATE TABLE spotChange (
+    sc_changekey integer PRIMARY KEY,
+    sc_spotkey integer not null,
+    sc_at REAL not null
+);
+
+CREATE INDEX idx_spotchange_at ON spotChange(sc_at);
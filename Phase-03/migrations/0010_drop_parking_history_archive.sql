@@ -0,0 +1,8 @@
+-- parkingHistoryArchive has been unused since closed sessions moved into the monthly archive files. Rows staged in
+-- it by the 0005 purge go back into parkingHistory, where the next purge archives them like any other closed session.
+
+INSERT OR IGNORE INTO parkingHistory(ph_parkinghistkey, ph_vehicleskey, ph_spotskey, ph_arrivaltime, ph_departuretime)
+SELECT ph_parkinghistkey, ph_vehicleskey, ph_spotskey, ph_arrivaltime, ph_departuretime
+FROM parkingHistoryArchive;
+
+DROP TABLE parkingHistoryArchive;
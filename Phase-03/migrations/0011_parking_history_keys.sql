@@ -0,0 +1,33 @@
+-- Session keys are never handed out twice. parkingHistory was keyed by a plain INTEGER PRIMARY KEY, which reuses
+-- the highest key once that row is deleted (purged or archived); AUTOINCREMENT keeps a high-water mark in
+-- sqlite_sequence instead. SQLite cannot add AUTOINCREMENT to a table, so the table is rebuilt with its indexes.
+
+CREATE TABLE parkingHistory_new (
+    ph_parkinghistkey integer PRIMARY KEY AUTOINCREMENT,
+    ph_vehicleskey integer not null,
+    ph_spotskey integer not null,
+    ph_arrivaltime DATETIME,
+    ph_departuretime DATETIME,
+
+    FOREIGN KEY (ph_vehicleskey) REFERENCES vehicles(v_vehicleskey),
+    FOREIGN KEY (ph_spotskey) REFERENCES spots(s_spotskey)
+);
+
+INSERT INTO parkingHistory_new(ph_parkinghistkey, ph_vehicleskey, ph_spotskey, ph_arrivaltime, ph_departuretime)
+SELECT ph_parkinghistkey, ph_vehicleskey, ph_spotskey, ph_arrivaltime, ph_departuretime
+FROM parkingHistory;
+
+DROP TABLE parkingHistory;
+
+ALTER TABLE parkingHistory_new RENAME TO parkingHistory;
+
+CREATE INDEX idx_parkinghistory_open_vehicle
+    ON parkingHistory(ph_vehicleskey, ph_spotskey, ph_arrivaltime)
+    WHERE ph_departuretime IS NULL;
+
+CREATE INDEX idx_parkinghistory_departed
+    ON parkingHistory(ph_departuretime)
+    WHERE ph_departuretime IS NOT NULL;
+
+CREATE INDEX idx_parkinghistory_vehicle
+    ON parkingHistory(ph_vehicleskey);
@@ -0,0 +1,157 @@
+-- PostgreSQL schema: the tables, indexes and seed rows SQLite reaches through migrations 0001-0008, so a new
+-- PostgreSQL database starts at version 8 and later migrations are written once per engine under one number.
+--
+-- Differences from the SQLite schema:
+--   * keys the app inserts without are identity columns (SQLite assigns INTEGER PRIMARY KEY itself);
+--   * times are timestamp(0), flags are smallint 0/1 (the values SQLite stores), coordinates double precision;
+--   * foreign keys are enforced, except on permissionRule and zoneSchedule, whose seed rows name lots and zones
+--     that are only loaded afterwards.
+
+CREATE TABLE users (
+    u_userkey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    u_name text not null,
+    u_email text not null,
+    u_password text not null
+);
+
+CREATE TABLE permitType (
+    pt_permittypekey integer PRIMARY KEY,
+    pt_category varchar(20),
+    pt_duration varchar(20)
+);
+
+CREATE TABLE zone (
+    z_zonekey integer PRIMARY KEY,
+    z_type varchar(10)
+);
+
+CREATE TABLE lot (
+    l_lotkey integer PRIMARY KEY,
+    l_name text not null,
+    l_capacity integer not null,
+    l_latitude double precision,
+    l_longitude double precision
+);
+
+CREATE TABLE zoneAssignment (
+    za_zonekey integer not null REFERENCES zone(z_zonekey),
+    za_lotkey integer not null REFERENCES lot(l_lotkey),
+    za_isactive smallint,
+    PRIMARY KEY (za_lotkey, za_zonekey)
+);
+
+CREATE TABLE vehicles (
+    v_vehicleskey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    v_userkey integer not null REFERENCES users(u_userkey),
+    v_plateno text not null,
+    v_platestate text,
+    v_maker text,
+    v_model text,
+    v_color text
+);
+
+CREATE TABLE permit (
+    p_permitkey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    p_userkey integer not null REFERENCES users(u_userkey),
+    p_vehicleskey integer not null REFERENCES vehicles(v_vehicleskey),
+    p_permittypekey integer not null REFERENCES permitType(pt_permittypekey),
+    p_permitnum text not null,
+    p_issuedate timestamp(0) not null,
+    p_expirationdate timestamp(0) not null
+);
+
+CREATE TABLE spots (
+    s_spotskey integer PRIMARY KEY,
+    s_zonekey integer not null REFERENCES zone(z_zonekey),
+    s_status smallint,
+    s_num text not null,
+    s_isactive smallint,
+    s_latitude double precision,
+    s_longitude double precision,
+    s_lotkey integer not null REFERENCES lot(l_lotkey)
+);
+
+CREATE TABLE parkingHistory (
+    ph_parkinghistkey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    ph_vehicleskey integer not null REFERENCES vehicles(v_vehicleskey),
+    ph_spotskey integer not null REFERENCES spots(s_spotskey),
+    ph_arrivaltime timestamp(0),
+    ph_departuretime timestamp(0)
+);
+
+CREATE INDEX idx_parkinghistory_open_vehicle
+    ON parkingHistory(ph_vehicleskey, ph_spotskey, ph_arrivaltime)
+    WHERE ph_departuretime IS NULL;
+
+CREATE INDEX idx_parkinghistory_departed
+    ON parkingHistory(ph_departuretime)
+    WHERE ph_departuretime IS NOT NULL;
+
+CREATE INDEX idx_parkinghistory_vehicle ON parkingHistory(ph_vehicleskey);
+
+-- Open sessions by spot (sensor flushes); SQLite scans the open-session index for these instead
+CREATE INDEX idx_parkinghistory_open_spot ON parkingHistory(ph_spotskey) WHERE ph_departuretime IS NULL;
+
+CREATE INDEX idx_permit_user_expiration
+    ON permit(p_userkey, p_expirationdate, p_vehicleskey, p_permittypekey);
+
+CREATE INDEX idx_permit_vehicle_expiration ON permit(p_vehicleskey, p_expirationdate);
+
+CREATE INDEX idx_permit_expiration ON permit(p_expirationdate);
+
+CREATE UNIQUE INDEX idx_spots_num ON spots(s_num);
+
+CREATE INDEX idx_spots_lot_zone ON spots(s_lotkey, s_zonekey);
+
+CREATE UNIQUE INDEX idx_vehicles_plate ON vehicles(v_plateno);
+
+CREATE INDEX idx_vehicles_user ON vehicles(v_userkey);
+
+CREATE TABLE schedulerLease (
+    sl_name varchar(20) PRIMARY KEY,
+    sl_owner varchar(60) not null,
+    sl_expires double precision not null
+);
+
+CREATE TABLE parkingHistoryArchive (
+    ph_parkinghistkey integer PRIMARY KEY,
+    ph_vehicleskey integer not null,
+    ph_spotskey integer not null,
+    ph_arrivaltime timestamp(0),
+    ph_departuretime timestamp(0)
+);
+
+CREATE TABLE userInvalidation (
+    ui_invalidationkey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    ui_userkey integer not null,
+    ui_at double precision not null
+);
+
+CREATE INDEX idx_userinvalidation_at ON userInvalidation(ui_at);
+
+CREATE TABLE permissionRule (
+    pr_rulekey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    pr_category varchar(30),
+    pr_zonekey integer not null,
+    pr_lotkey integer,
+    pr_starthour integer not null DEFAULT 0,
+    pr_endhour integer not null DEFAULT 24
+);
+
+INSERT INTO permissionRule(pr_category, pr_zonekey) VALUES(NULL, 1);
+INSERT INTO permissionRule(pr_category, pr_zonekey) VALUES('Faculty', 2);
+INSERT INTO permissionRule(pr_category, pr_zonekey) VALUES('On-Campus Student', 3);
+
+CREATE TABLE zoneSchedule (
+    zs_schedulekey integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    zs_lotkey integer not null,
+    zs_zonekey integer not null,
+    zs_weekday integer,
+    zs_start varchar(5) not null,
+    zs_end varchar(5) not null
+);
+
+CREATE INDEX idx_zoneschedule_lot ON zoneSchedule(zs_lotkey);
+
+INSERT INTO zoneSchedule(zs_lotkey, zs_zonekey, zs_weekday, zs_start, zs_end) VALUES(3, 2, NULL, '06:00', '19:00');
+INSERT INTO zoneSchedule(zs_lotkey, zs_zonekey, zs_weekday, zs_start, zs_end) VALUES(3, 1, NULL, '19:00', '06:00');
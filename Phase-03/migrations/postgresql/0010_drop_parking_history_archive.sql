@@ -0,0 +1,4 @@
+-- parkingHistoryArchive has been unused since closed sessions moved into the monthly archive files. Nothing ever
+-- staged rows in it on PostgreSQL, so it is dropped as it is.
+
+DROP TABLE parkingHistoryArchive;
@@ -0,0 +1,10 @@
+-- Session keys are never handed out twice. The identity sequence never goes back on its own; GENERATED ALWAYS
+-- also stops an INSERT from picking a key by hand (COPY, used by bulk loads, may still give one), so every new
+-- session takes its key from the sequence, as AUTOINCREMENT does on SQLite.
+
+ALTER TABLE parkingHistory ALTER COLUMN ph_parkinghistkey SET GENERATED ALWAYS;
+
+SELECT setval(pg_get_serial_sequence('parkinghistory', 'ph_parkinghistkey'),
+              GREATEST((SELECT COALESCE(MAX(ph_parkinghistkey), 0) FROM parkingHistory) + 1,
+                       nextval(pg_get_serial_sequence('parkinghistory', 'ph_parkinghistkey'))),
+              false);
@@ -0,0 +1,23 @@
+import bcrypt
+
+# Runs inside the password process pool; kept free of app imports so unpickling a call in a worker stays cheap.
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+# -- False for anything that is not a bcrypt hash, such as the plaintext passwords in Phase-02/data/users.tbl --
+def check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+# -- Cost factor of a '$2b$12$...' hash, or None when it is not a bcrypt hash --
+def hash_rounds(password_hash):
+    parts = password_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
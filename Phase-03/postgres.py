@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg
+from psycopg.pq import TransactionStatus
+from psycopg.types.string import TextLoader
+from psycopg_pool import ConnectionPool as PsycopgPool
+
+import storage
+
+# PostgreSQL backend (psycopg 3 and psycopg_pool), imported by app.py only when PARKING_DATABASE_URL is set.
+#
+# Connections run in autocommit, so a request that only reads never leaves a transaction open on a pooled
+# connection; writes go through PostgresStorage.transaction(), where claims lock the rows they check instead of
+# the whole database. prepare_threshold=0 prepares every parameterized statement server-side on its first run
+# and reuses it for the life of the connection. Timestamps come back as the same 'YYYY-MM-DD HH:MM:SS' text the
+# SQLite columns hold, so code above the repositories sees identical rows from both engines.
+
+# pg_advisory_xact_lock key held while migrations run, so concurrent workers apply each one once
+MIGRATION_LOCK = 111_0001
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CONNECTIONS  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+_converted = {}
+
+
+# -- The app's SQL uses ? placeholders; psycopg takes %s, with a literal % written as %% --
+def qmark(sql):
+    converted = _converted.get(sql)
+    if converted is None:
+        converted = _converted[sql] = sql.replace('%', '%%').replace('?', '%s')
+    return converted
+
+
+class Connection(psycopg.Connection):
+    # (connection, sql, parameters, seconds, rows) -> None, called after every statement; set by the pool
+    statement_hook = None
+
+    # -- Same meaning as sqlite3.Connection.in_transaction, which the pool and the scheduler rely on --
+    @property
+    def in_transaction(self):
+        return self.info.transaction_status != TransactionStatus.IDLE
+
+    # -- sqlite3.Connection has this shortcut and psycopg does not --
+    def executemany(self, query, params_seq):
+        cursor = self.cursor()
+        cursor.executemany(query, params_seq)
+        return cursor
+
+
+# -- Accepts ? placeholders and reports each statement to the connection's hook. A client-side cursor has --
+# fetched every row by the time execute returns, so rowcount is the rows read or changed.
+class Cursor(psycopg.Cursor):
+    def execute(self, query, params=None, **kwargs):
+        sql = query
+        if params is not None:
+            query = qmark(query)
+        hook = self.connection.statement_hook
+        if hook is None:
+            return super().execute(query, params, **kwargs)
+        started = time.perf_counter()
+        super().execute(query, params, **kwargs)
+        hook(self.connection, sql, params, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def executemany(self, query, params_seq, **kwargs):
+        sql = query
+        query = qmark(query)
+        hook = self.connection.statement_hook
+        if hook is None:
+            return super().executemany(query, params_seq, **kwargs)
+        started = time.perf_counter()
+        super().executemany(query, params_seq, **kwargs)
+        hook(self.connection, sql, None, time.perf_counter() - started, self.rowcount)
+        return self
+
+
+# -- Same interface and stats as app.ConnectionPool, over psycopg_pool's pool --
+class PostgresPool:
+    def __init__(self, url, size, statement_hook=None, timeout=30.0):
+        self.url = url
+        self.size = size
+        self.statement_hook = statement_hook
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._releases = 0
+        self._hold_time = 0.0
+        self._checked_out = {}
+        self._pool = PsycopgPool(url, min_size=1, max_size=size, timeout=timeout, connection_class=Connection,
+                                 kwargs=self._connect_options(), configure=self._configure, open=True,
+                                 name='parking')
+
+    @staticmethod
+    def _connect_options():
+        return {'autocommit': True, 'prepare_threshold': 0, 'cursor_factory': Cursor}
+
+    def _configure(self, conn):
+        conn.adapters.register_loader('timestamp', TextLoader)
+        conn.statement_hook = self.statement_hook
+
+    # -- A connection outside the pool with the same settings (the scheduler's writer) --
+    def new_connection(self):
+        conn = Connection.connect(self.url, **self._connect_options())
+        self._configure(conn)
+        return conn
+
+    def acquire(self):
+        conn = self._pool.getconn()
+        with self._lock:
+            self._checkouts += 1
+            self._checked_out[id(conn)] = time.perf_counter()
+        return conn
+
+    def release(self, conn):
+        # Never hand a connection with a half-finished transaction to the next caller
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._lock:
+            started = self._checked_out.pop(id(conn), None)
+            if started is not None:
+                self._releases += 1
+                self._hold_time += time.perf_counter() - started
+        self._pool.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    # -- Nothing to do: idle PostgreSQL connections hold no locks that would get in an offline tool's way --
+    def close_idle(self):
+        pass
+
+    def close(self):
+        self._pool.close()
+
+    def stats(self):
+        pool_stats = self._pool.get_stats()
+        with self._lock:
+            waits = pool_stats.get('requests_queued', 0)
+            return {
+                'size': self.size,
+                'created': pool_stats.get('pool_size', 0),
+                'idle': pool_stats.get('pool_available', 0),
+                'in_use': len(self._checked_out),
+                'checkouts': self._checkouts,
+                'waits': waits,
+                'avg_wait_ms': pool_stats.get('requests_wait_ms', 0) / waits if waits else 0.0,
+                'avg_hold_ms': (self._hold_time / self._releases * 1000) if self._releases else 0.0
+            }
+
+
+# -- Flask-SQLAlchemy URI for the same database, through SQLAlchemy's psycopg 3 dialect --
+def sqlalchemy_url(url):
+    return 'postgresql+psycopg://' + url.split('://', 1)[1]
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- POSTGRESQL STORAGE  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+class PostgresStorage(storage.Storage):
+    name = 'postgresql'
+    Error = psycopg.Error
+    IntegrityError = psycopg.IntegrityError
+    MIGRATIONS = os.path.join('migrations', 'postgresql')
+
+    # -- Writers only block each other on the rows they lock, so a transaction checks and updates under row locks --
+    @contextmanager
+    def transaction(self, conn):
+        with conn.transaction():
+            yield
+
+    def lock(self, *aliases):
+        return f" FOR UPDATE OF {', '.join(aliases)}"
+
+    # -- One array parameter instead of one placeholder per value, so every list length shares a prepared statement --
+    def in_list(self, column, values):
+        return f"{column} = ANY(?)", [list(values)]
+
+    def sql(self, text):
+        return qmark(text)
+
+    # -- Under a savepoint, so a statement EXPLAIN rejects does not abort the transaction it was logged from --
+    def explain(self, conn, sql, parameters):
+        with conn.transaction(), psycopg.Cursor(conn) as cursor:
+            cursor.execute(f"EXPLAIN {qmark(sql)}", parameters, prepare=False)
+            return [row[0].strip() for row in cursor.fetchall()]
+
+    # -- Makes the next identity value of `table` greater than `key`; never moves the sequence back --
+    def advance_keys(self, conn, table, column, key):
+        if not key:
+            return
+        conn.execute("""
+            SELECT setval(sequence, GREATEST(?, nextval(sequence) - 1))
+            FROM pg_get_serial_sequence(?, ?) AS sequence
+        """, [key, table.lower(), column])
+
+    # -- Applies migrations/postgresql/NNNN_name.sql in order, recording each in schemaVersion. Numbers match the --
+    # SQLite migrations; a new database starts from 0008, which creates the schema SQLite reached in 0001-0008.
+    def run_migrations(self, conn, migrations_dir):
+        with conn.transaction():
+            conn.execute("SELECT pg_advisory_xact_lock(?)", [MIGRATION_LOCK])
+            conn.execute("CREATE TABLE IF NOT EXISTS schemaVersion (sv_version integer PRIMARY KEY)")
+            applied = conn.execute("SELECT COALESCE(MAX(sv_version), 0) FROM schemaVersion").fetchone()[0]
+
+            for version, filename in storage.migration_files(migrations_dir):
+                if version <= applied:
+                    continue
+                with open(os.path.join(migrations_dir, filename)) as f:
+                    # A script of several statements cannot be a prepared statement
+                    conn.execute(f.read(), prepare=False)
+                conn.execute("INSERT INTO schemaVersion(sv_version) VALUES(?)", [version])
+                print(f"Migrations: applied {filename}")
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- BULK LOAD  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Tables whose key column is an identity, whose sequence has to move past explicitly loaded keys --
+IDENTITY_KEYS = {
+    'users': 'u_userkey',
+    'vehicles': 'v_vehicleskey',
+    'permit': 'p_permitkey',
+    'parkingHistory': 'ph_parkinghistkey'
+}
+
+
+# -- COPYs rows into one table in a single transaction; returns the number of rows --
+def copy_rows(conn, table, rows):
+    loaded = 0
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            with cursor.copy(f"COPY {table} FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    loaded += 1
+        key = IDENTITY_KEYS.get(table)
+        if key is not None:
+            # Only ever forward: keys of rows deleted since (archived sessions) are not handed out again
+            conn.execute(f"""
+                SELECT setval(sequence, GREATEST((SELECT COALESCE(MAX({key}), 0) FROM {table}) + 1, nextval(sequence)),
+                              false)
+                FROM pg_get_serial_sequence('{table.lower()}', '{key}') AS sequence
+            """)
+    return loaded
+
+
+def column_count(conn, table):
+    return conn.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = ?
+    """, [table.lower()]).fetchone()[0]
+
+
+def connect(url):
+    conn = Connection.connect(url, autocommit=True, cursor_factory=Cursor)
+    conn.adapters.register_loader('timestamp', TextLoader)
+    return conn
@@ -0,0 +1,464 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# Repository layer for the tracker tables: spots, parking sessions, permits, vehicles and zones.
+#
+# The SQL is written once: ? placeholders, no engine functions (campus times are computed here and passed in),
+# keys assigned by the database and read back with RETURNING. What differs between engines lives on the storage
+# object the repositories are built with: Storage below is SQLite, postgres.PostgresStorage overrides the write
+# transaction, row locks, IN lists and migrations for PostgreSQL. The app picks one from PARKING_DATABASE_URL.
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- CAMPUS TIME  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Campus wall-clock time (UTC-8, no daylight saving), the clock every stored timestamp is written in --
+def campus_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=8)
+
+
+# -- 'YYYY-MM-DD HH:MM:SS', the text DATETIME('now', '-08:00') used to produce; `at` defaults to now --
+def campus_timestamp(at=None):
+    return (at or campus_now()).isoformat(sep=' ', timespec='seconds')
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- SQLITE STORAGE  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Storage:
+    name = 'sqlite'
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    MIGRATIONS = 'migrations'
+
+    def __init__(self):
+        self.spots = SpotRepository(self)
+        self.sessions = SessionRepository(self)
+        self.permits = PermitRepository(self)
+        self.vehicles = VehicleRepository(self)
+        self.zones = ZoneRepository(self)
+
+    # -- One write transaction. SQLite has a single writer, so taking its lock up front (BEGIN IMMEDIATE) --
+    # means no other write can interleave between a transaction's checks and its updates.
+    @contextmanager
+    def transaction(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    # -- Row lock clause for a SELECT inside transaction(); nothing to add under SQLite's database-wide lock. --
+    # Writers that lock a spot and its session take the spot first, so they never wait on each other in a cycle.
+    def lock(self, *aliases):
+        return ''
+
+    # -- (SQL, parameters) for `column IN (values)` --
+    def in_list(self, column, values):
+        return f"{column} IN ({','.join('?' * len(values))})", list(values)
+
+    # -- `sql` in the driver's own placeholder style, for connections that do not come from our pool --
+    def sql(self, text):
+        return text
+
+    def explain(self, conn, sql, parameters):
+        return [row[-1] for row in sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+
+    # -- Makes the next AUTOINCREMENT key of `table` greater than `key`; never moves it back --
+    def advance_keys(self, conn, table, column, key):
+        if not key:
+            return
+        with self.transaction(conn):
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?", [key, table, key])
+            conn.execute("""
+                INSERT INTO sqlite_sequence(name, seq)
+                SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+            """, [table, key, table])
+
+    # -- Applies migrations/NNNN_name.sql in order. The applied version lives in PRAGMA user_version, and each --
+    # migration runs in its own BEGIN IMMEDIATE transaction, so concurrent workers starting up apply it once.
+    def run_migrations(self, conn, migrations_dir):
+        for version, filename in migration_files(migrations_dir):
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+
+            with open(os.path.join(migrations_dir, filename)) as f:
+                script = f.read()
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have applied it while we waited for the lock
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+
+                statement = ''
+                for line in script.splitlines(keepends=True):
+                    statement += line
+                    if sqlite3.complete_statement(statement):
+                        conn.execute(statement)
+                        statement = ''
+
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Migrations: applied {filename}")
+
+
+# -- [(version, filename)] for the NNNN_name.sql files in a directory, in version order --
+def migration_files(migrations_dir):
+    return sorted(
+        (int(filename.split('_', 1)[0]), filename)
+        for filename in os.listdir(migrations_dir) if filename.endswith('.sql')
+    )
+
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# --- REPOSITORIES  ---
+# ----------------------------------------------------------------------------------------------------------------------
+
+# -- Every method takes the connection to run on, so callers decide what shares a transaction --
+class Repository:
+    def __init__(self, storage):
+        self.storage = storage
+
+
+class SpotRepository(Repository):
+    # -- Every spot for the occupancy index, in map order --
+    def for_map(self, conn):
+        return conn.execute("""
+            SELECT s.s_spotskey, s.s_num, s.s_latitude, s.s_longitude, s.s_status, s.s_isactive,
+                   s.s_zonekey, s.s_lotkey
+            FROM spots s
+            JOIN zone z ON s.s_zonekey = z.z_zonekey
+            JOIN lot l ON s.s_lotkey = l.l_lotkey
+            ORDER BY l.l_name, s.s_num
+        """).fetchall()
+
+    # -- A spot with its zone, lot and zone activation, locked until the claim transaction ends --
+    def for_claim(self, conn, spot_num):
+        return conn.execute(f"""
+            SELECT s.s_spotskey, s.s_status, s.s_isactive, s.s_zonekey, s.s_lotkey, z.z_type, l.l_name, za.za_isactive
+            FROM spots s
+            JOIN zone z ON s.s_zonekey = z.z_zonekey
+            JOIN lot l ON s.s_lotkey = l.l_lotkey
+            LEFT JOIN zoneAssignment za ON za.za_lotkey = s.s_lotkey AND za.za_zonekey = s.s_zonekey
+            WHERE s.s_num = ?{self.storage.lock('s')}
+        """, [spot_num]).fetchone()
+
+    # -- Marks a spot occupied only if it is still free; False when another claim got there first --
+    def reserve(self, conn, spot_key):
+        if conn.execute("UPDATE spots SET s_status = 1 WHERE s_spotskey = ? AND s_status = 0",
+                        [spot_key]).rowcount == 0:
+            return False
+        self._log(conn, [spot_key])
+        return True
+
+    # -- {spot_key: status}. With `lock`, inside a transaction, the spots stay locked in key order until it ends, --
+    # so a claim cannot slip in between a caller's reads and its writes, and two writers locking several spots
+    # cannot deadlock each other
+    def statuses(self, conn, spot_keys, lock=False):
+        condition, params = self.storage.in_list('s_spotskey', spot_keys)
+        return {spot_key: 1 if status else 0 for spot_key, status in conn.execute(f"""
+            SELECT s_spotskey, s_status FROM spots WHERE {condition}
+            ORDER BY s_spotskey{self.storage.lock('spots') if lock else ''}
+        """, params).fetchall()}
+
+    def free(self, conn, *spot_keys):
+        conn.executemany("UPDATE spots SET s_status = 0 WHERE s_spotskey = ?", [[spot_key] for spot_key in spot_keys])
+        self._log(conn, spot_keys)
+
+    # -- changes: {spot_key: status} --
+    def set_statuses(self, conn, changes):
+        conn.executemany("UPDATE spots SET s_status = ? WHERE s_spotskey = ?",
+                         [[status, spot_key] for spot_key, status in changes.items()])
+        self._log(conn, changes)
+
+    # -- Moves every spot of a lot into a zone and activates it; returns the number of spots that changed --
+    def move_lot(self, conn, lot_key, zone_key):
+        moved = conn.execute("""
+            UPDATE spots SET s_zonekey = ?, s_isactive = 1
+            WHERE s_lotkey = ? AND (s_zonekey != ? OR s_isactive != 1)
+        """, [zone_key, lot_key, zone_key]).rowcount
+        if moved:
+            conn.execute("INSERT INTO spotChange(sc_spotkey, sc_at) SELECT s_spotskey, ? FROM spots WHERE s_lotkey = ?",
+                         [time.time(), lot_key])
+        return moved
+
+    # -- Records changed spots in spotChange, in the writer's transaction, for the other workers' indexes --
+    def _log(self, conn, spot_keys):
+        now = time.time()
+        conn.executemany("INSERT INTO spotChange(sc_spotkey, sc_at) VALUES(?, ?)",
+                         [[spot_key, now] for spot_key in spot_keys])
+
+    # -- Current status, activation and zone of the spots logged after `since` (epoch seconds) --
+    def changed_since(self, conn, since):
+        return conn.execute("""
+            SELECT s_spotskey, s_status, s_isactive, s_zonekey FROM spots
+            WHERE s_spotskey IN (SELECT sc_spotkey FROM spotChange WHERE sc_at > ?)
+        """, [since]).fetchall()
+
+
+# -- parkingHistory: a session is open while ph_departuretime is NULL --
+class SessionRepository(Repository):
+    def has_open(self, conn, vehicle_key):
+        return conn.execute("""
+            SELECT COUNT(*) FROM parkingHistory ph
+            WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
+        """, [vehicle_key]).fetchone()[0] > 0
+
+    def start(self, conn, vehicle_key, spot_key):
+        conn.execute("""
+            INSERT INTO parkingHistory(ph_vehicleskey, ph_spotskey, ph_arrivaltime, ph_departuretime)
+            VALUES(?, ?, ?, NULL)
+        """, [vehicle_key, spot_key, campus_timestamp()])
+
+    # -- (session, spot key, spot number, lot name) of a vehicle's open session, locked with its spot for closing --
+    def open_for_vehicle(self, conn, vehicle_key):
+        return conn.execute(f"""
+            SELECT ph.ph_parkinghistkey, ph.ph_spotskey, s.s_num, l.l_name
+            FROM parkingHistory ph
+            JOIN spots s ON ph.ph_spotskey = s.s_spotskey
+            JOIN lot l ON s.s_lotkey = l.l_lotkey
+            WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL{self.storage.lock('s', 'ph')}
+        """, [vehicle_key]).fetchone()
+
+    # -- (spot number, lot name, zone type, arrival) for the parking context --
+    def current_for_vehicle(self, conn, vehicle_key):
+        return conn.execute("""
+            SELECT s.s_num, l.l_name, z.z_type, ph.ph_arrivaltime
+            FROM parkingHistory ph
+            JOIN spots s ON ph.ph_spotskey = s.s_spotskey
+            JOIN lot l ON s.s_lotkey = l.l_lotkey
+            JOIN zone z ON s.s_zonekey = z.z_zonekey
+            WHERE ph.ph_vehicleskey = ? AND ph.ph_departuretime IS NULL
+        """, [vehicle_key]).fetchone()
+
+    # -- Ends open sessions now; sessions already closed are left as they are --
+    def close(self, conn, *hist_keys):
+        departure = campus_timestamp()
+        conn.executemany("""
+            UPDATE parkingHistory SET ph_departuretime = ?
+            WHERE ph_parkinghistkey = ? AND ph_departuretime IS NULL
+        """, [[departure, hist_key] for hist_key in hist_keys])
+
+    # -- Open sessions with their permit expiration and the permit category, zone and lot they are parked under; --
+    # optionally only one vehicle's, or only sessions that arrived at or after `arrived_since`
+    def open_with_permits(self, conn, vehicle_key=None, arrived_since=None):
+        sql = """
+            SELECT ph.ph_parkinghistkey, ph.ph_arrivaltime, p.p_expirationdate,
+                   pt.pt_category, s.s_zonekey, s.s_lotkey
+            FROM parkingHistory ph
+            JOIN permit p ON ph.ph_vehicleskey = p.p_vehicleskey
+            JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
+            JOIN spots s ON ph.ph_spotskey = s.s_spotskey
+            WHERE ph.ph_departuretime IS NULL
+        """
+        params = []
+        if vehicle_key is not None:
+            sql += " AND ph.ph_vehicleskey = ?"
+            params.append(vehicle_key)
+        if arrived_since is not None:
+            sql += " AND ph.ph_arrivaltime >= ?"
+            params.append(arrived_since)
+        return conn.execute(sql, params).fetchall()
+
+    # -- (session, spot key, spot number, owner) for those of `hist_keys` still open, locked with their spots --
+    # in spot order for closing
+    def open_by_keys(self, conn, hist_keys):
+        condition, params = self.storage.in_list('ph.ph_parkinghistkey', hist_keys)
+        return conn.execute(f"""
+            SELECT ph.ph_parkinghistkey, ph.ph_spotskey, s.s_num, v.v_userkey
+            FROM parkingHistory ph
+            JOIN spots s ON ph.ph_spotskey = s.s_spotskey
+            JOIN vehicles v ON ph.ph_vehicleskey = v.v_vehicleskey
+            WHERE {condition} AND ph.ph_departuretime IS NULL
+            ORDER BY ph.ph_spotskey{self.storage.lock('s', 'ph')}
+        """, params).fetchall()
+
+    # -- (session, spot key, owner, arrived after `since`) for the open sessions on the given spots, locked for --
+    # closing; callers lock the spots themselves first
+    def open_on_spots(self, conn, spot_keys, since):
+        condition, params = self.storage.in_list('ph.ph_spotskey', spot_keys)
+        return conn.execute(f"""
+            SELECT ph.ph_parkinghistkey, ph.ph_spotskey, v.v_userkey, ph.ph_arrivaltime >= ?
+            FROM parkingHistory ph
+            JOIN vehicles v ON ph.ph_vehicleskey = v.v_vehicleskey
+            WHERE {condition} AND ph.ph_departuretime IS NULL{self.storage.lock('ph')}
+        """, [campus_timestamp(since)] + params).fetchall()
+
+    # -- Whether the vehicle on one of the user's permits is parked right now --
+    def open_under_permit(self, conn, permit_key, user_key):
+        return conn.execute("""
+            SELECT COUNT(*) FROM parkingHistory ph
+            JOIN permit p ON ph.ph_vehicleskey = p.p_vehicleskey
+            WHERE p.p_permitkey = ? AND p.p_userkey = ? AND ph.ph_departuretime IS NULL
+        """, [permit_key, user_key]).fetchone()[0] > 0
+
+
+class PermitRepository(Repository):
+    # Fixed dates end with the academic year and the fall semester; the rest run from the moment of issue
+    EXPIRATIONS = {
+        'Yearly': '2026-05-19',
+        'Semester': '2025-12-23',
+        'Daily': timedelta(days=1),
+        'Hourly': timedelta(hours=1)
+    }
+
+    # -- (permit, vehicle, category, expiration) of the user's active permit, or None --
+    def active_for_user(self, conn, user_key):
+        return conn.execute("""
+            SELECT p.p_permitkey, p.p_vehicleskey, pt.pt_category, p.p_expirationdate
+            FROM permit p
+            JOIN permitType pt ON p.p_permittypekey = pt.pt_permittypekey
+            WHERE p.p_userkey = ? AND p.p_expirationdate >= ?
+        """, [user_key, campus_timestamp()]).fetchone()
+
+    # -- The user's active permits with their vehicle and type, for the permit page --
+    def list_active_for_user(self, conn, user_key):
+        return conn.execute("""
+            SELECT p.p_permitkey, v.v_plateno, v.v_maker, v.v_model, v.v_color,
+                   pt.pt_category, pt.pt_duration, p.p_permitnum,
+                   p.p_issuedate, p.p_expirationdate
+            FROM permit p
+            JOIN permitType pt ON pt.pt_permittypekey = p.p_permittypekey
+            JOIN vehicles v ON p.p_vehicleskey = v.v_vehicleskey
+            WHERE p.p_userkey = ? AND p.p_expirationdate >= ?
+        """, [user_key, campus_timestamp()]).fetchall()
+
+    def vehicle_has_active(self, conn, vehicle_key):
+        return conn.execute("""
+            SELECT COUNT(*) FROM permit
+            WHERE p_vehicleskey = ? AND p_expirationdate >= ?
+        """, [vehicle_key, campus_timestamp()]).fetchone()[0] > 0
+
+    # -- Deletes one of the user's permits; False when the permit is not theirs --
+    def delete(self, conn, permit_key, user_key):
+        return conn.execute("DELETE FROM permit WHERE p_permitkey = ? AND p_userkey = ?",
+                            [permit_key, user_key]).rowcount > 0
+
+    # -- (key, category, duration) for the application form, by category then duration --
+    def types(self, conn):
+        return conn.execute("""
+            SELECT pt_permittypekey, pt_category, pt_duration
+            FROM permitType
+            ORDER BY
+                CASE pt_category
+                    WHEN 'Faculty' THEN 1
+                    WHEN 'On-Campus Student' THEN 2
+                    WHEN 'Off-Campus Student' THEN 3
+                    WHEN 'Guest' THEN 4
+                END,
+                CASE pt_duration
+                    WHEN 'Yearly' THEN 1
+                    WHEN 'Semester' THEN 2
+                    WHEN 'Daily' THEN 3
+                    WHEN 'Hourly' THEN 4
+                END
+        """).fetchall()
+
+    # -- Issues a permit of the given type; returns its key, or None for an unknown type. --
+    # The key comes from the database and the PRMnnnn number is derived from it in the same transaction.
+    def issue(self, conn, user_key, vehicle_key, permit_type_key):
+        row = conn.execute("SELECT pt_duration FROM permitType WHERE pt_permittypekey = ?",
+                           [permit_type_key]).fetchone()
+        expiration = self.EXPIRATIONS.get(row[0]) if row else None
+        if expiration is None:
+            return None
+
+        issued = campus_now()
+        if isinstance(expiration, timedelta):
+            expiration = campus_timestamp(issued + expiration)
+        permit_key = conn.execute("""
+            INSERT INTO permit(p_userkey, p_vehicleskey, p_permittypekey, p_permitnum, p_issuedate, p_expirationdate)
+            VALUES(?, ?, ?, '', ?, ?)
+            RETURNING p_permitkey
+        """, [user_key, vehicle_key, permit_type_key, campus_timestamp(issued), expiration]).fetchone()[0]
+        conn.execute("UPDATE permit SET p_permitnum = ? WHERE p_permitkey = ?", [f'PRM{permit_key:04d}', permit_key])
+        return permit_key
+
+
+class VehicleRepository(Repository):
+    # -- The user's vehicles, newest first --
+    def for_user(self, conn, user_key):
+        return conn.execute("""
+            SELECT v_vehicleskey, v_plateno, v_platestate, v_maker, v_model, v_color
+            FROM vehicles WHERE v_userkey = ?
+            ORDER BY v_vehicleskey DESC
+        """, [user_key]).fetchall()
+
+    # -- Owner of a plate, or None when it is not registered --
+    def plate_owner(self, conn, plate_no):
+        row = conn.execute("SELECT v_userkey FROM vehicles WHERE v_plateno = ?", [plate_no]).fetchone()
+        return row[0] if row else None
+
+    # -- Returns the new vehicle's key; raises IntegrityError if the plate was registered meanwhile --
+    def register(self, conn, user_key, plate_no, plate_state, maker, model, color):
+        return conn.execute("""
+            INSERT INTO vehicles(v_userkey, v_plateno, v_platestate, v_maker, v_model, v_color)
+            VALUES(?, ?, ?, ?, ?, ?)
+            RETURNING v_vehicleskey
+        """, [user_key, plate_no, plate_state, maker, model, color]).fetchone()[0]
+
+    # -- Deletes one of the user's vehicles; False when the vehicle is not theirs --
+    def delete(self, conn, vehicle_key, user_key):
+        return conn.execute("DELETE FROM vehicles WHERE v_vehicleskey = ? AND v_userkey = ?",
+                            [vehicle_key, user_key]).rowcount > 0
+
+    # -- Serializes claims and unclaims by the same vehicle where the engine locks rows, not the database --
+    def lock(self, conn, vehicle_key):
+        clause = self.storage.lock('vehicles')
+        if clause:
+            conn.execute(f"SELECT v_vehicleskey FROM vehicles WHERE v_vehicleskey = ?{clause}", [vehicle_key])
+
+
+# -- zone, lot and the zoneAssignment junction between them --
+class ZoneRepository(Repository):
+    def types(self, conn):
+        return dict(conn.execute("SELECT z_zonekey, z_type FROM zone").fetchall())
+
+    # -- [(lot key, name, capacity)] --
+    def lots(self, conn):
+        return conn.execute("SELECT l_lotkey, l_name, l_capacity FROM lot").fetchall()
+
+    # -- Every lot with its zones and their activation, lots without zones included --
+    def assignments(self, conn):
+        return conn.execute("""
+            SELECT l.l_lotkey, l.l_name, z.z_zonekey, z.z_type, za.za_isactive
+            FROM lot l
+            LEFT JOIN zoneAssignment za ON l.l_lotkey = za.za_lotkey
+            LEFT JOIN zone z ON za.za_zonekey = z.z_zonekey
+            ORDER BY l.l_lotkey, z.z_zonekey
+        """).fetchall()
+
+    # -- Activates one zone of a lot and deactivates `other_zones`, skipping rows already in that state --
+    def activate(self, conn, lot_key, zone_key, other_zones):
+        conn.execute("""
+            UPDATE zoneAssignment SET za_isactive = 1
+            WHERE za_lotkey = ? AND za_zonekey = ? AND za_isactive != 1
+        """, [lot_key, zone_key])
+
+        if other_zones:
+            condition, params = self.storage.in_list('za_zonekey', other_zones)
+            conn.execute(f"""
+                UPDATE zoneAssignment SET za_isactive = 0
+                WHERE za_lotkey = ? AND {condition} AND za_isactive != 0
+            """, [lot_key] + params)
+
+    # -- (lot name, zone type), or None when either key is unknown --
+    def names(self, conn, lot_key, zone_key):
+        return conn.execute("""
+            SELECT l.l_name, z.z_type FROM lot l, zone z WHERE l.l_lotkey = ? AND z.z_zonekey = ?
+        """, [lot_key, zone_key]).fetchone()